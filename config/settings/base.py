@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/1.11/ref/settings/
 from ipaddress import IPv4Network
 from os import environ as os_environ
 from pathlib import Path
+from tempfile import gettempdir
 
 import environ
 import sentry_sdk
@@ -200,7 +201,15 @@ ADMIN_API_ALLOWED_SUBNETS = [
 GITHUB_HOOK_SECRET = bytes(env("GITHUB_HOOK_SECRET", default=""), "utf-8")
 # The username of the user that GitHub webhook actions should authenticate as:
 GITHUB_USER_NAME = env("GITHUB_USER_NAME", default="GitHub user")
+# Days to keep processed webhook deliveries around, to ignore redeliveries and to
+# allow replaying them:
+WEBHOOK_DELIVERY_RETENTION_DAYS = env.int("WEBHOOK_DELIVERY_RETENTION_DAYS", default=7)
 GITHUB_APP_ID = env.int("GITHUB_APP_ID", default=0)
+# How long refreshed scratch org access tokens are reused for. Keep this below
+# the session timeout of the orgs:
+SF_ACCESS_TOKEN_CACHE_TIMEOUT = env.int(
+    "SF_ACCESS_TOKEN_CACHE_TIMEOUT", default=60 * 15  # 15 minutes
+)
 # Ugly hack to fix https://github.com/moby/moby/issues/12997
 DOCKER_GITHUB_APP_KEY = env("DOCKER_GITHUB_APP_KEY", default="").replace("\\n", "\n")
 GITHUB_APP_KEY = bytes(env("GITHUB_APP_KEY", default=DOCKER_GITHUB_APP_KEY), "utf-8")
@@ -269,6 +278,11 @@ else:
 
 DAYS_BEFORE_ORG_EXPIRY_TO_ALERT = env.int("DAYS_BEFORE_ORG_EXPIRY_TO_ALERT", default=3)
 ORG_RECHECK_MINUTES = env.int("ORG_RECHECK_MINUTES", default=5)
+# How many Dev Hubs' orgs a batched unsaved changes refresh works on at once:
+UNSAVED_CHANGES_MAX_WORKERS = env.int("UNSAVED_CHANGES_MAX_WORKERS", default=4)
+# How many orgs one such refresh job takes on, so that it finishes well within
+# REDIS_JOB_TIMEOUT:
+UNSAVED_CHANGES_BATCH_SIZE = env.int("UNSAVED_CHANGES_BATCH_SIZE", default=40)
 
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/1.11/howto/static-files/
@@ -487,6 +501,25 @@ API_PAGE_SIZE = env.int("API_PAGE_SIZE", default=50)
 
 GITHUB_ISSUE_LIMIT = env.int("GITHUB_ISSUE_LIMIT", default=1000)
 
+# Seconds before a project's branch index is rebuilt from GitHub, to pick up any
+# branch events that webhooks missed:
+GITHUB_BRANCH_INDEX_MAX_AGE = env.int(
+    "GITHUB_BRANCH_INDEX_MAX_AGE", default=60 * 60 * 24
+)
+
+# On-disk cache of extracted repository zipballs, keyed by commit SHA. Set the
+# directory to an empty string to disable the cache.
+REPO_SNAPSHOT_CACHE_DIR = env(
+    "REPO_SNAPSHOT_CACHE_DIR", default=str(Path(gettempdir()) / "metecho-snapshots")
+)
+REPO_SNAPSHOT_CACHE_MAX_BYTES = env.int(
+    "REPO_SNAPSHOT_CACHE_MAX_BYTES", default=2 * 1024**3
+)
+# Seconds since a snapshot was last used before it is evicted:
+REPO_SNAPSHOT_CACHE_MAX_AGE = env.int(
+    "REPO_SNAPSHOT_CACHE_MAX_AGE", default=60 * 60 * 6
+)
+
 # New feature branch prefix:
 BRANCH_PREFIX = env("BRANCH_PREFIX", default=None)
 
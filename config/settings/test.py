@@ -5,3 +5,4 @@ CHANNEL_LAYERS = {
 }
 
 DEVHUB_USERNAME = None
+REPO_SNAPSHOT_CACHE_DIR = ""
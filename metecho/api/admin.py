@@ -14,6 +14,7 @@ from . import gh
 from .models import (
     Epic,
     EpicSlug,
+    GitHubBranch,
     GitHubCollaboration,
     GitHubIssue,
     GitHubOrganization,
@@ -22,10 +23,12 @@ from .models import (
     ProjectDependency,
     ProjectSlug,
     ScratchOrg,
+    ScratchOrgPool,
     SiteProfile,
     Task,
     TaskSlug,
     User,
+    WebhookDelivery,
 )
 
 
@@ -177,6 +180,21 @@ class GitHubIssueAdmin(admin.ModelAdmin):
     search_fields = ("number", "title")
 
 
+@admin.register(GitHubBranch)
+class GitHubBranchAdmin(admin.ModelAdmin):
+    list_display = ("name", "project", "latest_sha")
+    list_filter = ("project",)
+    list_select_related = ("project",)
+    search_fields = ("name",)
+
+
+@admin.register(WebhookDelivery)
+class WebhookDeliveryAdmin(admin.ModelAdmin):
+    date_hierarchy = "received_at"
+    list_display = ("__str__", "event", "received_at", "processed_at")
+    list_filter = ("event",)
+
+
 @admin.register(Epic)
 class EpicAdmin(admin.ModelAdmin):
     list_display = ("name", "status", "project", "created_at", "deleted_at")
@@ -250,6 +268,22 @@ class ScratchOrgAdmin(admin.ModelAdmin):
     formfield_overrides = {JSONField: {"widget": JSONWidget}}
 
 
+@admin.register(ScratchOrgPool)
+class ScratchOrgPoolAdmin(admin.ModelAdmin):
+    list_display = ("project", "org_config_name", "size", "builder")
+    search_fields = ("project__name", "org_config_name")
+    actions = ["replenish"]
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        obj.queue_replenish()
+
+    @admin.action(description=_("Replenish selected pools"))
+    def replenish(self, request, queryset):
+        for pool in queryset:
+            pool.queue_replenish()
+
+
 class SiteAdminForm(forms.ModelForm):
     class Meta:
         model = Site
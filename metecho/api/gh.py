@@ -3,24 +3,33 @@ GitHub utilities
 """
 
 import contextlib
+import copy
+import datetime
+import fcntl
+import hashlib
 import hmac
-import itertools
 import logging
 import os
 import pathlib
 import shutil
+import tempfile
+import time
 import zipfile
-from glob import glob
-from typing import Generator
+from contextvars import ContextVar
+from pathlib import PurePosixPath
+from typing import Generator, Iterable, Optional
 
-from cumulusci.utils import temporary_dir
+import cumulusci
+from cumulusci.utils import cd, temporary_dir
 from django.conf import settings
 from django.core.cache import cache
 from django.core.exceptions import MultipleObjectsReturned, ObjectDoesNotExist
 from github3 import GitHub, login, users
-from github3.exceptions import NotFoundError, UnprocessableEntity
+from github3.exceptions import NotFoundError, UnprocessableEntity, error_for
 from github3.repos.branch import Branch
+from requests.adapters import HTTPAdapter
 from requests.exceptions import HTTPError
+from requests.models import Response
 
 from .custom_cci_configs import MetechoUniversalConfig, ProjectConfig
 
@@ -29,7 +38,55 @@ logger = logging.getLogger(__name__)
 
 APP_ID = settings.GITHUB_APP_ID
 APP_KEY = settings.GITHUB_APP_KEY
-ZIP_FILE_NAME = "archive.zip"
+# Zipballs up to this size are buffered in memory, larger ones spill over to disk:
+ZIP_SPOOL_MAX_SIZE = 64 * 1024 * 1024
+# Files and directories recreated by a `mode="metadata"` checkout:
+METADATA_CHECKOUT_FILES = ("cumulusci.yml", "sfdx-project.json", "orgs/*.json")
+METADATA_CHECKOUT_DIRECTORIES = ("unpackaged/*/*",)
+PROJECT_CONFIG_CACHE_TIMEOUT = 60 * 60 * 24  # 1 day
+PROJECT_CONFIG_CACHE_SIZE = 64
+# What ProjectConfig._load_config sets, and a cached project config restores:
+PROJECT_CONFIG_ATTRS = (
+    "config",
+    "config_project",
+    "config_project_local",
+    "config_additional_yaml",
+)
+ETAG_CACHE_TIMEOUT = 60 * 60 * 24  # 1 day
+ETAG_CACHE_MAX_SIZE = 1024 * 1024
+ETAG_CACHE_HITS_KEY = "gh_etag_cache_hits"
+ETAG_CACHE_MISSES_KEY = "gh_etag_cache_misses"
+COLLABORATORS_QUERY = """
+query($owner: String!, $name: String!, $cursor: String) {
+  repository(owner: $owner, name: $name) {
+    collaborators(first: 100, after: $cursor) {
+      pageInfo { hasNextPage endCursor }
+      edges {
+        permission
+        node { databaseId login name avatarUrl }
+      }
+    }
+  }
+}
+"""
+# Comparisons of two SHAs never change:
+COMPARE_CACHE_TIMEOUT = 60 * 60 * 24 * 30  # 30 days
+# Branch pairs compared per GraphQL query, see compare_branches():
+COMPARE_BATCH_SIZE = 50
+# GraphQL reports a collaborator's role, REST the flags that role implies:
+REPO_PERMISSION_LEVELS = ("pull", "triage", "push", "maintain", "admin")
+REPO_ROLES = {"READ": 1, "TRIAGE": 2, "WRITE": 3, "MAINTAIN": 4, "ADMIN": 5}
+INSTALLATION_ID_CACHE_TIMEOUT = 60 * 60 * 24  # 1 day
+# Stop handing out installation tokens this long before GitHub expires them:
+INSTALLATION_TOKEN_EXPIRY_MARGIN = 60 * 5  # 5 minutes
+
+# Process-wide cache of merged project configs, see get_project_config():
+_project_configs = {}
+# Repositories and branch heads memoized for the current job, see job_cache().
+# A context variable, so threads a job starts don't share it unguarded:
+_job_cache: ContextVar[Optional[dict]] = ContextVar("job_cache", default=None)
+SNAPSHOT_SIZE_SUFFIX = ".size"
+SNAPSHOT_LOCK_SUFFIX = ".lock"
 
 
 class UnsafeZipfileError(Exception):
@@ -40,6 +97,10 @@ class NoGitHubTokenError(Exception):
     pass
 
 
+class GitHubGraphQLError(Exception):
+    pass
+
+
 # This currently is _not_ being used, so we don't want to include it for coverage
 def copy_branch_protection(source: Branch, target: Branch):  # pragma: nocover
     """
@@ -118,6 +179,100 @@ def copy_branch_protection(source: Branch, target: Branch):  # pragma: nocover
     return target._json(resp, 200)
 
 
+class ETagCacheAdapter(HTTPAdapter):
+    """
+    Transport adapter that makes GET requests conditional on the ETag of the
+    last response for the same URL and credentials. Bodies are stored in the
+    Django (Redis) cache and replayed when GitHub answers 304 Not Modified,
+    which does not count against the rate limit.
+    """
+
+    @staticmethod
+    def cache_key(request) -> str:
+        authorization = request.headers.get("Authorization", "")
+        if authorization.startswith("Bearer "):
+            # Requests as the app carry a freshly signed JWT every time, but
+            # all of them see the same data:
+            authorization = "app"
+        parts = (
+            request.url,
+            authorization,
+            request.headers.get("Accept", ""),
+        )
+        digest = hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+        return f"gh_etag_{digest}"
+
+    def send(self, request, stream=False, **kwargs):
+        if request.method != "GET" or stream:
+            return super().send(request, stream=stream, **kwargs)
+
+        key = self.cache_key(request)
+        cached = cache.get(key)
+        if cached is not None:
+            request.headers["If-None-Match"] = cached["etag"]
+        response = super().send(request, stream=stream, **kwargs)
+
+        if cached is not None and response.status_code == 304:
+            incr_counter(ETAG_CACHE_HITS_KEY)
+            return self.replay(cached, response)
+
+        incr_counter(ETAG_CACHE_MISSES_KEY)
+        etag = response.headers.get("ETag")
+        if (
+            response.status_code == 200
+            and etag
+            and len(response.content) <= ETAG_CACHE_MAX_SIZE
+        ):
+            cached = {
+                "etag": etag,
+                "headers": dict(response.headers),
+                "content": response.content,
+                "encoding": response.encoding,
+            }
+            cache.set(key, cached, timeout=ETAG_CACHE_TIMEOUT)
+        return response
+
+    @staticmethod
+    def replay(cached: dict, not_modified: Response) -> Response:
+        response = Response()
+        response.status_code = 200
+        response.reason = "OK"
+        response.headers.update(cached["headers"])
+        # Keep the fresh rate limit and date headers:
+        response.headers.update(not_modified.headers)
+        response._content = cached["content"]
+        response.encoding = cached["encoding"]
+        response.url = not_modified.url
+        response.request = not_modified.request
+        response.connection = not_modified.connection
+        response.elapsed = not_modified.elapsed
+        not_modified.close()
+        return response
+
+
+def incr_counter(key: str):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, timeout=None)
+
+
+def get_etag_cache_stats() -> dict:
+    return {
+        "hits": cache.get(ETAG_CACHE_HITS_KEY, 0),
+        "misses": cache.get(ETAG_CACHE_MISSES_KEY, 0),
+    }
+
+
+def reset_etag_cache_stats():
+    cache.delete_many([ETAG_CACHE_HITS_KEY, ETAG_CACHE_MISSES_KEY])
+
+
+def with_etag_cache(gh: GitHub) -> GitHub:
+    gh.session.mount("https://", ETagCacheAdapter())
+    return gh
+
+
 def gh_as_user(user):
     try:
         token = (
@@ -125,27 +280,63 @@ def gh_as_user(user):
         )
     except (ObjectDoesNotExist, MultipleObjectsReturned):
         raise NoGitHubTokenError
-    return login(token=token)
+    return with_etag_cache(login(token=token))
 
 
 def gh_as_app():
     gh = GitHub()
     gh.login_as_app(APP_KEY, APP_ID, expire_in=120)
+    return with_etag_cache(gh)
+
+
+def gh_as_installation(cache_key: str, get_installation) -> GitHub:
+    """
+    Log in as an app installation, sharing the installation id and access token
+    between processes through the cache. `get_installation` is called with an
+    app-authenticated GitHub instance only when the id is not cached yet.
+    """
+    id_key = f"gh_installation_id_{cache_key}"
+    installation_id = cache.get(id_key)
+    if installation_id is None:
+        installation_id = get_installation(gh_as_app()).id
+        cache.set(id_key, installation_id, timeout=INSTALLATION_ID_CACHE_TIMEOUT)
+
+    gh = with_etag_cache(GitHub())
+    token_key = f"gh_installation_token_{installation_id}"
+    token = cache.get(token_key)
+    if token is not None:
+        gh.session.app_installation_token_auth(token)
+        return gh
+
+    try:
+        gh.login_as_app_installation(APP_KEY, APP_ID, installation_id)
+    except NotFoundError:
+        # The app was probably reinstalled under a new id:
+        cache.delete(id_key)
+        raise
+    auth = gh.session.auth
+    timeout = (
+        auth.expires_at - datetime.datetime.now(datetime.timezone.utc)
+    ).total_seconds()
+    timeout -= INSTALLATION_TOKEN_EXPIRY_MARGIN
+    if timeout > 0:
+        token = {"token": auth.token, "expires_at": auth.expires_at_str}
+        cache.set(token_key, token, timeout=int(timeout))
     return gh
 
 
 def gh_as_repo(repo_owner: str, repo_name: str):
-    gh = gh_as_app()
-    installation = gh.app_installation_for_repository(repo_owner, repo_name)
-    gh.login_as_app_installation(APP_KEY, APP_ID, installation.id)
-    return gh
+    return gh_as_installation(
+        f"repo_{repo_owner}/{repo_name}".lower(),
+        lambda gh: gh.app_installation_for_repository(repo_owner, repo_name),
+    )
 
 
 def gh_as_org(orgname: str):
-    gh = gh_as_app()
-    installation = gh.app_installation_for_organization(orgname)
-    gh.login_as_app_installation(APP_KEY, APP_ID, installation.id)
-    return gh
+    return gh_as_installation(
+        f"org_{orgname}".lower(),
+        lambda gh: gh.app_installation_for_organization(orgname),
+    )
 
 
 def get_all_org_repos(user):
@@ -157,19 +348,204 @@ def is_safe_path(path):
     return not os.path.isabs(path) and ".." not in path.split(os.path.sep)
 
 
-def zip_file_is_safe(zip_file):
-    return all(is_safe_path(info.filename) for info in zip_file.infolist())
+@contextlib.contextmanager
+def job_cache():
+    """
+    Memoize get_repo_info() and get_branch_sha() until the context exits.
+
+    The RQ worker opens one of these around every job it performs, so a job
+    only fetches each repository and branch head once. Nested contexts share
+    the outermost cache. Threads started inside the context don't see the cache,
+    and fetch everything themselves.
+    """
+    if _job_cache.get() is not None:
+        yield
+        return
+    token = _job_cache.set({})
+    try:
+        yield
+    finally:
+        _job_cache.reset(token)
 
 
 def get_repo_info(user, repo_id=None, repo_owner=None, repo_name=None):
     if user is None and (repo_owner is None or repo_name is None):
         raise TypeError("If user=None, you must call with repo_owner and repo_name")
+    memo = _job_cache.get()
+    if memo is None:
+        return _get_repo_info(user, repo_id, repo_owner, repo_name)
+    key = (
+        "repo",
+        user.id if user else None,
+        repo_id,
+        repo_owner and repo_owner.lower(),
+        repo_name and repo_name.lower(),
+    )
+    if key not in memo:
+        memo[key] = _get_repo_info(user, repo_id, repo_owner, repo_name)
+    return memo[key]
+
+
+def _get_repo_info(user, repo_id, repo_owner, repo_name):
     gh = gh_as_user(user) if user else gh_as_repo(repo_owner, repo_name)
     if repo_id is None:
         return gh.repository(repo_owner, repo_name)
     return gh.repository_with_id(repo_id)
 
 
+def graphql(repo, query: str, **variables) -> dict:
+    """
+    Run a GraphQL query with the same credentials as `repo`.
+    """
+    resp = repo._post(
+        repo._build_url("graphql"), data={"query": query, "variables": variables}
+    )
+    result = repo._json(resp, 200)
+    if result.get("errors"):
+        raise GitHubGraphQLError(result["errors"])
+    return result["data"]
+
+
+def get_repo_collaborators(repo) -> Generator[dict, None, None]:
+    """
+    Yield the collaborators of a repository with their names and permissions,
+    a hundred per request, in the shape of REST collaborator objects.
+    """
+    cursor = None
+    while True:
+        data = graphql(
+            repo,
+            COLLABORATORS_QUERY,
+            owner=repo.owner.login,
+            name=repo.name,
+            cursor=cursor,
+        )
+        collaborators = data["repository"]["collaborators"]
+        for edge in collaborators["edges"]:
+            node = edge["node"]
+            role = REPO_ROLES.get(edge["permission"], 0)
+            yield {
+                "id": node["databaseId"],
+                "login": node["login"],
+                "name": node["name"] or "",
+                "avatar_url": node["avatarUrl"],
+                "permissions": {
+                    level: i < role for i, level in enumerate(REPO_PERMISSION_LEVELS)
+                },
+            }
+        if not collaborators["pageInfo"]["hasNextPage"]:
+            break
+        cursor = collaborators["pageInfo"]["endCursor"]
+
+
+def compare_cache_key(repo, base_sha: str, head_sha: str) -> str:
+    return f"gh_compare_{repo.id}_{base_sha}_{head_sha}"
+
+
+def compare_shas(repo, base_sha: str, head_sha: str) -> dict:
+    """
+    Compare two commits, returning `ahead_by` and `behind_by`. Results are cached,
+    as the comparison of two SHAs never changes.
+    """
+    key = compare_cache_key(repo, base_sha, head_sha)
+    comparison = cache.get(key)
+    if comparison is None:
+        result = repo.compare_commits(base_sha, head_sha)
+        comparison = {
+            "ahead_by": int(result.ahead_by),
+            "behind_by": int(result.behind_by),
+        }
+        cache.set(key, comparison, timeout=COMPARE_CACHE_TIMEOUT)
+    return comparison
+
+
+def get_branch_heads(repo, branches: Iterable[str]) -> dict:
+    """
+    Look up the head SHAs of many branches with as few GraphQL queries as
+    possible, leaving out branches that don't exist.
+    """
+    branches = list(dict.fromkeys(branches))
+    heads = {}
+    batch_size = COMPARE_BATCH_SIZE * 2
+    for start in range(0, len(branches), batch_size):
+        batch = branches[start : start + batch_size]
+        variables = {"owner": repo.owner.login, "name": repo.name}
+        declarations = ["$owner: String!", "$name: String!"]
+        fields = []
+        for i, branch in enumerate(batch):
+            variables[f"ref{i}"] = f"refs/heads/{branch}"
+            declarations.append(f"$ref{i}: String!")
+            fields.append(f"ref{i}: ref(qualifiedName: $ref{i}) {{ target {{ oid }} }}")
+        query = (
+            f"query({', '.join(declarations)}) {{ "
+            f"repository(owner: $owner, name: $name) {{ {' '.join(fields)} }} }}"
+        )
+        data = graphql(repo, query, **variables)["repository"]
+        for i, branch in enumerate(batch):
+            if data[f"ref{i}"]:
+                heads[branch] = data[f"ref{i}"]["target"]["oid"]
+    return heads
+
+
+def compare_branches(repo, pairs: Iterable[tuple]) -> dict:
+    """
+    Compare many `(base, head)` branch pairs with as few GraphQL queries as
+    possible. Returns `ahead_by` and `behind_by` keyed by pair, leaving out pairs
+    where either branch doesn't exist; callers should compare those on their own,
+    which fails like compare_shas() does.
+
+    The branch heads are looked up first, so that pairs already compared at the
+    same SHAs come from the compare_shas() cache, and new results go into it.
+    """
+    pairs = list(dict.fromkeys(pairs))
+    if not pairs:
+        return {}
+    heads = get_branch_heads(repo, (branch for pair in pairs for branch in pair))
+    keys = {
+        (base, head): compare_cache_key(repo, heads[base], heads[head])
+        for base, head in pairs
+        if base in heads and head in heads
+    }
+    cached = cache.get_many(keys.values())
+    comparisons = {pair: cached[key] for pair, key in keys.items() if key in cached}
+    uncached = [pair for pair in keys if pair not in comparisons]
+
+    for start in range(0, len(uncached), COMPARE_BATCH_SIZE):
+        batch = uncached[start : start + COMPARE_BATCH_SIZE]
+        variables = {"owner": repo.owner.login, "name": repo.name}
+        declarations = ["$owner: String!", "$name: String!"]
+        fields = []
+        for i, (base, head) in enumerate(batch):
+            variables[f"base{i}"] = f"refs/heads/{base}"
+            variables[f"head{i}"] = f"refs/heads/{head}"
+            declarations += [f"$base{i}: String!", f"$head{i}: String!"]
+            fields += [
+                f"base{i}: ref(qualifiedName: $base{i}) {{ target {{ oid }} "
+                f"compare(headRef: $head{i}) {{ aheadBy behindBy }} }}",
+                f"head{i}: ref(qualifiedName: $head{i}) {{ target {{ oid }} }}",
+            ]
+        query = (
+            f"query({', '.join(declarations)}) {{ "
+            f"repository(owner: $owner, name: $name) {{ {' '.join(fields)} }} }}"
+        )
+        data = graphql(repo, query, **variables)["repository"]
+        for i, pair in enumerate(batch):
+            base_ref, head_ref = data[f"base{i}"], data[f"head{i}"]
+            if not (base_ref and head_ref and base_ref["compare"]):
+                # Deleted since we looked up the heads
+                continue
+            comparison = {
+                "ahead_by": base_ref["compare"]["aheadBy"],
+                "behind_by": base_ref["compare"]["behindBy"],
+            }
+            key = compare_cache_key(
+                repo, base_ref["target"]["oid"], head_ref["target"]["oid"]
+            )
+            cache.set(key, comparison, timeout=COMPARE_CACHE_TIMEOUT)
+            comparisons[pair] = comparison
+    return comparisons
+
+
 def get_cached_user(gh: GitHub, username: str) -> users.User:
     """
     Get a GitHub user by username. Results are cached to stay under API limits.
@@ -184,16 +560,24 @@ def get_cached_user(gh: GitHub, username: str) -> users.User:
     return user
 
 
-def get_zip_file(repo, commit_ish):
-    success = repo.archive("zipball", path=ZIP_FILE_NAME, ref=commit_ish)
-    if not success:  # pragma: no cover
-        message = (
-            "Cannot download zipfile. "
-            "This may be caused by networking issues on the Metecho Server. "
-            f"Please report this to the Metecho Admins. ({repo} : {commit_ish})"
-        )
-        raise HTTPError(message)
-    return zipfile.ZipFile(ZIP_FILE_NAME)
+@contextlib.contextmanager
+def get_zip_file(repo, commit_ish) -> Generator[zipfile.ZipFile, None, None]:
+    """
+    Stream the zipball of `repo` at `commit_ish` into a spooled buffer, so it
+    only touches the disk if it's too large to keep in memory.
+    """
+    with tempfile.SpooledTemporaryFile(max_size=ZIP_SPOOL_MAX_SIZE) as buffer:
+        success = repo.archive("zipball", path=buffer, ref=commit_ish)
+        if not success:  # pragma: no cover
+            message = (
+                "Cannot download zipfile. "
+                "This may be caused by networking issues on the Metecho Server. "
+                f"Please report this to the Metecho Admins. ({repo} : {commit_ish})"
+            )
+            raise HTTPError(message)
+        buffer.seek(0)
+        with zipfile.ZipFile(buffer) as zip_file:
+            yield zip_file
 
 
 def log_unsafe_zipfile_error(repo_url, commit_ish):
@@ -205,20 +589,237 @@ def log_unsafe_zipfile_error(repo_url, commit_ish):
     logger.error(f"Malformed or malicious zip file from {url}.")
 
 
-def extract_zip_file(zip_file, owner, repo_name):
-    zip_file.extractall()
-    # We know that the zipball contains a root directory named something
-    # like this by GitHub's convention. If that ever breaks, this will
-    # break:
-    zipball_root = glob(f"{owner}-{repo_name}-*")[0]
-    # It's not unlikely that the zipball root contains a directory with
-    # the same name, so we pre-emptively rename it to probably avoid
-    # collisions:
-    shutil.move(zipball_root, "zipball_root")
-    for path in itertools.chain(glob("zipball_root/*"), glob("zipball_root/.*")):
-        shutil.move(path, ".")
-    shutil.rmtree("zipball_root")
-    os.remove(ZIP_FILE_NAME)
+def extract_zip_file(zip_file):
+    """
+    Extract a GitHub zipball into the current working directory.
+
+    By GitHub's convention, every member of the zipball lives under a root
+    directory named like `owner-repo-sha/`. We strip that prefix as we go, so
+    each member is written straight to its final path.
+    """
+    for info in zip_file.infolist():
+        _, _, path = info.filename.partition("/")
+        if not path:
+            continue
+        if not is_safe_path(path):
+            raise UnsafeZipfileError(info.filename)
+        if info.is_dir():
+            os.makedirs(path, exist_ok=True)
+            continue
+        parent = os.path.dirname(path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        with zip_file.open(info) as source, open(path, "wb") as target:
+            shutil.copyfileobj(source, target)
+
+
+def get_commit_sha(repo, commit_ish: str) -> str:
+    """
+    Resolve a branch name, tag or SHA prefix to a full commit SHA. Asks GitHub for
+    the bare SHA so we don't download the full commit (and its diff) just for this.
+    """
+    url = repo._build_url("commits", commit_ish, base_url=repo._api)
+    resp = repo._get(url, headers={"Accept": "application/vnd.github.sha"})
+    if resp.status_code != 200:
+        raise error_for(resp)
+    return resp.text.strip()
+
+
+def download_and_extract(repo, commit_ish):
+    """
+    Download the zipball of `repo` at `commit_ish` and extract it into the current
+    working directory.
+    """
+    with get_zip_file(repo, commit_ish) as zip_file:
+        try:
+            extract_zip_file(zip_file)
+        except UnsafeZipfileError:
+            log_unsafe_zipfile_error(repo.html_url, commit_ish)
+            raise
+
+
+def get_snapshot_root() -> Optional[pathlib.Path]:
+    """
+    Return the directory holding the repository snapshot cache, or None if the
+    cache is disabled.
+    """
+    if not settings.REPO_SNAPSHOT_CACHE_DIR:
+        return None
+    root = pathlib.Path(settings.REPO_SNAPSHOT_CACHE_DIR)
+    root.mkdir(parents=True, exist_ok=True)
+    return root
+
+
+@contextlib.contextmanager
+def snapshot_lock(root: pathlib.Path, sha: str, *, exclusive=False):
+    """
+    Lock the snapshot of `sha` in the cache at `root`: shared while a checkout
+    reads it, exclusive while pruning deletes it. Yields whether the lock was
+    taken; only exclusive locks don't wait for it, and yield False instead.
+
+    Pruning removes the lock file along with the snapshot, so a lock taken on a
+    file that is no longer at its path is dropped and taken again on the new one.
+    """
+    path = root / f"{sha}{SNAPSHOT_LOCK_SUFFIX}"
+    while True:
+        with open(path, "a") as lock_file:
+            try:
+                fcntl.flock(
+                    lock_file,
+                    fcntl.LOCK_EX | fcntl.LOCK_NB if exclusive else fcntl.LOCK_SH,
+                )
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                current = os.stat(path).st_ino == os.fstat(lock_file.fileno()).st_ino
+            except FileNotFoundError:
+                current = False
+            if not current:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+                continue
+            try:
+                yield True
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+            return
+
+
+def get_repo_snapshot(repo, sha: str, *, root: pathlib.Path) -> pathlib.Path:
+    """
+    Return the path to an extracted copy of `repo` at commit `sha`, downloading
+    it into the snapshot cache first if needed.
+
+    Each snapshot lives in `root/<sha>/`, next to a `root/<sha>.size` file that
+    holds its size in bytes. The modification time of the `.size` file records
+    when the snapshot was last used, and drives eviction. Callers should hold
+    `snapshot_lock` for `sha` for as long as they read the snapshot.
+    """
+    snapshot = root / sha
+    size_file = root / f"{sha}{SNAPSHOT_SIZE_SUFFIX}"
+    if size_file.exists() and snapshot.is_dir():
+        size_file.touch()
+        return snapshot
+
+    # Extract into a staging directory and rename it into place, so that
+    # concurrent workers never see a partially-extracted snapshot:
+    staging = pathlib.Path(tempfile.mkdtemp(dir=root, prefix=f".{sha}-"))
+    try:
+        with cd(staging):
+            download_and_extract(repo, sha)
+        size = sum(
+            path.stat().st_size
+            for path in staging.rglob("*")
+            if path.is_file() and not path.is_symlink()
+        )
+        try:
+            staging.rename(snapshot)
+        except OSError:
+            # Another worker stored the same snapshot before we did
+            pass
+        size_file.write_text(str(size))
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+    prune_snapshot_cache(root, keep=sha)
+    return snapshot
+
+
+def prune_snapshot_cache(root: pathlib.Path, *, keep: str = None):
+    """
+    Evict snapshots that haven't been used within REPO_SNAPSHOT_CACHE_MAX_AGE,
+    then least-recently-used snapshots until the cache fits within
+    REPO_SNAPSHOT_CACHE_MAX_BYTES. Snapshots that a checkout is reading are
+    skipped.
+    """
+    entries = []
+    for size_file in root.glob(f"*{SNAPSHOT_SIZE_SUFFIX}"):
+        sha = size_file.name[: -len(SNAPSHOT_SIZE_SUFFIX)]
+        if sha == keep:
+            continue
+        try:
+            entries.append((size_file.stat().st_mtime, int(size_file.read_text()), sha))
+        except (OSError, ValueError):
+            continue
+
+    total = sum(size for _, size, _ in entries)
+    oldest_allowed = time.time() - settings.REPO_SNAPSHOT_CACHE_MAX_AGE
+    for last_used, size, sha in sorted(entries):
+        if (
+            total <= settings.REPO_SNAPSHOT_CACHE_MAX_BYTES
+            and last_used >= oldest_allowed
+        ):
+            break
+        with snapshot_lock(root, sha, exclusive=True) as locked:
+            if not locked:
+                continue
+            # Move the tree out of the way first, so that a checkout waiting
+            # for the lock finds no snapshot rather than a half-deleted one:
+            tombstone = root / f".{sha}-deleted-{time.time_ns()}"
+            with contextlib.suppress(OSError):
+                (root / sha).rename(tombstone)
+            (root / f"{sha}{SNAPSHOT_SIZE_SUFFIX}").unlink(missing_ok=True)
+            (root / f"{sha}{SNAPSHOT_LOCK_SUFFIX}").unlink(missing_ok=True)
+        shutil.rmtree(tombstone, ignore_errors=True)
+        total -= size
+
+
+def path_matches(path: str, patterns: Iterable[str]) -> bool:
+    """
+    Whether a repository path matches one of the glob `patterns`, where `*` never
+    matches across directories.
+    """
+    path = PurePosixPath(path)
+    return any(
+        len(path.parts) == len(PurePosixPath(pattern).parts) and path.match(pattern)
+        for pattern in patterns
+    )
+
+
+def download_metadata(repo, commit_ish) -> bool:
+    """
+    Recreate only the configuration files of `repo` at `commit_ish` in the current
+    working directory, plus the directory skeleton under `unpackaged/`. Lists the
+    whole tree with a single Git Trees API call, then fetches just the matching
+    blobs.
+
+    Returns False if GitHub truncated the tree listing, in which case callers
+    should fall back to a full checkout.
+    """
+    tree = repo.tree(commit_ish, recursive=True)
+    if tree.as_dict().get("truncated"):
+        logger.warning(f"Tree for {repo}#{commit_ish} is truncated")
+        return False
+
+    for entry in tree.tree or ():
+        if entry.type == "tree" and path_matches(
+            entry.path, METADATA_CHECKOUT_DIRECTORIES
+        ):
+            os.makedirs(entry.path, exist_ok=True)
+        elif entry.type == "blob" and path_matches(entry.path, METADATA_CHECKOUT_FILES):
+            parent = os.path.dirname(entry.path)
+            if parent:
+                os.makedirs(parent, exist_ok=True)
+            blob = repo.blob(entry.sha)
+            pathlib.Path(entry.path).write_text(blob.decode_content())
+    return True
+
+
+def checkout_full(repo, commit_ish, repo_root):
+    """
+    Recreate the whole of `repo` at `commit_ish` in `repo_root`, going through the
+    snapshot cache when it is enabled.
+    """
+    snapshot_root = get_snapshot_root()
+    if snapshot_root:
+        sha = get_commit_sha(repo, commit_ish)
+        with snapshot_lock(snapshot_root, sha):
+            snapshot = get_repo_snapshot(repo, sha, root=snapshot_root)
+            # Copy rather than hardlink: jobs write to files in the checkout
+            # (e.g. cumulusci.yml), which would corrupt the cached tree.
+            shutil.copytree(snapshot, repo_root, symlinks=True, dirs_exist_ok=True)
+    else:
+        download_and_extract(repo, commit_ish)
 
 
 @contextlib.contextmanager
@@ -228,7 +829,16 @@ def local_github_checkout(
     commit_ish=None,
     repo_owner=None,
     repo_name=None,
+    mode="full",
 ) -> Generator[str, None, None]:
+    """
+    Yields a temporary directory containing the repository at `commit_ish`.
+
+    With `mode="metadata"` only the configuration files listed in
+    METADATA_CHECKOUT_FILES and the directories in METADATA_CHECKOUT_DIRECTORIES
+    are present, which is enough to build a ProjectConfig and compute the valid
+    target directories.
+    """
     with temporary_dir() as repo_root:
         # pretend it's a git clone to satisfy cci
         os.mkdir(".git")
@@ -240,38 +850,75 @@ def local_github_checkout(
             commit_ish = repo.default_branch
         assert commit_ish, "Default branch should be supplied"
 
-        zip_file = get_zip_file(repo, commit_ish)
+        # Because subsequent operations require certain things to be
+        # present in the filesystem at cwd, things that are in the
+        # repo (we hope):
+        if mode != "metadata" or not download_metadata(repo, commit_ish):
+            checkout_full(repo, commit_ish, repo_root)
+
+        # Ensure the CumulusCI config is always up to date with the default branch
+        # (even if the current branch has an old version)
+        try:
+            text = repo.file_contents(
+                "cumulusci.yml", ref=repo.default_branch
+            ).decoded.decode("utf-8")
+            pathlib.Path("cumulusci.yml").write_text(text)
+        except (NotFoundError, IOError) as error:
+            raise Exception(
+                "Failed to copy cumulusci.yml from default branch"
+            ) from error
+
+        yield repo_root
 
-        if not zip_file_is_safe(zip_file):
-            log_unsafe_zipfile_error(repo.html_url, commit_ish)
-            raise UnsafeZipfileError
-        else:
-            # Because subsequent operations require certain things to be
-            # present in the filesystem at cwd, things that are in the
-            # repo (we hope):
-            extract_zip_file(zip_file, repo.owner.login, repo.name)
-
-            # Ensure the CumulusCI config is always up to date with the default branch
-            # (even if the current branch has an old version)
-            try:
-                text = repo.file_contents(
-                    "cumulusci.yml", ref=repo.default_branch
-                ).decoded.decode("utf-8")
-                pathlib.Path("cumulusci.yml").write_text(text)
-            except (NotFoundError, IOError) as error:
-                raise Exception(
-                    "Failed to copy cumulusci.yml from default branch"
-                ) from error
 
-            yield repo_root
+def git_blob_sha(content: bytes) -> str:
+    """
+    Compute the SHA that git (and therefore GitHub) assigns to a blob.
+    """
+    return hashlib.sha1(b"blob %d\0" % len(content) + content).hexdigest()
 
 
 def get_project_config(**kwargs):
     """
     Expects to be in a local_github_checkout.
+
+    Parsing and merging the YAML is relatively slow, so the merged config and
+    the configs it was merged from are cached both per process and in Redis,
+    keyed by the CumulusCI version and the blob SHA of cumulusci.yml.
     """
     universal_config = MetechoUniversalConfig()
-    return ProjectConfig(universal_config, **kwargs)
+    try:
+        sha = git_blob_sha(pathlib.Path("cumulusci.yml").read_bytes())
+    except OSError:
+        return ProjectConfig(universal_config, **kwargs)
+
+    key = f"project_config_v2_{cumulusci.__version__}_{sha}"
+    config = _project_configs.get(key)
+    if config is None:
+        config = cache.get(key)
+    if config is None:
+        project_config = ProjectConfig(universal_config, **kwargs)
+        config = {
+            attr: copy.deepcopy(getattr(project_config, attr))
+            for attr in PROJECT_CONFIG_ATTRS
+        }
+        cache.set(key, config, timeout=PROJECT_CONFIG_CACHE_TIMEOUT)
+    else:
+        # Passing the merged config skips _load_config, so restore the rest of
+        # what it would have set too
+        project_config = ProjectConfig(
+            universal_config, config=copy.deepcopy(config["config"]), **kwargs
+        )
+        for attr in PROJECT_CONFIG_ATTRS[1:]:
+            setattr(project_config, attr, copy.deepcopy(config[attr]))
+
+    if (
+        key not in _project_configs
+        and len(_project_configs) >= PROJECT_CONFIG_CACHE_SIZE
+    ):
+        _project_configs.pop(next(iter(_project_configs)))
+    _project_configs[key] = config
+    return project_config
 
 
 def get_cumulus_prefix(**kwargs):
@@ -290,6 +937,28 @@ def get_source_format(**kwargs):
     return project_config.project__source_format
 
 
+def get_branch_sha(repository, branch_name: str) -> str:
+    """
+    Get the SHA at the head of a branch, memoized inside a job_cache().
+    """
+    memo = _job_cache.get()
+    if memo is None:
+        return repository.branch(branch_name).latest_sha()
+    key = ("branch", repository.id, branch_name)
+    if key not in memo:
+        memo[key] = repository.branch(branch_name).latest_sha()
+    return memo[key]
+
+
+def forget_branch_sha(repository, branch_name: str):
+    """
+    Drop a memoized branch head, e.g. after pushing a commit to that branch.
+    """
+    memo = _job_cache.get()
+    if memo is not None:
+        memo.pop(("branch", repository.id, branch_name), None)
+
+
 def try_to_make_branch(repository, *, new_branch, base_sha) -> str:
     branch_name = new_branch
     counter = 0
@@ -299,6 +968,9 @@ def try_to_make_branch(repository, *, new_branch, base_sha) -> str:
         branch_name = f"{new_branch[:max_length-len(suffix)]}{suffix}"
         try:
             repository.create_branch_ref(branch_name, base_sha)
+            memo = _job_cache.get()
+            if memo is not None:
+                memo["branch", repository.id, branch_name] = base_sha
             return branch_name
         except UnprocessableEntity as err:
             if err.msg == "Reference already exists":
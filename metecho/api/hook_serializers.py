@@ -4,7 +4,7 @@ from django.db.models.query_utils import Q
 from rest_framework import serializers
 from rest_framework.exceptions import NotFound
 
-from .models import Epic, Project, Task
+from .models import Epic, IssueStates, Project, Task
 
 logger = logging.getLogger(__name__)
 
@@ -109,22 +109,27 @@ class PrHookSerializer(HookSerializerMixin, serializers.Serializer):
                 instance.finalize_pr_closed(pr_number, originating_user_id=None)
 
 
+class HookSenderSerializer(serializers.Serializer):
+    login = serializers.CharField(required=False)
+    avatar_url = serializers.CharField(required=False)
+
+
 class CommitSerializer(serializers.Serializer):
     id = serializers.CharField()
     timestamp = serializers.CharField()
     author = AuthorCommitSerializer()
     message = serializers.CharField()
     url = serializers.CharField()
-
-
-class HookSenderSerializer(serializers.Serializer):
-    login = serializers.CharField(required=False)
-    avatar_url = serializers.CharField(required=False)
+    # The sender of the push, on commits from coalesced pushes
+    sender = HookSenderSerializer(required=False)
 
 
 class PushHookSerializer(HookSerializerMixin, serializers.Serializer):
     forced = serializers.BooleanField()
+    deleted = serializers.BooleanField(required=False, default=False)
     ref = serializers.CharField()
+    before = serializers.CharField(required=False, default="")
+    after = serializers.CharField(required=False, default="")
     sender = HookSenderSerializer()
     commits = serializers.ListField(child=CommitSerializer())
     repository = HookRepositorySerializer()
@@ -150,6 +155,18 @@ class PushHookSerializer(HookSerializerMixin, serializers.Serializer):
         prefix_len = len(branch_prefix)
         ref = ref[prefix_len:]
 
+        is_head = self.validated_data["deleted"] or project.is_branch_head(
+            ref, self.validated_data["after"], before=self.validated_data["before"]
+        )
+        if self.validated_data["deleted"]:
+            project.branches.filter(name=ref).delete()
+        elif is_head:
+            project.branches.update_or_create(
+                name=ref, defaults={"latest_sha": self.validated_data["after"]}
+            )
+        else:
+            logger.info(f"Received a push that is no longer the head of {ref}")
+
         if self._is_force_push():
             project.queue_refresh_commits(ref=ref, originating_user_id=None)
         else:
@@ -158,9 +175,38 @@ class PushHookSerializer(HookSerializerMixin, serializers.Serializer):
                 commits=self.validated_data["commits"],
                 ref=ref,
                 sender=sender,
+                is_head=is_head,
             )
 
 
+class RefHookSerializer(HookSerializerMixin, serializers.Serializer):
+    ref = serializers.CharField()
+    ref_type = serializers.CharField()
+    repository = HookRepositorySerializer()
+    # All other fields are ignored by default.
+
+    def process_hook(self):
+        project = self.get_matching_project()
+        if not project:
+            raise NotFound("No matching project.")
+
+        if self.validated_data["ref_type"] != "branch":
+            logger.info(f"Received a {self.validated_data['ref_type']} ref, aborting")
+            return
+        self.update_branch(project, self.validated_data["ref"])
+
+
+class CreateHookSerializer(RefHookSerializer):
+    def update_branch(self, project, name):
+        # The new branch's SHA comes with the push event that follows
+        project.branches.get_or_create(name=name)
+
+
+class DeleteHookSerializer(RefHookSerializer):
+    def update_branch(self, project, name):
+        project.branches.filter(name=name).delete()
+
+
 class PrReviewHookSerializer(HookSerializerMixin, serializers.Serializer):
     sender = HookSenderSerializer()
     repository = HookRepositorySerializer()
@@ -183,3 +229,92 @@ class PrReviewHookSerializer(HookSerializerMixin, serializers.Serializer):
 
         sender = self.validated_data["sender"]
         task.add_reviewer(sender)
+
+
+class IssueSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    number = serializers.IntegerField()
+    title = serializers.CharField()
+    state = serializers.ChoiceField(choices=IssueStates.choices)
+    html_url = serializers.URLField()
+    created_at = serializers.DateTimeField()
+    updated_at = serializers.DateTimeField()
+    # All other fields are ignored by default.
+
+
+class IssuesHookSerializer(HookSerializerMixin, serializers.Serializer):
+    action = serializers.CharField()
+    issue = IssueSerializer()
+    repository = HookRepositorySerializer()
+    # All other fields are ignored by default.
+
+    def process_hook(self):
+        project = self.get_matching_project()
+        if not project:
+            raise NotFound("No matching project.")
+
+        issue = dict(self.validated_data["issue"])
+        github_id = issue.pop("id")
+        if self.validated_data["action"] in ("deleted", "transferred"):
+            project.issues.filter(github_id=github_id).delete()
+        else:
+            project.issues.update_or_create(github_id=github_id, defaults=issue)
+
+
+HOOK_SERIALIZERS = {
+    "push": PushHookSerializer,
+    "pull_request": PrHookSerializer,
+    "pull_request_review": PrReviewHookSerializer,
+    "issues": IssuesHookSerializer,
+    "create": CreateHookSerializer,
+    "delete": DeleteHookSerializer,
+}
+
+
+def merge_push_payloads(payloads: list) -> dict:
+    """
+    Merge several push payloads for the same branch, oldest first, into one. Each
+    commit keeps the sender of the push it came with.
+    """
+    merged = dict(payloads[-1])
+    if "before" in payloads[0]:
+        merged["before"] = payloads[0]["before"]
+    merged["forced"] = any(payload["forced"] for payload in payloads)
+    # Commits are listed newest first, like in `Task.add_commits`:
+    merged["commits"] = [
+        {**commit, "sender": payload["sender"]} if "sender" in payload else commit
+        for payload in reversed(payloads)
+        for commit in payload["commits"]
+    ]
+    return merged
+
+
+def coalesce_deliveries(deliveries: list):
+    """
+    Yield `(event, payload, deliveries)` for each payload that needs processing,
+    in order of arrival. Pushes to the same branch are merged into a single
+    payload, so a burst of pushes updates the affected objects only once. A
+    branch deletion is never merged with the pushes before or after it.
+    """
+    groups = {}
+    # How many times each branch was deleted so far:
+    deletions = {}
+    for delivery in deliveries:
+        if delivery.event == "push":
+            repository = delivery.payload.get("repository") or {}
+            branch = (repository.get("id"), delivery.payload.get("ref"))
+            if delivery.payload.get("deleted"):
+                deletions[branch] = deletions.get(branch, 0) + 1
+                key = ("push", *branch, "deleted", deletions[branch])
+            else:
+                key = ("push", *branch, deletions.get(branch, 0))
+        else:
+            key = (delivery.event, delivery.pk)
+        groups.setdefault(key, []).append(delivery)
+
+    for (event, *_), group in groups.items():
+        payloads = [delivery.payload for delivery in group]
+        if event == "push" and len(payloads) > 1:
+            yield event, merge_push_payloads(payloads), group
+        else:
+            yield event, payloads[0], group
@@ -1,12 +1,15 @@
 import concurrent.futures
 import contextlib
+import gzip
 import logging
 import string
+import time
 import traceback
+from collections import defaultdict
 from datetime import timedelta
 from io import StringIO
 from pathlib import Path
-from typing import Any, Dict, Iterable, List
+from typing import Any, Dict, Iterable, List, Tuple
 
 import cumulusci
 import requests
@@ -24,18 +27,23 @@ from cumulusci.core.datasets import (
     flatten_declarations,
 )
 from cumulusci.core.runtime import BaseCumulusCI
-from cumulusci.salesforce_api.org_schema import Field, Filters, Schema, get_org_schema
+from cumulusci.salesforce_api.org_schema import (
+    Field,
+    Filters,
+    Schema,
+    ZippableTempDb,
+    get_org_schema,
+    populate_counts,
+)
 from cumulusci.salesforce_api.utils import get_simple_salesforce_connection
 from cumulusci.tasks.github.util import CommitDir
-from cumulusci.tasks.salesforce.nonsourcetracking import (
-    ListComponents,
-    ListNonSourceTrackable,
-)
+from cumulusci.tasks.salesforce.nonsourcetracking import ListComponents
 from cumulusci.tasks.vlocity.vlocity import VlocityRetrieveTask
 from cumulusci.utils import temporary_dir
 from cumulusci.utils.http.requests_utils import safe_json_from_response
 from django.conf import settings
-from django.db import transaction
+from django.core.cache import cache
+from django.db import connection, transaction
 from django.db.models.query_utils import Q
 from django.template.loader import render_to_string
 from django.utils.text import slugify
@@ -43,15 +51,18 @@ from django.utils.timezone import now
 from django.utils.translation import gettext_lazy as _
 from django_rq import get_scheduler, job
 from github3.exceptions import NotFoundError, UnprocessableEntity
-from github3.github import GitHub
 from github3.repos.repo import Repository
+from rest_framework.exceptions import NotFound
 
 from .email_utils import get_user_facing_url
 from .gh import (
+    compare_shas,
+    forget_branch_sha,
     get_all_org_repos,
-    get_cached_user,
+    get_branch_sha,
     get_cumulus_prefix,
     get_project_config,
+    get_repo_collaborators,
     get_repo_info,
     gh_as_org,
     gh_as_user,
@@ -59,28 +70,53 @@ from .gh import (
     normalize_commit,
     try_to_make_branch,
 )
+from .hook_serializers import HOOK_SERIALIZERS, coalesce_deliveries
 from .models import (
     Epic,
     GitHubCollaboration,
+    GitHubIssue,
     GitHubOrganization,
     GitHubUser,
     Project,
     ScratchOrg,
+    ScratchOrgPool,
+    ScratchOrgType,
     Task,
     TaskReviewStatus,
     User,
+    WebhookDelivery,
 )
 from .push import report_scratch_org_error
 from .sf_org_changes import (
     commit_changes_to_github,
     compare_revisions,
     get_latest_revision_numbers,
+    get_nonsource_types,
+    get_schema_revision,
     get_valid_target_directories,
 )
-from .sf_run_flow import create_org, delete_org, get_devhub_api, run_flow
+from .sf_run_flow import (
+    SCRATCH_ORG_POLL_BACKOFF,
+    SCRATCH_ORG_POLL_INITIAL_DELAY,
+    SCRATCH_ORG_POLL_MAX_DELAY,
+    ScratchOrgError,
+    check_org_creation,
+    delete_org,
+    finish_org_creation,
+    get_devhub_api,
+    parse_flow_event,
+    run_flow,
+    start_org_creation,
+)
 
 logger = logging.getLogger(__name__)
 
+ORG_SCHEMA_FILTERS = (Filters.extractable, Filters.createable)
+ORG_SCHEMA_CACHE_TIMEOUT = 60 * 60 * 24 * 30  # The longest a scratch org lives
+ORG_SCHEMA_COUNTS_CACHE_TIMEOUT = 60 * 5  # 5 minutes
+# How often a running flow's output is saved and its progress pushed:
+FLOW_PROGRESS_INTERVAL = 2  # seconds
+
 
 class TaskReviewIntegrityError(Exception):
     pass
@@ -94,6 +130,59 @@ class MissingProjectPathError(Exception):
     pass
 
 
+class FlowProgress:
+    """
+    Follows the output of `run_flow` on a ScratchOrg: appends it to the org's
+    build log, and tells the org's subscribers which steps of the flow are done,
+    at most every FLOW_PROGRESS_INTERVAL seconds.
+    """
+
+    def __init__(self, scratch_org: ScratchOrg, *, originating_user_id):
+        self.scratch_org = scratch_org
+        self.originating_user_id = originating_user_id
+        self.lines = []
+        self.current_step = None
+        self.finished_steps = []
+        self.skipped_steps = []
+        self.progressed = False
+        self.flushed_at = time.monotonic()
+
+    def __call__(self, line: str):
+        self.lines.append(line)
+        event = parse_flow_event(line)
+        if event:
+            self.record(*event)
+        if time.monotonic() - self.flushed_at >= FLOW_PROGRESS_INTERVAL:
+            self.flush()
+
+    def record(self, event, step):
+        if event in ("started", "completed") and self.current_step:
+            self.finished_steps.append(self.current_step)
+            self.current_step = None
+        if event == "started":
+            self.current_step = step
+        elif event == "skipped":
+            self.skipped_steps.append(step)
+        self.progressed = True
+
+    def flush(self):
+        if self.lines:
+            self.scratch_org.append_log("".join(self.lines))
+            self.lines = []
+        if self.progressed:
+            self.scratch_org.notify_progress(
+                type_="SCRATCH_ORG_FLOW_PROGRESS",
+                originating_user_id=self.originating_user_id,
+                message={
+                    "current_step": self.current_step,
+                    "finished_steps": self.finished_steps,
+                    "skipped_steps": self.skipped_steps,
+                },
+            )
+            self.progressed = False
+        self.flushed_at = time.monotonic()
+
+
 @contextlib.contextmanager
 def creating_gh_branch(instance):
     instance.currently_creating_branch = True
@@ -110,14 +199,16 @@ def creating_gh_branch(instance):
 def get_branch_prefix(user, repository: Repository):
     if settings.BRANCH_PREFIX:
         return settings.BRANCH_PREFIX
-    with local_github_checkout(user, repository.id, "#DEFAULT") as repo_root:
+    with local_github_checkout(
+        user, repository.id, "#DEFAULT", mode="metadata"
+    ) as repo_root:
         return get_cumulus_prefix(
             repo_root=repo_root,
             repo_name=repository.name,
             repo_url=repository.html_url,
             repo_owner=repository.owner.login,
             repo_branch=repository.default_branch,
-            repo_commit=repository.branch(repository.default_branch).latest_sha(),
+            repo_commit=get_branch_sha(repository, repository.default_branch),
         )
 
 
@@ -135,7 +226,7 @@ def epic_create_branch(
         with creating_gh_branch(epic):
             prefix = epic.project.branch_prefix or get_branch_prefix(user, repository)
             epic_branch_name = f"{prefix}{slugify(epic.name)}"
-            latest_sha = repository.branch(repository.default_branch).latest_sha()
+            latest_sha = get_branch_sha(repository, repository.default_branch)
             epic_branch_name = try_to_make_branch(
                 repository, new_branch=epic_branch_name, base_sha=latest_sha
             )
@@ -179,7 +270,7 @@ def _create_branches_on_github(
         else:
             base_branch_name = repository.default_branch
             prefix = get_branch_prefix(user, repository)
-        latest_sha = task_sha or repository.branch(base_branch_name).latest_sha()
+        latest_sha = task_sha or get_branch_sha(repository, base_branch_name)
         task_branch_name = try_to_make_branch(
             repository,
             new_branch=f"{prefix}{slugify(task.name)}",
@@ -404,7 +495,7 @@ def alert_user_about_expiring_org(*, org, days):
         user.notify(subject, body)
 
 
-def _create_org_and_run_flow(
+def _start_org_creation(
     scratch_org: ScratchOrg,
     *,
     user: User,
@@ -415,12 +506,137 @@ def _create_org_and_run_flow(
 ):
     """
     Expects to be called in the context of a local github checkout.
+
+    Requests the scratch org from Salesforce and schedules
+    `poll_scratch_org_creation` to check on it, so no worker waits while the org
+    is being built.
+    """
+    repository = get_repo_info(user, repo_id=repo_id)
+    scratch_org.scratch_org_info_id = start_org_creation(
+        repo_owner=repository.owner.login,
+        repo_name=repository.name,
+        repo_url=repository.html_url,
+        repo_branch=repo_branch,
+        user=user,
+        project_path=project_path,
+        scratch_org=scratch_org,
+        org_name=scratch_org.org_config_name,
+        sf_username=scratch_org.owner_sf_username,
+    )
+    scratch_org.save(update_fields=["scratch_org_info_id"])
+    _schedule_scratch_org_poll(
+        scratch_org,
+        repo_id=repo_id,
+        repo_branch=repo_branch,
+        originating_user_id=originating_user_id,
+        waited=0,
+        delay=SCRATCH_ORG_POLL_INITIAL_DELAY,
+    )
+
+
+def _schedule_scratch_org_poll(scratch_org: ScratchOrg, *, delay, **kwargs):
+    get_scheduler("default").enqueue_in(
+        timedelta(seconds=delay),
+        poll_scratch_org_creation,
+        scratch_org,
+        delay=delay,
+        timeout=settings.MAXIMUM_JOB_LENGTH,
+        **kwargs,
+    )
+
+
+def _finalize_org_creation(scratch_org: ScratchOrg, *, error=None, originating_user_id):
+    if scratch_org.currently_refreshing_org:
+        scratch_org.finalize_refresh_org(
+            error=error, originating_user_id=originating_user_id
+        )
+    else:
+        scratch_org.finalize_provision(
+            error=error, originating_user_id=originating_user_id
+        )
+
+
+def poll_scratch_org_creation(
+    scratch_org: ScratchOrg,
+    *,
+    repo_id: Any,
+    repo_branch: str,
+    originating_user_id: str,
+    waited: int,
+    delay: int,
+):
+    """
+    Check on a scratch org that Salesforce is building. Once it is Active, set it
+    up and run its flow; until then, check again later and less often.
+    """
+    scratch_org.refresh_from_db()
+    if scratch_org.deleted_at is not None:
+        logger.info(f"Scratch org {scratch_org.id} was deleted while being created")
+        return
+
+    try:
+        org_result = check_org_creation(
+            scratch_org=scratch_org, devhub_username=scratch_org.owner_sf_username
+        )
+        if org_result is None:
+            waited += delay
+            if waited >= settings.MAXIMUM_JOB_LENGTH:
+                raise ScratchOrgError(
+                    _("Scratch org creation failed: Org creation timed out")
+                )
+            _schedule_scratch_org_poll(
+                scratch_org,
+                repo_id=repo_id,
+                repo_branch=repo_branch,
+                originating_user_id=originating_user_id,
+                waited=waited,
+                delay=min(
+                    int(delay * SCRATCH_ORG_POLL_BACKOFF), SCRATCH_ORG_POLL_MAX_DELAY
+                ),
+            )
+            return
+
+        user = scratch_org.owner
+        with local_github_checkout(user, repo_id, repo_branch) as repo_root:
+            _finish_org_creation_and_run_flow(
+                scratch_org,
+                user=user,
+                repo_id=repo_id,
+                repo_branch=repo_branch,
+                project_path=repo_root,
+                org_result=org_result,
+                originating_user_id=originating_user_id,
+            )
+    except Exception as e:
+        scratch_org.refresh_from_db()
+        _finalize_org_creation(
+            scratch_org, error=e, originating_user_id=originating_user_id
+        )
+        tb = traceback.format_exc()
+        logger.error(tb)
+        raise
+    else:
+        _finalize_org_creation(scratch_org, originating_user_id=originating_user_id)
+
+
+def _finish_org_creation_and_run_flow(
+    scratch_org: ScratchOrg,
+    *,
+    user: User,
+    repo_id: Any,
+    repo_branch: str,
+    project_path: str,
+    org_result: dict,
+    originating_user_id: str,
+):
+    """
+    Expects to be called in the context of a local github checkout.
     """
     repository = get_repo_info(user, repo_id=repo_id)
     commit = repository.branch(repo_branch).commit
     org_config_name = scratch_org.org_config_name
 
-    scratch_org_config, cci, org_config = create_org(
+    scratch_org_config, cci, org_config = finish_org_creation(
         repo_owner=repository.owner.login,
         repo_name=repository.name,
         repo_url=repository.html_url,
@@ -429,8 +645,8 @@ def _create_org_and_run_flow(
         project_path=project_path,
         scratch_org=scratch_org,
         org_name=org_config_name,
+        org_result=org_result,
         originating_user_id=originating_user_id,
-        sf_username=scratch_org.owner_sf_username,
     )
     scratch_org.refresh_from_db()
     # Save these values on org creation so that we have what we need to
@@ -444,7 +660,12 @@ def _create_org_and_run_flow(
     scratch_org.latest_commit_url = commit.html_url
     scratch_org.latest_commit_at = commit.commit.author.get("date", None)
     scratch_org.config = scratch_org_config.config
+    scratch_org.api_version = cci.project_config.project__package__api_version
+    # A new org on Salesforce starts its SourceMember tracking from scratch
+    scratch_org.current_revision_numbers = {}
+    scratch_org.max_revision_counter = 0
     scratch_org.save()
+    scratch_org.clear_log()
 
     cases = {
         "dev": "dev_org",
@@ -456,6 +677,7 @@ def _create_org_and_run_flow(
     flow_name = scratch_org_config.setup_flow or cases.get(org_config_name)
 
     if flow_name:
+        progress = FlowProgress(scratch_org, originating_user_id=originating_user_id)
         try:
             run_flow(
                 cci=cci,
@@ -463,13 +685,10 @@ def _create_org_and_run_flow(
                 flow_name=flow_name,
                 project_path=project_path,
                 user=user,
+                on_output=progress,
             )
         finally:
-            log_path = Path(project_path, ".cumulusci/logs/cci.log")
-            if log_path.exists():
-                scratch_org.refresh_from_db()
-                scratch_org.cci_log = log_path.read_text()
-                scratch_org.save()
+            progress.flush()
         scratch_org.refresh_from_db()
 
     # We don't need to explicitly save the following, because this
@@ -485,6 +704,10 @@ def _create_org_and_run_flow(
         k for k, v in org_config.installed_packages.items()
     ]
 
+    _schedule_expiry_alert(scratch_org)
+
+
+def _schedule_expiry_alert(scratch_org: ScratchOrg):
     scheduler = get_scheduler("default")
     days = settings.DAYS_BEFORE_ORG_EXPIRY_TO_ALERT
     before_expiry = scratch_org.expires_at - timedelta(days=days)
@@ -496,6 +719,114 @@ def _create_org_and_run_flow(
     ).id
 
 
+# Everything a pooled org carries over to the ScratchOrg that claims it
+POOLED_ORG_FIELDS = (
+    "config",
+    "url",
+    "expires_at",
+    "latest_commit",
+    "latest_commit_url",
+    "latest_commit_at",
+    "valid_target_directories",
+    "installed_packages",
+    "latest_revision_numbers",
+    "current_revision_numbers",
+    "max_revision_counter",
+    "api_version",
+    "last_modified_at",
+    "is_created",
+    "scratch_org_info_id",
+)
+
+
+def _claim_pooled_org(scratch_org: ScratchOrg, *, user, repo_id, commit_ish) -> bool:
+    """
+    Hand a pooled org built from the current head of `commit_ish` over to
+    `scratch_org`. Returns False when there is none ready.
+    """
+    project = scratch_org.root_project
+    # Pooled orgs live in their builder's Dev Hub, which is where they will be
+    # checked on and deleted from once claimed, so it has to be the user's too:
+    pools = [
+        pool
+        for pool in ScratchOrgPool.objects.filter(
+            project=project, org_config_name=scratch_org.org_config_name
+        ).select_related("builder")
+        if pool.builder.sf_username == user.sf_username
+    ]
+    if not pools:
+        return False
+
+    sha = get_branch_sha(get_repo_info(user, repo_id=repo_id), commit_ish)
+    with transaction.atomic():
+        pooled = (
+            ScratchOrg.objects.active()
+            .select_for_update(skip_locked=True, of=("self",))
+            .filter(
+                pool__in=pools,
+                is_created=True,
+                delete_queued_at__isnull=True,
+                latest_commit=sha,
+            )
+            .order_by("created_at")
+            .first()
+        )
+        if pooled is None:
+            return False
+        for field in POOLED_ORG_FIELDS:
+            setattr(scratch_org, field, getattr(pooled, field))
+        scratch_org.save()
+        scratch_org.clear_log()
+        pooled.log_chunks.update(scratch_org=scratch_org)
+        # The Salesforce org now belongs to `scratch_org`, so retire the pooled
+        # record without the deletion that soft-deleting would queue.
+        ScratchOrg.objects.filter(pk=pooled.pk).update(deleted_at=now(), pool=None)
+
+    if pooled.expiry_job_id:
+        get_scheduler("default").cancel(pooled.expiry_job_id)
+    _schedule_expiry_alert(scratch_org)
+    _set_org_user_email(scratch_org, scratch_org.owner)
+    pooled.pool.queue_replenish()
+    return True
+
+
+def replenish_scratch_org_pool(pool: ScratchOrgPool):
+    """
+    Discard the pooled orgs built from an outdated commit of the Project's
+    branch, and start building orgs until the pool is back to its size.
+    """
+    pool.refresh_from_db()
+    project = pool.project
+    sha = get_branch_sha(
+        get_repo_info(pool.builder, repo_id=project.get_repo_id()),
+        project.branch_name,
+    )
+    orgs = pool.orgs.active().filter(delete_queued_at__isnull=True)
+    for org in orgs.filter(is_created=True).exclude(latest_commit=sha):
+        org.queue_delete(originating_user_id=None)
+
+    # Replenish one pool at a time. Orgs still being built count too, so
+    # replenishing twice doesn't overfill the pool.
+    with transaction.atomic():
+        ScratchOrgPool.objects.select_for_update().get(pk=pool.pk)
+        created = ScratchOrg.objects.bulk_create(
+            ScratchOrg(
+                project=project,
+                org_type=ScratchOrgType.PLAYGROUND,
+                org_config_name=pool.org_config_name,
+                owner=pool.builder,
+                pool=pool,
+            )
+            for _i in range(pool.size - orgs.count())
+        )
+    # Only build them once the rows are visible to the workers:
+    for org in created:
+        org.queue_provision(originating_user_id=str(pool.builder.id))
+
+
+replenish_scratch_org_pool_job = job(replenish_scratch_org_pool)
+
+
 def create_branches_on_github_then_create_scratch_org(
     *, scratch_org: ScratchOrg, originating_user_id: str
 ):
@@ -518,11 +849,16 @@ def create_branches_on_github_then_create_scratch_org(
             )
         if commit_ish and not task and not parent.latest_sha:
             repository = get_repo_info(user, repo_id=repo_id)
-            parent.latest_sha = repository.branch(commit_ish).latest_sha()
+            parent.latest_sha = get_branch_sha(repository, commit_ish)
             parent.save()
             parent.notify_changed(originating_user_id=originating_user_id)
+        if scratch_org.pool_id is None and _claim_pooled_org(
+            scratch_org, user=user, repo_id=repo_id, commit_ish=commit_ish
+        ):
+            scratch_org.finalize_provision(originating_user_id=originating_user_id)
+            return
         with local_github_checkout(user, repo_id, commit_ish) as repo_root:
-            _create_org_and_run_flow(
+            _start_org_creation(
                 scratch_org,
                 user=user,
                 repo_id=repo_id,
@@ -535,8 +871,7 @@ def create_branches_on_github_then_create_scratch_org(
         tb = traceback.format_exc()
         logger.error(tb)
         raise
-    else:
-        scratch_org.finalize_provision(originating_user_id=originating_user_id)
+    # poll_scratch_org_creation finalizes the provisioning once the org is ready
 
 
 create_branches_on_github_then_create_scratch_org_job = job(
@@ -584,10 +919,11 @@ def refresh_scratch_org(scratch_org, *, originating_user_id):
         repo_id = scratch_org.parent.get_repo_id()
         commit_ish = scratch_org.parent.branch_name
 
+        forget_org_schema(scratch_org)
         delete_org(scratch_org)
 
         with local_github_checkout(user, repo_id, commit_ish) as repo_root:
-            _create_org_and_run_flow(
+            _start_org_creation(
                 scratch_org,
                 user=user,
                 repo_id=repo_id,
@@ -603,8 +939,7 @@ def refresh_scratch_org(scratch_org, *, originating_user_id):
         tb = traceback.format_exc()
         logger.error(tb)
         raise
-    else:
-        scratch_org.finalize_refresh_org(originating_user_id=originating_user_id)
+    # poll_scratch_org_creation finalizes the refresh once the new org is ready
 
 
 refresh_scratch_org_job = job(refresh_scratch_org)
@@ -621,52 +956,18 @@ def unsaved_changes(scratch_org, originating_user_id):
 
 
 def nonsource_types(scratch_org):
-    user = scratch_org.owner
-    repo_id = scratch_org.parent.get_repo_id()
-    commit_ish = scratch_org.parent.branch_name
-
-    with local_github_checkout(user, repo_id, commit_ish) as repo_root:
-        scratch_org.valid_target_directories, _ = get_valid_target_directories(
-            user,
-            scratch_org,
-            repo_root,
-        )
     scratch_org.non_source_changes = {}
-    with dataset_env(scratch_org) as (
-        project_config,
-        org_config,
-        sf,
-        schema,
-        repo,
-    ):
-        try:
-            components = ListNonSourceTrackable(
-                org_config=org_config,
-                project_config=project_config,
-                task_config=TaskConfig({"options": {}}),
-            )()
-            for types in components:
-                scratch_org.non_source_changes[types] = []
-        except Exception as e:
-            logger.error(f"Error in listing non-source-trackable metadatatypes: {e}")
+    try:
+        for types in get_nonsource_types(scratch_org.api_version):
+            scratch_org.non_source_changes[types] = []
+    except Exception as e:
+        logger.error(f"Error in listing non-source-trackable metadatatypes: {e}")
 
 
 def get_unsaved_changes(scratch_org, *, originating_user_id):
-
     try:
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            unsaved_changes_result = executor.submit(
-                unsaved_changes,
-                scratch_org=scratch_org,
-                originating_user_id=originating_user_id,
-            )
-            nonsource_types_result = executor.submit(
-                nonsource_types, scratch_org=scratch_org
-            )
-            concurrent.futures.wait([unsaved_changes_result, nonsource_types_result])
-            unsaved_changes_result.result()
-            nonsource_types_result.result()
-
+        unsaved_changes(scratch_org, originating_user_id=originating_user_id)
+        nonsource_types(scratch_org)
     except Exception as e:
         scratch_org.refresh_from_db()
         scratch_org.finalize_get_unsaved_changes(
@@ -684,6 +985,41 @@ def get_unsaved_changes(scratch_org, *, originating_user_id):
 get_unsaved_changes_job = job(get_unsaved_changes)
 
 
+def _get_unsaved_changes_in_turn(orgs, originating_user_id):
+    try:
+        for org in orgs:
+            try:
+                get_unsaved_changes(org, originating_user_id=originating_user_id)
+            except Exception:
+                # get_unsaved_changes has reported and logged it already
+                pass
+    finally:
+        connection.close()
+
+
+def get_unsaved_changes_for_orgs(scratch_org_ids, *, originating_user_id):
+    """
+    Refresh the unsaved changes of several orgs. Orgs sharing a Dev Hub are
+    refreshed one after the other, and up to UNSAVED_CHANGES_MAX_WORKERS Dev
+    Hubs at a time.
+    """
+    orgs_by_devhub = defaultdict(list)
+    orgs = ScratchOrg.objects.active().filter(id__in=scratch_org_ids)
+    for org in orgs.select_related("owner"):
+        orgs_by_devhub[org.owner_sf_username].append(org)
+
+    with concurrent.futures.ThreadPoolExecutor(
+        max_workers=settings.UNSAVED_CHANGES_MAX_WORKERS
+    ) as executor:
+        for devhub_orgs in orgs_by_devhub.values():
+            executor.submit(
+                _get_unsaved_changes_in_turn, devhub_orgs, originating_user_id
+            )
+
+
+get_unsaved_changes_for_orgs_job = job(get_unsaved_changes_for_orgs)
+
+
 def get_nonsource_components(*, scratch_org, desired_type, originating_user_id):
     try:
         scratch_org.refresh_from_db()
@@ -847,6 +1183,7 @@ create_pr_job = job(create_pr)
 
 def delete_scratch_org(scratch_org, *, originating_user_id):
     try:
+        forget_org_schema(scratch_org)
         delete_org(scratch_org)
         scratch_org.refresh_from_db()
         scratch_org.delete(originating_user_id=originating_user_id)
@@ -966,32 +1303,50 @@ def refresh_commits(*, project, branch_name, originating_user_id):
     repo = get_repo_info(
         None, repo_owner=project.repo_owner, repo_name=project.repo_name
     )
-    # We get this as a GitHubIterator, but we want to slice it later, so
-    # we will convert it to a list.
-    # We limit it to 1000 commits to avoid hammering the API, and on the
-    # assumption that we will find the origin of the task branch within
-    # that limit.
-    commits = list(repo.commits(repo.branch(branch_name).latest_sha(), number=1000))
+    tasks = list(
+        Task.objects.filter(
+            Q(project=project, branch_name=branch_name)
+            | Q(epic__project=project, branch_name=branch_name)
+        )
+    )
+
+    # Walk the branch history once, newest first, and stop as soon as the origin
+    # of every task is found. Each commit is normalized once and shared by all
+    # tasks. We limit it to 1000 commits to avoid hammering the API, and on the
+    # assumption that we will find the origin of the task branches within that
+    # limit.
+    latest_sha = ""
+    commits = []
+    origin_positions = {}
+    pending_origins = {task.origin_sha for task in tasks}
+    for commit in repo.commits(get_branch_sha(repo, branch_name), number=1000):
+        latest_sha = latest_sha or commit.sha
+        if commit.sha in pending_origins:
+            origin_positions[commit.sha] = len(commits)
+            pending_origins.remove(commit.sha)
+        if not pending_origins:
+            break
+        commits.append(normalize_commit(commit))
 
     if project.branch_name == branch_name:
-        project.latest_sha = commits[0].sha if commits else ""
+        project.latest_sha = latest_sha
         project.finalize_project_update(originating_user_id=originating_user_id)
+        project.queue_replenish_scratch_org_pools()
 
     epics = Epic.objects.filter(project=project, branch_name=branch_name)
     for epic in epics:
-        epic.latest_sha = commits[0].sha if commits else ""
+        epic.latest_sha = latest_sha
         epic.finalize_epic_update(originating_user_id=originating_user_id)
 
-    tasks = Task.objects.filter(
-        Q(project=project, branch_name=branch_name)
-        | Q(epic__project=project, branch_name=branch_name)
-    )
+    comparisons = Task.compare_branches(tasks)
     for task in tasks:
-        origin_sha_index = [commit.sha for commit in commits].index(task.origin_sha)
-        task.commits = [
-            normalize_commit(commit) for commit in commits[:origin_sha_index]
-        ]
-        task.update_has_unmerged_commits()
+        if task.origin_sha not in origin_positions:
+            logger.warning(
+                f"Origin {task.origin_sha} of task {task.pk} is not among the "
+                f"latest {len(commits)} commits of {branch_name}"
+            )
+        task.commits = commits[: origin_positions.get(task.origin_sha, len(commits))]
+        task.update_has_unmerged_commits(comparisons)
         task.update_review_valid()
         task.finalize_task_update(originating_user_id=originating_user_id)
 
@@ -999,34 +1354,94 @@ def refresh_commits(*, project, branch_name, originating_user_id):
 refresh_commits_job = job(refresh_commits)
 
 
+def process_webhook_inbox():
+    """
+    Process the webhook deliveries waiting in the inbox. Pushes to the same branch
+    are coalesced, see `coalesce_deliveries`.
+
+    Deliveries are claimed for MAXIMUM_JOB_LENGTH, and only marked as processed
+    once their hook has run. Should this run die before then, a follow-up run
+    picks up what it left when the claims lapse.
+    """
+    # Deliveries stored from now on need another run:
+    cache.delete(WebhookDelivery.QUEUED_CACHE_KEY)
+    claimed_at = now()
+    lease = timedelta(seconds=settings.MAXIMUM_JOB_LENGTH)
+    with transaction.atomic():
+        deliveries = list(
+            WebhookDelivery.objects.select_for_update(skip_locked=True)
+            .filter(processed_at__isnull=True)
+            .filter(Q(claimed_at__isnull=True) | Q(claimed_at__lte=claimed_at - lease))
+        )
+        WebhookDelivery.objects.filter(
+            pk__in=[delivery.pk for delivery in deliveries]
+        ).update(claimed_at=claimed_at)
+    if not deliveries:
+        return
+    scheduler = get_scheduler("default")
+    follow_up = scheduler.enqueue_in(lease, process_webhook_inbox)
+
+    for event, payload, group in coalesce_deliveries(deliveries):
+        error = ""
+        try:
+            serializer = HOOK_SERIALIZERS[event](data=payload)
+            serializer.is_valid(raise_exception=True)
+            serializer.process_hook()
+        except NotFound as e:
+            error = str(e)
+            logger.info(f"Ignoring {event} webhook: {error}")
+        except Exception:
+            error = traceback.format_exc()
+            logger.error(error)
+        WebhookDelivery.objects.filter(
+            pk__in=[delivery.pk for delivery in group]
+        ).update(processed_at=now(), error=error)
+
+    scheduler.cancel(follow_up)
+    WebhookDelivery.prune()
+
+
+process_webhook_inbox_job = job(process_webhook_inbox)
+
+
 def refresh_github_users(project: Project, *, originating_user_id):
     try:
         project.refresh_from_db()
         repo = get_repo_info(
             None, repo_owner=project.repo_owner, repo_name=project.repo_name
         )
-        for collaborator in repo.collaborators():
-            try:
-                # Retrieve additional information for each user by querying GitHub
-                collaborator.name = (
-                    get_cached_user(GitHub(repo), collaborator.login).name or ""
-                )
-            except Exception:
-                logger.exception(f"Failed to expand GitHub user {collaborator}")
-                collaborator.name = ""
-            user, _ = GitHubUser.objects.update_or_create(
-                id=collaborator.id,
-                defaults={
-                    "login": collaborator.login,
-                    "name": collaborator.name,
-                    "avatar_url": collaborator.avatar_url,
-                },
+        collaborators = list(get_repo_collaborators(repo))
+        with transaction.atomic():
+            GitHubUser.objects.bulk_create(
+                [
+                    GitHubUser(
+                        id=collaborator["id"],
+                        login=collaborator["login"],
+                        name=collaborator["name"],
+                        avatar_url=collaborator["avatar_url"],
+                    )
+                    for collaborator in collaborators
+                ],
+                update_conflicts=True,
+                unique_fields=["id"],
+                update_fields=["login", "name", "avatar_url"],
             )
-            GitHubCollaboration.objects.update_or_create(
-                user=user,
-                project=project,
-                defaults={"permissions": collaborator.permissions},
+            GitHubCollaboration.objects.bulk_create(
+                [
+                    GitHubCollaboration(
+                        project=project,
+                        user_id=collaborator["id"],
+                        permissions=collaborator["permissions"],
+                    )
+                    for collaborator in collaborators
+                ],
+                update_conflicts=True,
+                unique_fields=["project", "user"],
+                update_fields=["permissions"],
             )
+            project.githubcollaboration_set.exclude(
+                user_id__in=[collaborator["id"] for collaborator in collaborators]
+            ).delete()
     except Exception as e:
         project.finalize_refresh_github_users(
             error=e, originating_user_id=originating_user_id
@@ -1048,32 +1463,71 @@ def refresh_github_issues(project, *, originating_user_id):
             None, repo_owner=project.repo_owner, repo_name=project.repo_name
         )
 
+        # The first sync fetches the most recently updated open issues, up to
+        # GITHUB_ISSUE_LIMIT; has_truncated_issues records whether older ones were
+        # left out. Later syncs fetch every change since, including closed issues,
+        # oldest first, so that one that hits the limit picks up where it left off
+        started_at = now()
+        synced_at = project.issues_synced_at
+        if synced_at:
+            issues = repo.issues(
+                state="all", sort="updated", direction="asc", since=synced_at
+            )
+        else:
+            issues = repo.issues(sort="updated", direction="desc")
+
         # Unfortunately the GitHub API includes pull requests when querying for issues,
         # and we can't filter them out in the request. Instead we manually filter out
         # pull requests until we have enough issues.
-        project.has_truncated_issues = True
-        issues = repo.issues()
-        count = 0
-        while count < settings.GITHUB_ISSUE_LIMIT:
+        github_issues = []
+        newest_updated_at = None
+        last_updated_at = synced_at
+        truncated = True
+        while len(github_issues) < settings.GITHUB_ISSUE_LIMIT:
             try:
                 issue = next(issues)
             except StopIteration:
-                project.has_truncated_issues = False
+                truncated = False
                 break
+            # The first sync comes newest first
+            newest_updated_at = newest_updated_at or issue.updated_at
+            last_updated_at = issue.updated_at
             if issue.pull_request_urls is not None:
                 continue  # Issue is actually a pull request, skip
-            project.issues.update_or_create(
-                github_id=issue.id,
-                defaults={
-                    "title": issue.title,
-                    "number": issue.number,
-                    "state": issue.state,
-                    "html_url": issue.html_url,
-                    "created_at": issue.created_at,
-                    "updated_at": issue.updated_at,
-                },
+            github_issues.append(
+                GitHubIssue(
+                    project=project,
+                    github_id=issue.id,
+                    title=issue.title,
+                    number=issue.number,
+                    state=issue.state,
+                    html_url=issue.html_url,
+                    created_at=issue.created_at,
+                    updated_at=issue.updated_at,
+                )
             )
-            count += 1
+        GitHubIssue.objects.bulk_create(
+            github_issues,
+            update_conflicts=True,
+            unique_fields=["project", "github_id"],
+            update_fields=[
+                "title",
+                "number",
+                "state",
+                "html_url",
+                "created_at",
+                "updated_at",
+            ],
+        )
+        if not synced_at:
+            project.has_truncated_issues = truncated
+            # Changes made while the sync ran are fetched again next time
+            project.issues_synced_at = newest_updated_at or started_at
+        elif truncated:
+            # Resume from the last change we got to
+            project.issues_synced_at = last_updated_at
+        else:
+            project.issues_synced_at = started_at
 
     except Exception as e:
         project.finalize_refresh_github_issues(
@@ -1176,7 +1630,7 @@ def create_gh_branch_for_new_epic(epic, *, user):
             try:
                 head = repository.branch(epic.branch_name).commit.sha
             except NotFoundError:
-                latest_sha = repository.branch(repository.default_branch).latest_sha()
+                latest_sha = get_branch_sha(repository, repository.default_branch)
                 with creating_gh_branch(epic):
                     try_to_make_branch(
                         repository, new_branch=epic.branch_name, base_sha=latest_sha
@@ -1186,7 +1640,7 @@ def create_gh_branch_for_new_epic(epic, *, user):
                 epic.latest_sha = head
                 base = repository.branch(repository.default_branch).commit.sha
                 epic.has_unmerged_commits = (
-                    repository.compare_commits(base, head).ahead_by > 0
+                    compare_shas(repository, base, head)["ahead_by"] > 0
                 )
                 # Check if has PR
                 try:
@@ -1241,14 +1695,16 @@ def available_org_config_names(project, *, user):
             repo_owner=project.repo_owner,
             repo_name=project.repo_name,
         )
-        with local_github_checkout(user, repo_id, "#DEFAULT") as repo_root:
+        with local_github_checkout(
+            user, repo_id, "#DEFAULT", mode="metadata"
+        ) as repo_root:
             config = get_project_config(
                 repo_root=repo_root,
                 repo_name=repo.name,
                 repo_url=repo.html_url,
                 repo_owner=repo.owner.login,
                 repo_branch=repo.default_branch,
-                repo_commit=repo.branch(repo.default_branch).latest_sha(),
+                repo_commit=get_branch_sha(repo, repo.default_branch),
             )
             project.org_config_names = [
                 {"key": key, **value} for key, value in config.orgs__scratch.items()
@@ -1269,16 +1725,19 @@ def available_org_config_names(project, *, user):
 available_org_config_names_job = job(available_org_config_names)
 
 
+def _set_org_user_email(scratch_org, user):
+    org_config = scratch_org.get_refreshed_org_config()
+    org_config.salesforce_client.User.update(
+        f"Username/{org_config.username}",
+        {"Email": user.email},
+    )
+
+
 def user_reassign(scratch_org, *, new_user, originating_user_id):
     try:
         scratch_org.refresh_from_db()
         scratch_org.owner = new_user
-        org_config = scratch_org.get_refreshed_org_config()
-        username = org_config.username
-        org_config.salesforce_client.User.update(
-            f"Username/{username}",
-            {"Email": new_user.email},
-        )
+        _set_org_user_email(scratch_org, new_user)
     except Exception as err:
         scratch_org.finalize_reassign(
             error=err, originating_user_id=originating_user_id
@@ -1338,8 +1797,73 @@ def schema_field_to_json(field_data: Field):
     }
 
 
+def _org_schema_cache_keys(org: ScratchOrg) -> Tuple[str, str]:
+    # A refresh replaces the Salesforce org behind the same record, and with it
+    # the RevisionCounters that validate the cached schema
+    suffix = f"{org.id}_{org.config.get('org_id', '')}"
+    return f"org_schema_{suffix}", f"org_schema_counts_{suffix}"
+
+
+def forget_org_schema(org: ScratchOrg):
+    cache.delete_many(_org_schema_cache_keys(org))
+
+
+def _add_schema_counts(org: ScratchOrg, sf, schema: Schema):
+    _key, key = _org_schema_cache_keys(org)
+    counts = cache.get(key)
+    if counts is None:
+        counts = populate_counts(sf, schema, schema.keys(), logger)
+        cache.set(key, counts, timeout=ORG_SCHEMA_COUNTS_CACHE_TIMEOUT)
+    else:
+        schema.add_counts(counts)
+
+
 @contextlib.contextmanager
-def dataset_env(org: ScratchOrg):
+def cached_org_schema(org: ScratchOrg, sf, org_config, *, include_counts=False):
+    """
+    Yields the schema of `org`, as `get_org_schema` would.
+
+    Describing every sObject is slow, so the schema database is cached and
+    reused until the org's SourceMember records show a CustomObject or
+    CustomField change. Record counts change all the time, so they are cached
+    apart, briefly, and only fetched when asked for.
+    """
+    key, _counts_key = _org_schema_cache_keys(org)
+    revision = get_schema_revision(org)
+    cached = cache.get(key)
+    if cached is not None and cached["revision"] == revision:
+        with ZippableTempDb() as tempdb:
+            tempdb.tempfile.write_bytes(gzip.decompress(cached["database"]))
+            schema = Schema(tempdb.create_engine(), key, ORG_SCHEMA_FILTERS)
+            schema.included_objects = cached["included_objects"]
+            schema.block_writing()
+            try:
+                if include_counts:
+                    _add_schema_counts(org, sf, schema)
+                yield schema
+            finally:
+                schema.close()
+        return
+
+    with get_org_schema(sf, org_config, filters=ORG_SCHEMA_FILTERS) as schema:
+        with schema.path.open("rb") as f:
+            database = f.read()
+        cache.set(
+            key,
+            {
+                "revision": revision,
+                "database": database,
+                "included_objects": schema.included_objects,
+            },
+            timeout=ORG_SCHEMA_CACHE_TIMEOUT,
+        )
+        if include_counts:
+            _add_schema_counts(org, sf, schema)
+        yield schema
+
+
+@contextlib.contextmanager
+def dataset_env(org: ScratchOrg, *, include_counts=False):
     """
     Yields all configuration objects required by the CumulusCI `Dataset` class
     """
@@ -1361,7 +1885,7 @@ def dataset_env(org: ScratchOrg):
             repo_url=repo.html_url,
             repo_owner=repo.owner.login,
             repo_branch=task.branch_name,
-            repo_commit=repo.branch(task.branch_name).latest_sha(),
+            repo_commit=get_branch_sha(repo, task.branch_name),
         )
         cci = BaseCumulusCI(
             repo_info={
@@ -1375,11 +1899,8 @@ def dataset_env(org: ScratchOrg):
         org_config = org.get_refreshed_org_config(keychain=cci.keychain)
         project_config.keychain = org_config.keychain
         sf = get_simple_salesforce_connection(project_config, org_config)
-        with get_org_schema(
-            sf,
-            org_config,
-            include_counts=True,
-            filters=[Filters.extractable, Filters.createable],
+        with cached_org_schema(
+            org, sf, org_config, include_counts=include_counts
         ) as schema:
             yield project_config, org_config, sf, schema, repo
 
@@ -1396,7 +1917,13 @@ def parse_datasets(*, org: ScratchOrg, user: User):
     dataset_errors = []
     try:
         org.refresh_from_db()
-        with dataset_env(org) as (project_config, org_config, sf, schema, repo):
+        with dataset_env(org, include_counts=True) as (
+            project_config,
+            org_config,
+            sf,
+            schema,
+            repo,
+        ):
             org_schema = get_objs_and_fields_from_org(schema)
 
             project_path = project_config.repo_root
@@ -1482,6 +2009,7 @@ def commit_dataset_from_org(
                     branch=task.branch_name,
                     commit_message=commit_message,
                 )
+                forget_branch_sha(repo, task.branch_name)
                 org.task.has_unmerged_commits = True
                 org.task.finalize_task_update(originating_user_id=user.id)
 
@@ -1547,6 +2075,7 @@ def commit_omnistudio_from_org(
                 branch=task.branch_name,
                 commit_message=commit_message,
             )
+            forget_branch_sha(repo, task.branch_name)
             org.task.has_unmerged_commits = True
             org.task.finalize_task_update(originating_user_id=user.id)
 
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from ...gh import get_etag_cache_stats, reset_etag_cache_stats
+
+
+class Command(BaseCommand):
+    help = "Report how many GitHub GET requests were answered from the ETag cache."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--reset", action="store_true", help="Start counting from zero again."
+        )
+
+    def handle(self, *args, reset=False, **options):
+        stats = get_etag_cache_stats()
+        total = stats["hits"] + stats["misses"]
+        hit_rate = stats["hits"] / total if total else 0
+        self.stdout.write(
+            f"Hits (304 Not Modified): {stats['hits']}\n"
+            f"Misses: {stats['misses']}\n"
+            f"Hit rate: {hit_rate:.1%}"
+        )
+        if reset:
+            reset_etag_cache_stats()
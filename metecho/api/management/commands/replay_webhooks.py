@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ...models import Project, WebhookDelivery
+
+
+class Command(BaseCommand):
+    help = "Replay the stored GitHub webhook deliveries for a project."
+
+    def add_arguments(self, parser):
+        parser.add_argument("repo", help="Repository, as owner/name")
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help=(
+                "Also replay deliveries that were processed successfully, instead "
+                "of only those that failed"
+            ),
+        )
+        parser.add_argument("--event", help="Only replay deliveries of this event")
+
+    def handle(self, *args, **options):
+        repo_owner, _, repo_name = options["repo"].partition("/")
+        project = Project.objects.filter(
+            repo_owner=repo_owner, repo_name=repo_name
+        ).first()
+        if project is None or project.repo_id is None:
+            raise CommandError(f"No such project: {options['repo']}")
+
+        deliveries = WebhookDelivery.objects.filter(
+            payload__repository__id=project.repo_id, processed_at__isnull=False
+        )
+        if not options["all"]:
+            deliveries = deliveries.exclude(error="")
+        if options["event"]:
+            deliveries = deliveries.filter(event=options["event"])
+
+        num = deliveries.update(claimed_at=None, processed_at=None, error="")
+        if num:
+            WebhookDelivery.queue_processing()
+        self.stdout.write(self.style.SUCCESS(f"Queued {num} deliveries for replay."))
@@ -0,0 +1,18 @@
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+
+from ....gh import ETAG_CACHE_HITS_KEY, ETAG_CACHE_MISSES_KEY, get_etag_cache_stats
+
+
+def test_github_etag_cache_stats():
+    cache.set(ETAG_CACHE_HITS_KEY, 3, timeout=None)
+    cache.set(ETAG_CACHE_MISSES_KEY, 1, timeout=None)
+    out = StringIO()
+
+    call_command("github_etag_cache_stats", "--reset", stdout=out)
+
+    assert "Hits (304 Not Modified): 3" in out.getvalue()
+    assert "Hit rate: 75.0%" in out.getvalue()
+    assert get_etag_cache_stats() == {"hits": 0, "misses": 0}
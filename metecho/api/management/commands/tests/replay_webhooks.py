@@ -0,0 +1,104 @@
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.utils.timezone import now
+
+from ....jobs import process_webhook_inbox
+from ....models import WebhookDelivery
+
+
+@pytest.mark.django_db
+class TestReplayWebhooks:
+    def test_no_such_project(self):
+        with pytest.raises(CommandError):
+            call_command("replay_webhooks", "owner/missing")
+
+    def test_replay(self, mocker, project_factory):
+        queue_processing = mocker.patch.object(WebhookDelivery, "queue_processing")
+        project_factory(repo_owner="owner", repo_name="repo", repo_id=123)
+        ok = WebhookDelivery.objects.create(
+            event="push", payload={"repository": {"id": 123}}, processed_at=now()
+        )
+        failed = WebhookDelivery.objects.create(
+            event="push",
+            payload={"repository": {"id": 123}},
+            processed_at=now(),
+            error="Oh no!",
+        )
+        other = WebhookDelivery.objects.create(
+            event="push", payload={"repository": {"id": 456}}, processed_at=now()
+        )
+        out = StringIO()
+
+        call_command("replay_webhooks", "owner/repo", stdout=out)
+
+        assert "Queued 1 deliveries" in out.getvalue()
+        assert queue_processing.called
+        failed.refresh_from_db()
+        assert failed.processed_at is None
+        assert failed.error == ""
+        for delivery in (ok, other):
+            delivery.refresh_from_db()
+            assert delivery.processed_at is not None
+
+    def test_replay__all(self, mocker, project_factory):
+        mocker.patch.object(WebhookDelivery, "queue_processing")
+        project_factory(repo_owner="owner", repo_name="repo", repo_id=123)
+        ok = WebhookDelivery.objects.create(
+            event="push",
+            payload={"repository": {"id": 123}},
+            claimed_at=now(),
+            processed_at=now(),
+        )
+        out = StringIO()
+
+        call_command("replay_webhooks", "owner/repo", "--all", stdout=out)
+
+        assert "Queued 1 deliveries" in out.getvalue()
+        ok.refresh_from_db()
+        assert ok.claimed_at is None
+        assert ok.processed_at is None
+
+    def test_replay__all__keeps_latest_sha(self, mocker, project_factory):
+        mocker.patch("metecho.api.jobs.get_scheduler")
+        mocker.patch("metecho.api.models.gh.get_repo_info")
+        mocker.patch("metecho.api.models.gh.get_branch_sha", return_value="new")
+        mocker.patch.object(WebhookDelivery, "queue_processing")
+        queue_replenish = mocker.patch(
+            "metecho.api.models.Project.queue_replenish_scratch_org_pools"
+        )
+        project = project_factory(
+            repo_owner="owner", repo_name="repo", repo_id=123, latest_sha="new"
+        )
+        project.branches.create(name="main", latest_sha="new")
+        WebhookDelivery.objects.create(
+            event="push",
+            payload={
+                "forced": False,
+                "ref": "refs/heads/main",
+                "before": "older",
+                "after": "old",
+                "repository": {"id": 123},
+                "sender": {},
+                "commits": [
+                    {
+                        "id": "old",
+                        "timestamp": "2019-11-20 21:32:53.668260+00:00",
+                        "author": {},
+                        "message": "Message",
+                        "url": "https://github.com/test/user/foo",
+                    }
+                ],
+            },
+            processed_at=now(),
+        )
+
+        call_command("replay_webhooks", "owner/repo", "--all", stdout=StringIO())
+        process_webhook_inbox()
+
+        project.refresh_from_db()
+        assert project.latest_sha == "new"
+        assert project.branches.get(name="main").latest_sha == "new"
+        assert not queue_replenish.called
@@ -0,0 +1,31 @@
+from django.db import migrations, models
+
+
+def remove_duplicate_collaborations(apps, schema_editor):
+    GitHubCollaboration = apps.get_model("api", "GitHubCollaboration")
+    seen = set()
+    for collaboration in GitHubCollaboration.objects.order_by("-id"):
+        key = (collaboration.project_id, collaboration.user_id)
+        if key in seen:
+            collaboration.delete()
+        else:
+            seen.add(key)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0119_scratchorg_non_source_changes"),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            remove_duplicate_collaborations, migrations.RunPython.noop
+        ),
+        migrations.AddConstraint(
+            model_name="githubcollaboration",
+            constraint=models.UniqueConstraint(
+                fields=("project", "user"), name="unique_project_collaborator"
+            ),
+        ),
+    ]
@@ -0,0 +1,35 @@
+from django.db import migrations, models
+
+
+def remove_duplicate_issues(apps, schema_editor):
+    GitHubIssue = apps.get_model("api", "GitHubIssue")
+    seen = set()
+    # Keep the oldest row, which is the one Epics and Tasks are likely linked to
+    for issue in GitHubIssue.objects.order_by("id"):
+        key = (issue.project_id, issue.github_id)
+        if key in seen:
+            issue.delete()
+        else:
+            seen.add(key)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0120_githubcollaboration_unique_project_collaborator"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="project",
+            name="issues_synced_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(remove_duplicate_issues, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="githubissue",
+            constraint=models.UniqueConstraint(
+                fields=("project", "github_id"), name="unique_project_issue"
+            ),
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0122_webhookdelivery"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="webhookdelivery",
+            name="delivery_id",
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True),
+        ),
+    ]
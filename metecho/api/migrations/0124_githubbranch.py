@@ -0,0 +1,56 @@
+import django.db.models.deletion
+import sfdo_template_helpers.fields.string
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0123_webhookdelivery_delivery_id"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="project",
+            name="branches_synced_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name="GitHubBranch",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=255)),
+                (
+                    "latest_sha",
+                    sfdo_template_helpers.fields.string.StringField(blank=True),
+                ),
+                (
+                    "project",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="branches",
+                        to="api.project",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "GitHub branch",
+                "verbose_name_plural": "GitHub branches",
+                "ordering": ["name"],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="githubbranch",
+            constraint=models.UniqueConstraint(
+                fields=("project", "name"), name="unique_project_branch"
+            ),
+        ),
+    ]
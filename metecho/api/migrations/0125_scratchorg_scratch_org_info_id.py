@@ -0,0 +1,19 @@
+import sfdo_template_helpers.fields.string
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0124_githubbranch"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="scratchorg",
+            name="scratch_org_info_id",
+            field=sfdo_template_helpers.fields.string.StringField(
+                blank=True, default=""
+            ),
+        ),
+    ]
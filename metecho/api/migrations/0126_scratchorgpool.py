@@ -0,0 +1,64 @@
+import django.db.models.deletion
+import sfdo_template_helpers.fields.string
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0125_scratchorg_scratch_org_info_id"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ScratchOrgPool",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("org_config_name", sfdo_template_helpers.fields.string.StringField()),
+                ("size", models.PositiveSmallIntegerField(default=1)),
+                (
+                    "builder",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.PROTECT,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                (
+                    "project",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="scratch_org_pools",
+                        to="api.project",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="scratchorgpool",
+            constraint=models.UniqueConstraint(
+                fields=("project", "org_config_name"),
+                name="unique_project_org_config_pool",
+            ),
+        ),
+        migrations.AddField(
+            model_name="scratchorg",
+            name="pool",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="orgs",
+                to="api.scratchorgpool",
+            ),
+        ),
+    ]
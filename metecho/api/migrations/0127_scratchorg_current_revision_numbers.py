@@ -0,0 +1,26 @@
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0126_scratchorgpool"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="scratchorg",
+            name="current_revision_numbers",
+            field=models.JSONField(
+                blank=True,
+                default=dict,
+                encoder=django.core.serializers.json.DjangoJSONEncoder,
+            ),
+        ),
+        migrations.AddField(
+            model_name="scratchorg",
+            name="max_revision_counter",
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,19 @@
+import sfdo_template_helpers.fields.string
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0127_scratchorg_current_revision_numbers"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="scratchorg",
+            name="api_version",
+            field=sfdo_template_helpers.fields.string.StringField(
+                blank=True, default=""
+            ),
+        ),
+    ]
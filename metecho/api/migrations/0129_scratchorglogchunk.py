@@ -0,0 +1,75 @@
+import zlib
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def forwards(apps, schema_editor):
+    ScratchOrg = apps.get_model("api", "ScratchOrg")
+    ScratchOrgLogChunk = apps.get_model("api", "ScratchOrgLogChunk")
+
+    orgs = ScratchOrg.objects.exclude(cci_log="").only("id", "cci_log")
+    for org in orgs.iterator():
+        content = org.cci_log.encode("utf-8")
+        ScratchOrgLogChunk.objects.create(
+            scratch_org=org, offset=0, size=len(content), data=zlib.compress(content)
+        )
+
+
+def backwards(apps, schema_editor):
+    ScratchOrg = apps.get_model("api", "ScratchOrg")
+    ScratchOrgLogChunk = apps.get_model("api", "ScratchOrgLogChunk")
+
+    logs = {}
+    for chunk in ScratchOrgLogChunk.objects.order_by("offset").iterator():
+        logs.setdefault(chunk.scratch_org_id, []).append(zlib.decompress(chunk.data))
+    for org_id, contents in logs.items():
+        ScratchOrg.objects.filter(id=org_id).update(
+            cci_log=b"".join(contents).decode("utf-8", errors="replace")
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0128_scratchorg_api_version"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ScratchOrgLogChunk",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("offset", models.BigIntegerField()),
+                ("size", models.PositiveIntegerField()),
+                ("data", models.BinaryField()),
+                (
+                    "scratch_org",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="log_chunks",
+                        to="api.scratchorg",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="scratchorglogchunk",
+            constraint=models.UniqueConstraint(
+                fields=("scratch_org", "offset"), name="unique_scratch_org_log_offset"
+            ),
+        ),
+        migrations.RunPython(forwards, backwards),
+        migrations.RemoveField(
+            model_name="scratchorg",
+            name="cci_log",
+        ),
+    ]
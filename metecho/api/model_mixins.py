@@ -82,6 +82,15 @@ class PushMixin:
             include_user=include_user,
         )
 
+    @classmethod
+    def notify_list_changed(cls, *, type_, originating_user_id, message=None):
+        """Notify everyone watching the list of these objects, e.g. of a bulk update."""
+        prepared_message = {"originating_user_id": originating_user_id}
+        prepared_message.update(message or {})
+        async_to_sync(push.push_message_about_list)(
+            cls._meta.model_name, {"type": type_, "payload": prepared_message}
+        )
+
     def notify_changed(
         self,
         *,
@@ -102,6 +111,20 @@ class PushMixin:
             include_user=include_user,
         )
 
+    def notify_progress(self, *, type_, originating_user_id, message=None):
+        """
+        Like `notify_changed`, but only sends this object's id along with
+        `message` instead of serializing it, e.g. for frequent small updates.
+        """
+        prepared_message = {
+            "originating_user_id": originating_user_id,
+            "id": str(self.id),
+        }
+        prepared_message.update(message or {})
+        async_to_sync(push.push_message_about_instance)(
+            self, {"type": type_, "payload": prepared_message}, include_model=False
+        )
+
     def notify_error(self, error, *, type_=None, originating_user_id, message=None):
         prepared_message = {
             "originating_user_id": originating_user_id,
@@ -1,8 +1,9 @@
 import html
 import logging
+import zlib
 from contextlib import suppress
 from datetime import timedelta
-from typing import Any, Iterable, Optional, Tuple
+from typing import Any, Iterable, Iterator, Optional, Tuple
 
 from allauth.account.signals import user_logged_in
 from allauth.socialaccount.models import SocialAccount
@@ -11,6 +12,7 @@ from django.conf import settings
 from django.contrib.auth.models import AbstractUser
 from django.contrib.auth.models import UserManager as BaseUserManager
 from django.contrib.sites.models import Site
+from django.core.cache import cache
 from django.core.exceptions import MultipleObjectsReturned, ValidationError
 from django.core.mail import send_mail
 from django.core.serializers.json import DjangoJSONEncoder
@@ -41,9 +43,14 @@ from .model_mixins import (
     PopulateRepoIdMixin,
     PushMixin,
     SoftDeleteMixin,
+    SoftDeleteQuerySet,
     TimestampsMixin,
 )
-from .sf_run_flow import get_devhub_api, refresh_access_token
+from .sf_run_flow import (
+    ACCESS_TOKEN_REQUEST_LOCK_WAIT,
+    get_devhub_api,
+    refresh_access_token,
+)
 from .validators import validate_unicode_branch
 
 logger = logging.getLogger(__name__)
@@ -120,6 +127,9 @@ class UserManager(BaseUserManager.from_queryset(UserQuerySet)):
 
 
 class User(PushMixin, HashIdMixin, AbstractUser):
+    # How long the result of the Dev Hub check in `is_devhub_enabled` is reused:
+    DEVHUB_ENABLED_CACHE_TIMEOUT = 60 * 60  # 1 hour
+
     objects = UserManager()
     currently_fetching_repos = models.BooleanField(default=False)
     currently_fetching_orgs = models.BooleanField(default=False)
@@ -348,14 +358,18 @@ class User(PushMixin, HashIdMixin, AbstractUser):
         if self.full_org_type in (OrgType.SCRATCH, OrgType.SANDBOX):
             return False
 
-        try:
-            client = get_devhub_api(devhub_username=self.sf_username)
-            resp = client.restful("sobjects/ScratchOrgInfo")
-            if resp:
-                return True
-            return False
-        except (SalesforceError, HTTPError):
-            return False
+        # Otherwise remember the answer across requests for a while:
+        key = f"devhub_enabled_{self.pk}_{self.sf_username}"
+        enabled = cache.get(key)
+        if enabled is None:
+            try:
+                client = get_devhub_api(devhub_username=self.sf_username)
+                resp = client.restful("sobjects/ScratchOrgInfo")
+            except (SalesforceError, HTTPError):
+                return False
+            enabled = bool(resp)
+            cache.set(key, enabled, timeout=self.DEVHUB_ENABLED_CACHE_TIMEOUT)
+        return enabled
 
 
 class ProjectSlug(AbstractSlug):
@@ -378,6 +392,11 @@ class Project(
     name = StringField(unique=True)
     description = MarkdownField(blank=True, property_suffix="_markdown")
     has_truncated_issues = models.BooleanField(default=False)
+    # Latest `updated_at` of the GitHub issues synced so far
+    issues_synced_at = models.DateTimeField(null=True, blank=True)
+    # When `branches` was last rebuilt from GitHub. Webhooks keep it current in
+    # between, and it is rebuilt after GITHUB_BRANCH_INDEX_MAX_AGE
+    branches_synced_at = models.DateTimeField(null=True, blank=True)
     is_managed = models.BooleanField(default=False)
     repo_id = models.IntegerField(null=True, blank=True, unique=True)
     repo_image_url = models.URLField(blank=True)
@@ -440,12 +459,12 @@ class Project(
                     None, repo_owner=self.repo_owner, repo_name=self.repo_name
                 )
                 self.branch_name = repo.default_branch
-                self.latest_sha = repo.branch(repo.default_branch).latest_sha()
+                self.latest_sha = gh.get_branch_sha(repo, repo.default_branch)
             elif not self.latest_sha:
                 repo = gh.get_repo_info(
                     None, repo_owner=self.repo_owner, repo_name=self.repo_name
                 )
-                self.latest_sha = repo.branch(self.branch_name).latest_sha()
+                self.latest_sha = gh.get_branch_sha(repo, self.branch_name)
 
         super().save(*args, **kwargs)
 
@@ -562,20 +581,82 @@ class Project(
         self.notify_changed(originating_user_id=originating_user_id)
 
     @transaction.atomic
-    def add_commits(self, *, commits, ref, sender):
-        if self.branch_name == ref:
+    def add_commits(self, *, commits, ref, sender, is_head=True):
+        # A push that is no longer the head of its branch, e.g. a replayed one,
+        # only brings tasks the commits they don't know yet
+        if self.branch_name == ref and is_head:
             self.latest_sha = commits[0].get("id") if commits else ""
             self.finalize_project_update()
+            self.queue_replenish_scratch_org_pools()
 
-        matching_epics = Epic.objects.filter(branch_name=ref, project=self)
-        for epic in matching_epics:
-            epic.add_commits(commits)
+        if is_head:
+            matching_epics = Epic.objects.filter(branch_name=ref, project=self)
+            for epic in matching_epics:
+                epic.add_commits(commits)
 
-        matching_tasks = Task.objects.filter(
-            Q(branch_name=ref, project=self) | Q(branch_name=ref, epic__project=self)
+        matching_tasks = list(
+            Task.objects.filter(
+                Q(branch_name=ref, project=self)
+                | Q(branch_name=ref, epic__project=self)
+            )
         )
+        comparisons = Task.compare_branches(matching_tasks)
         for task in matching_tasks:
-            task.add_commits(commits, sender)
+            task.add_commits(commits, sender, comparisons)
+
+    def is_branch_head(self, branch_name, sha, *, before="") -> bool:
+        """
+        Whether `sha` is still the head of `branch_name`. A push that moved the
+        branch on from the head we have indexed is taken at its word; otherwise
+        GitHub is asked.
+        """
+        if not sha:
+            return True
+        indexed = self.branches.filter(name=branch_name).values_list(
+            "latest_sha", flat=True
+        )
+        if before and before in indexed:
+            return True
+        repo = gh.get_repo_info(
+            None, repo_owner=self.repo_owner, repo_name=self.repo_name
+        )
+        try:
+            return gh.get_branch_sha(repo, branch_name) == sha
+        except NotFoundError:
+            return False
+
+    def queue_replenish_scratch_org_pools(self):
+        for pool in self.scratch_org_pools.all():
+            pool.queue_replenish()
+
+    @property
+    def branches_are_stale(self) -> bool:
+        return self.branches_synced_at is None or (
+            timezone.now() - self.branches_synced_at
+            > timedelta(seconds=settings.GITHUB_BRANCH_INDEX_MAX_AGE)
+        )
+
+    def refresh_branches(self):
+        """Rebuild the index of this Project's branches from GitHub."""
+        repo = gh.get_repo_info(
+            None, repo_owner=self.repo_owner, repo_name=self.repo_name
+        )
+        branches = [
+            GitHubBranch(project=self, name=branch.name, latest_sha=branch.commit.sha)
+            for branch in repo.branches()
+        ]
+        with transaction.atomic():
+            GitHubBranch.objects.bulk_create(
+                branches,
+                update_conflicts=True,
+                unique_fields=["project", "name"],
+                update_fields=["latest_sha"],
+            )
+            self.branches.exclude(
+                name__in=[branch.name for branch in branches]
+            ).delete()
+            self.branches_synced_at = timezone.now()
+            self.save(update_fields=["branches_synced_at"])
 
     def has_push_permission(self, user: "User | GitHubUser"):
         if hasattr(user, "github_id"):
@@ -649,6 +730,13 @@ class GitHubCollaboration(models.Model):
     user = models.ForeignKey(GitHubUser, on_delete=models.CASCADE)
     permissions = models.JSONField(null=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=("project", "user"), name="unique_project_collaborator"
+            ),
+        ]
+
 
 class GitHubIssue(HashIdMixin):
     github_id = models.PositiveIntegerField(db_index=True)
@@ -668,11 +756,117 @@ class GitHubIssue(HashIdMixin):
         ordering = ["-created_at"]
         verbose_name = "GitHub issue"
         verbose_name_plural = "GitHub issues"
+        constraints = [
+            models.UniqueConstraint(
+                fields=("project", "github_id"), name="unique_project_issue"
+            ),
+        ]
 
     def __str__(self):
         return self.title
 
 
+class GitHubBranch(models.Model):
+    """
+    A branch of a Project's repository. Seeded by `Project.refresh_branches` and
+    kept current from the `create`, `delete` and `push` webhooks.
+    """
+
+    project = models.ForeignKey(
+        Project, related_name="branches", on_delete=models.CASCADE
+    )
+    name = models.CharField(max_length=255)
+    latest_sha = StringField(blank=True)
+
+    class Meta:
+        ordering = ["name"]
+        verbose_name = "GitHub branch"
+        verbose_name_plural = "GitHub branches"
+        constraints = [
+            models.UniqueConstraint(
+                fields=("project", "name"), name="unique_project_branch"
+            ),
+        ]
+
+    def __str__(self):
+        return self.name
+
+
+class WebhookDelivery(models.Model):
+    """
+    A GitHub webhook delivery. Deliveries are stored and acknowledged as they
+    arrive, and processed later in batches by `jobs.process_webhook_inbox`.
+    """
+
+    QUEUED_CACHE_KEY = "webhook_inbox_queued"
+    # How long a queued inbox run blocks queueing another, in case it gets lost
+    QUEUED_CACHE_TIMEOUT = 60 * 10  # 10 minutes
+
+    # The X-GitHub-Delivery header, which GitHub keeps when redelivering
+    delivery_id = models.CharField(max_length=64, null=True, blank=True, unique=True)
+    event = models.CharField(max_length=50)
+    payload = models.JSONField()
+    received_at = models.DateTimeField(auto_now_add=True)
+    # Set when an inbox run takes the delivery on, see `jobs.process_webhook_inbox`
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    error = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ("id",)
+        verbose_name_plural = "webhook deliveries"
+        indexes = [
+            models.Index(
+                fields=("id",),
+                condition=Q(processed_at__isnull=True),
+                name="webhook_delivery_pending",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.event} #{self.pk}"
+
+    @classmethod
+    def receive(cls, *, delivery_id, event, payload) -> Optional["WebhookDelivery"]:
+        """
+        Store a delivery in the inbox and queue it for processing. Returns None if
+        the delivery is a duplicate of one we already received.
+        """
+        if not delivery_id:
+            delivery = cls.objects.create(event=event, payload=payload)
+        else:
+            delivery, created = cls.objects.get_or_create(
+                delivery_id=delivery_id, defaults={"event": event, "payload": payload}
+            )
+            if not created:
+                logger.info(f"Ignoring duplicate webhook delivery {delivery_id}")
+                return None
+        delivery.queue_processing()
+        return delivery
+
+    @classmethod
+    def prune(cls) -> int:
+        """
+        Forget processed deliveries older than the retention window.
+        """
+        cutoff = timezone.now() - timedelta(
+            days=settings.WEBHOOK_DELIVERY_RETENTION_DAYS
+        )
+        count, _ = cls.objects.filter(
+            processed_at__isnull=False, received_at__lt=cutoff
+        ).delete()
+        return count
+
+    @classmethod
+    def queue_processing(cls):
+        from .jobs import process_webhook_inbox_job
+
+        # Deliveries that arrive while a run is already queued will be picked up
+        # by that run, so bursts are processed (and coalesced) together
+        if cache.add(cls.QUEUED_CACHE_KEY, True, timeout=cls.QUEUED_CACHE_TIMEOUT):
+            process_webhook_inbox_job.delay()
+
+
 class EpicSlug(AbstractSlug):
     parent = models.ForeignKey("Epic", on_delete=models.CASCADE, related_name="slugs")
 
@@ -1078,10 +1272,20 @@ class Task(
         )
         self.review_valid = review_valid
 
-    def update_has_unmerged_commits(self):
+    def update_has_unmerged_commits(self, comparisons=None):
+        """
+        `comparisons` can be the result of `gh.compare_branches` for many tasks at
+        once; otherwise the branches of this task are compared on their own.
+        """
         base = self.get_base()
         head = self.get_head()
-        if head and base:
+        if not (head and base):
+            return
+        if comparisons is not None and (base, head) in comparisons:
+            comparison = comparisons[(base, head)]
+        else:
+            # Also where a branch is missing from `comparisons`, which fails here
+            # as it did before batching
             repo = gh.get_repo_info(
                 None,
                 repo_owner=self.root_project.repo_owner,
@@ -1089,9 +1293,24 @@ class Task(
             )
             base_sha = repo.branch(base).commit.sha
             head_sha = repo.branch(head).commit.sha
-            self.has_unmerged_commits = (
-                repo.compare_commits(base_sha, head_sha).ahead_by > 0
-            )
+            comparison = gh.compare_shas(repo, base_sha, head_sha)
+        self.has_unmerged_commits = comparison["ahead_by"] > 0
+
+    @staticmethod
+    def compare_branches(tasks) -> Optional[dict]:
+        """
+        Compare the branches of several tasks of one project in one go, for
+        `update_has_unmerged_commits`.
+        """
+        pairs = [(task.get_base(), task.get_head()) for task in tasks]
+        pairs = [(base, head) for base, head in pairs if base and head]
+        if not pairs:
+            return None
+        project = tasks[0].root_project
+        repo = gh.get_repo_info(
+            None, repo_owner=project.repo_owner, repo_name=project.repo_name
+        )
+        return gh.compare_branches(repo, pairs)
 
     def notify_created(self, originating_user_id=None):
         # Notify all users about the new task
@@ -1147,11 +1366,15 @@ class Task(
             self.save()
             self.notify_changed(originating_user_id=originating_user_id)
 
-    def add_commits(self, commits, sender):
+    def add_commits(self, commits, sender, comparisons=None):
+        # Replayed or redelivered pushes bring commits we already know about
+        known = {commit["id"] for commit in self.commits}
         self.commits = [
-            gh.normalize_commit(c, sender=sender) for c in commits
+            gh.normalize_commit(c, sender=c.get("sender", sender))
+            for c in commits
+            if c["id"] not in known
         ] + self.commits
-        self.update_has_unmerged_commits()
+        self.update_has_unmerged_commits(comparisons)
         self.update_review_valid()
         self.save()
         # This comes from the GitHub hook, and so has no originating user:
@@ -1205,9 +1428,30 @@ class Task(
                 org.queue_delete(originating_user_id=originating_user_id)
 
 
+class ScratchOrgQuerySet(SoftDeleteQuerySet):
+    def light(self, *fields):
+        """
+        Defer loading the columns in `ScratchOrg.heavy_fields`, except those in
+        `fields`, for callers that don't read them (or read only a few).
+        """
+        return self.defer(*(f for f in self.model.heavy_fields if f not in fields))
+
+
 class ScratchOrg(
     SoftDeleteMixin, PushMixin, HashIdMixin, TimestampsMixin, models.Model
 ):
+    # JSON columns that can grow to megabytes, see `ScratchOrgQuerySet.light`
+    heavy_fields = (
+        "config",
+        "latest_revision_numbers",
+        "current_revision_numbers",
+        "unsaved_changes",
+        "ignored_changes",
+        "non_source_changes",
+        "installed_packages",
+        "valid_target_directories",
+    )
+
     project = models.ForeignKey(
         Project,
         on_delete=models.PROTECT,
@@ -1252,6 +1496,14 @@ class ScratchOrg(
     latest_revision_numbers = models.JSONField(
         default=dict, encoder=DjangoJSONEncoder, blank=True
     )
+    # The org's SourceMember revisions as of `max_revision_counter`, see
+    # `sf_org_changes.get_latest_revision_numbers`
+    current_revision_numbers = models.JSONField(
+        default=dict, encoder=DjangoJSONEncoder, blank=True
+    )
+    max_revision_counter = models.BigIntegerField(default=0)
+    # The project's API version when the org was built
+    api_version = StringField(blank=True, default="")
     currently_refreshing_changes = models.BooleanField(default=False)
     currently_retrieving_metadata = models.BooleanField(default=False)
     currently_parsing_datasets = models.BooleanField(default=False)
@@ -1268,7 +1520,19 @@ class ScratchOrg(
     valid_target_directories = models.JSONField(
         default=dict, encoder=DjangoJSONEncoder, blank=True
     )
-    cci_log = models.TextField(blank=True)
+    # The ScratchOrgInfo record Salesforce builds the org from, see
+    # `jobs.poll_scratch_org_creation`
+    scratch_org_info_id = StringField(blank=True, default="")
+    # Set while the org waits in a pool to be claimed, see `ScratchOrgPool`
+    pool = models.ForeignKey(
+        "ScratchOrgPool",
+        on_delete=models.SET_NULL,
+        related_name="orgs",
+        null=True,
+        blank=True,
+    )
+
+    objects = ScratchOrgQuerySet.as_manager()
 
     def _build_message_extras(self):
         return {
@@ -1324,7 +1588,8 @@ class ScratchOrg(
 
         if is_new and self.owner:
             self.queue_provision(originating_user_id=str(self.owner.id))
-            self.notify_org_provisioning(originating_user_id=str(self.owner.id))
+            if self.pool_id is None:
+                self.notify_org_provisioning(originating_user_id=str(self.owner.id))
 
         return ret
 
@@ -1348,17 +1613,73 @@ class ScratchOrg(
         self.save()
         self.notify_changed(originating_user_id=originating_user_id)
 
-    def get_refreshed_org_config(self, org_name=None, keychain=None):
+    @property
+    def log_size(self) -> int:
+        """Length of the build log, in bytes."""
+        last = self.log_chunks.order_by("-offset").only("offset", "size").first()
+        return last.offset + last.size if last else 0
+
+    def append_log(self, text: str):
+        content = text.encode("utf-8")
+        if content:
+            self.log_chunks.create(
+                offset=self.log_size, size=len(content), data=zlib.compress(content)
+            )
+
+    def clear_log(self):
+        self.log_chunks.all().delete()
+
+    def read_log(self, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+        """
+        Yield the build log from byte `start` up to byte `end` (exclusive),
+        decompressing only the chunks that overlap that range.
+        """
+        chunks = self.log_chunks.annotate(
+            end=models.F("offset") + models.F("size")
+        ).filter(end__gt=start)
+        if end is not None:
+            chunks = chunks.filter(offset__lt=end)
+        for chunk in chunks.order_by("offset").iterator():
+            content = zlib.decompress(chunk.data)
+            yield content[
+                max(start - chunk.offset, 0) : (
+                    None if end is None else end - chunk.offset
+                )
+            ]
+
+    def tail_log_offset(self, lines: int) -> int:
+        """The byte offset at which the last `lines` lines of the build log start."""
+        size = self.log_size
+        for chunk in self.log_chunks.order_by("-offset").iterator():
+            content = zlib.decompress(chunk.data)
+            end = len(content)
+            # A newline ending the log doesn't start another line
+            if chunk.offset + end == size and content.endswith(b"\n"):
+                end -= 1
+            while lines:
+                end = content.rfind(b"\n", 0, end)
+                if end == -1:
+                    break
+                lines -= 1
+            else:
+                return chunk.offset + end + 1
+        return 0
+
+    def get_refreshed_org_config(self, org_name=None, keychain=None, lock_wait=None):
         org_config = refresh_access_token(
             scratch_org=self,
             config=self.config,
             org_name=org_name or self.org_config_name,
             keychain=keychain,
+            lock_wait=lock_wait,
         )
         return org_config
 
     def get_login_url(self):
-        org_config = self.get_refreshed_org_config()
+        # This serves a web request, so don't keep it waiting on another refresh
+        org_config = self.get_refreshed_org_config(
+            lock_wait=ACCESS_TOKEN_REQUEST_LOCK_WAIT
+        )
         return org_config.start_url
 
     # begin PushMixin configuration:
@@ -1414,6 +1735,9 @@ class ScratchOrg(
         )
 
     def finalize_provision(self, *, error=None, originating_user_id):
+        if self.pool_id is not None:
+            self.finalize_pool_provision(error=error)
+            return
         if error is None:
             self.save()
             self.notify_changed(
@@ -1435,6 +1759,16 @@ class ScratchOrg(
             else:
                 self.delete(originating_user_id=originating_user_id)
 
+    def finalize_pool_provision(self, *, error=None):
+        # Nobody is waiting on a pooled org, so there is no one to notify
+        if error is None:
+            self.save()
+            self.pool.queue_replenish()
+        elif self.url:
+            self.queue_delete(originating_user_id=None)
+        else:
+            self.delete()
+
     def queue_convert_to_dev_org(self, task, *, originating_user_id=None):
         from .jobs import convert_to_dev_org_job
 
@@ -1480,6 +1814,55 @@ class ScratchOrg(
 
         get_unsaved_changes_job.delay(self, originating_user_id=originating_user_id)
 
+    @classmethod
+    def queue_get_unsaved_changes_for(
+        cls, orgs, *, force_get=False, originating_user_id
+    ):
+        """
+        Like `queue_get_unsaved_changes`, but for many orgs with a job per
+        UNSAVED_CHANGES_BATCH_SIZE orgs and a single notification. Orgs already
+        being refreshed are skipped, unless the refresh started longer than
+        MAXIMUM_JOB_LENGTH ago and its job must have died.
+        """
+        from .jobs import get_unsaved_changes_for_orgs_job
+
+        orgs = cls.objects.filter(id__in=[org.id for org in orgs]).filter(
+            Q(currently_refreshing_changes=False)
+            | Q(
+                edited_at__lt=timezone.now()
+                - timedelta(seconds=settings.MAXIMUM_JOB_LENGTH)
+            )
+        )
+        if not force_get:
+            orgs = orgs.filter(
+                Q(last_checked_unsaved_changes_at__isnull=True)
+                | Q(
+                    last_checked_unsaved_changes_at__lt=timezone.now()
+                    - timedelta(minutes=settings.ORG_RECHECK_MINUTES)
+                )
+            )
+        with transaction.atomic():
+            # Rows locked by a concurrent request are that request's to refresh
+            ids = list(
+                orgs.select_for_update(skip_locked=True).values_list("id", flat=True)
+            )
+            if not ids:
+                return []
+            cls.objects.filter(id__in=ids).update(
+                currently_refreshing_changes=True, edited_at=timezone.now()
+            )
+        cls.notify_list_changed(
+            type_="SCRATCH_ORGS_FETCH_CHANGES",
+            originating_user_id=originating_user_id,
+            message={"ids": [str(id_) for id_ in ids]},
+        )
+        batch_size = settings.UNSAVED_CHANGES_BATCH_SIZE
+        for i in range(0, len(ids), batch_size):
+            get_unsaved_changes_for_orgs_job.delay(
+                ids[i : i + batch_size], originating_user_id=originating_user_id
+            )
+        return ids
+
     def finalize_get_unsaved_changes(self, *, error=None, originating_user_id):
         self.currently_refreshing_changes = False
         if error is None:
@@ -1761,6 +2144,63 @@ class ScratchOrg(
             )
 
 
+class ScratchOrgLogChunk(models.Model):
+    """
+    A zlib-compressed piece of a ScratchOrg's build log, kept out of the
+    ScratchOrg table so that fetching an org doesn't load its log. `offset` and
+    `size` are the piece's position and length in the uncompressed log, in bytes.
+    """
+
+    scratch_org = models.ForeignKey(
+        ScratchOrg, on_delete=models.CASCADE, related_name="log_chunks"
+    )
+    offset = models.BigIntegerField()
+    size = models.PositiveIntegerField()
+    data = models.BinaryField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=("scratch_org", "offset"), name="unique_scratch_org_log_offset"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.scratch_org}: {self.offset}+{self.size}"
+
+
+class ScratchOrgPool(models.Model):
+    """
+    Playground orgs built ahead of time from the latest commit of a Project's
+    branch, so that requesting an org for the same commit doesn't have to wait
+    for Salesforce to build one.
+    """
+
+    project = models.ForeignKey(
+        Project, on_delete=models.CASCADE, related_name="scratch_org_pools"
+    )
+    org_config_name = StringField()
+    size = models.PositiveSmallIntegerField(default=1)
+    # The orgs are built with this user's GitHub and Dev Hub access
+    builder = models.ForeignKey(User, on_delete=models.PROTECT, related_name="+")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=("project", "org_config_name"),
+                name="unique_project_org_config_pool",
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.project}: {self.org_config_name}"
+
+    def queue_replenish(self):
+        from .jobs import replenish_scratch_org_pool_job
+
+        replenish_scratch_org_pool_job.delay(self)
+
+
 @receiver(user_logged_in)
 def user_logged_in_handler(sender, *, user, **kwargs):
     user.queue_refresh_repositories()
@@ -40,6 +40,7 @@ Websocket notifications you can subscribe to:
     scratchorg.:id
         SCRATCH_ORG_PROVISION
         SCRATCH_ORG_PROVISION_FAILED
+        SCRATCH_ORG_FLOW_PROGRESS
         SCRATCH_ORG_UPDATE
         SCRATCH_ORG_ERROR
         SCRATCH_ORG_FETCH_CHANGES_FAILED
@@ -62,6 +63,7 @@ Websocket notifications you can subscribe to:
 
     scratchorg.list
         SCRATCH_ORG_RECREATE
+        SCRATCH_ORGS_FETCH_CHANGES
 """
 
 from copy import deepcopy
@@ -78,7 +80,12 @@ from .constants import CHANNELS_GROUP_NAME, LIST
 
 
 async def push_message_about_instance(
-    instance, message, for_list=False, group_name=None, include_user=False
+    instance,
+    message,
+    for_list=False,
+    group_name=None,
+    include_user=False,
+    include_model=True,
 ):
     model_name = instance._meta.model_name
     id_ = str(instance.id)
@@ -91,6 +98,8 @@ async def push_message_about_instance(
     new_message["model_name"] = model_name
     new_message["id"] = id_
     new_message["include_user"] = include_user
+    if not include_model:
+        new_message["include_model"] = False
     sent_message = {"type": "notify", "content": new_message}
     not_deleted = getattr(instance, "deleted_at", None) is None
     message_about_delete = "DELETE" in message["type"] or "REMOVE" in message["type"]
@@ -99,6 +108,23 @@ async def push_message_about_instance(
         await channel_layer.group_send(group_name, sent_message)
 
 
+async def push_message_about_list(model_name, message):
+    """
+    Send `message` to everyone subscribed to the list of `model_name` objects. It
+    is about several objects at once, so it carries no serialized model.
+    """
+    channel_layer = get_channel_layer()
+    new_message = deepcopy(message)
+    new_message["model_name"] = model_name
+    new_message["id"] = LIST
+    new_message["include_user"] = False
+    sent_message = {"type": "notify", "content": new_message}
+    if await get_set_message_semaphore(channel_layer, sent_message):
+        await channel_layer.group_send(
+            CHANNELS_GROUP_NAME.format(model=model_name, id=LIST), sent_message
+        )
+
+
 async def report_error(user):
     message = {
         "type": "BACKEND_ERROR",
@@ -347,8 +347,10 @@ class ProjectCreateSerializer(serializers.ModelSerializer):
 
         for stub in user_stubs:
             user, _ = GitHubUser.objects.get_or_create(id=stub["id"], defaults=stub)
-            GitHubCollaboration.objects.create(
-                project=project, user=user, permissions={"push": True, "pull": True}
+            GitHubCollaboration.objects.get_or_create(
+                project=project,
+                user=user,
+                defaults={"permissions": {"push": True, "pull": True}},
             )
 
         return project
@@ -1010,6 +1012,16 @@ class ScratchOrgSerializer(HashIdModelSerializer):
     )
     valid_target_directories = serializers.SerializerMethodField()
 
+    # The columns in `ScratchOrg.heavy_fields` that this serializer reads, so
+    # querysets for it can be `.light(*ScratchOrgSerializer.heavy_fields)`
+    heavy_fields = (
+        "unsaved_changes",
+        "ignored_changes",
+        "non_source_changes",
+        "installed_packages",
+        "valid_target_directories",
+    )
+
     class Meta:
         model = ScratchOrg
         fields = (
@@ -1122,7 +1134,9 @@ class ScratchOrgSerializer(HashIdModelSerializer):
 
     def validate(self, data):
         if not self.instance:
-            orgs = ScratchOrg.objects.active().filter(org_type=data["org_type"])
+            orgs = ScratchOrg.objects.active().filter(
+                org_type=data["org_type"], pool__isnull=True
+            )
             if data["org_type"] == ScratchOrgType.PLAYGROUND:
                 orgs = orgs.filter(
                     owner=data.get("owner", self.context["request"].user)
@@ -1157,6 +1171,13 @@ class ListMetadataSerializer(serializers.Serializer):
     desired_type = serializers.CharField()
 
 
+class ScratchOrgLogSerializer(serializers.Serializer):
+    # Byte offset to read the log from, e.g. the `X-Log-Size` of a previous read
+    offset = serializers.IntegerField(min_value=0, required=False)
+    # Number of lines to read from the end of the log
+    tail = serializers.IntegerField(min_value=0, required=False)
+
+
 class CommitDatasetSerializer(serializers.Serializer):
     commit_message = serializers.CharField()
     dataset_name = serializers.CharField()
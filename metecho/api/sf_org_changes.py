@@ -2,17 +2,34 @@ import json
 import os
 import pathlib
 from collections import defaultdict
+from typing import List
 
+import requests
 import simple_salesforce
 from cumulusci.core.runtime import BaseCumulusCI
 from cumulusci.tasks.github.util import CommitDir
 from cumulusci.tasks.salesforce.sourcetracking import retrieve_components
 from django.conf import settings
+from django.core.cache import cache
 
 from .custom_cci_configs import MetechoUniversalConfig
-from .gh import get_repo_info, get_source_format, local_github_checkout
+from .gh import (
+    forget_branch_sha,
+    get_branch_sha,
+    get_repo_info,
+    get_source_format,
+    local_github_checkout,
+)
 from .sf_run_flow import refresh_access_token
 
+NONSOURCE_TYPES_CACHE_TIMEOUT = 60 * 60 * 24 * 7  # 1 week
+# The Metadata Coverage Report, as read by CumulusCI's ListNonSourceTrackable
+METADATA_COVERAGE_URL = (
+    "https://dx-extended-coverage.my.salesforce-sites.com"
+    "/services/apexrest/report?version={api_version}"
+)
+METADATA_COVERAGE_TIMEOUT = 30  # seconds
+
 
 def get_valid_target_directories(user, scratch_org, repo_root):
     """
@@ -30,7 +47,7 @@ def get_valid_target_directories(user, scratch_org, repo_root):
         repo_url=repo.html_url,
         repo_owner=repo.owner.login,
         repo_branch=parent.branch_name,
-        repo_commit=repo.branch(parent.branch_name).latest_sha(),
+        repo_commit=get_branch_sha(repo, parent.branch_name),
     )
     sfdx = source_format == "sfdx"
     if sfdx:
@@ -172,6 +189,7 @@ def commit_changes_to_github(
         CommitDir(repo, author=author)(
             local_dir, branch, repo_dir=target_directory, commit_message=commit_message
         )
+        forget_branch_sha(repo, branch)
 
 
 def get_salesforce_connection(*, scratch_org, originating_user_id, base_url=""):
@@ -197,6 +215,14 @@ def get_salesforce_connection(*, scratch_org, originating_user_id, base_url=""):
 
 
 def get_latest_revision_numbers(scratch_org, *, originating_user_id):
+    """
+    Bring `scratch_org.current_revision_numbers` up to date and return a copy of
+    it, which callers are free to store or mutate.
+
+    Only the SourceMember records changed since the highest RevisionCounter seen
+    so far are fetched and merged in. The caller is responsible for saving the
+    org.
+    """
     conn = get_salesforce_connection(
         scratch_org=scratch_org,
         base_url="tooling/",
@@ -206,18 +232,73 @@ def get_latest_revision_numbers(scratch_org, *, originating_user_id):
     # Store the results here on the org, and if any of these are > number than earlier
     # version, there are changes.
     # We need to run this right after the setup flow and store that as initial state.
+    max_revision_counter = scratch_org.max_revision_counter
     records = conn.query_all(
-        "SELECT MemberName, MemberType, RevisionCounter FROM SourceMember "
-        "WHERE IsNameObsolete=false"
+        "SELECT MemberName, MemberType, RevisionCounter, IsNameObsolete "
+        f"FROM SourceMember WHERE RevisionCounter > {max_revision_counter:d}"
     ).get("records", [])
 
-    record_dict = defaultdict(lambda: defaultdict(dict))
+    revision_numbers = scratch_org.current_revision_numbers
     for record in records:
-        record_dict[record["MemberType"]][record["MemberName"]] = record[
-            "RevisionCounter"
-        ]
+        member_type = record["MemberType"]
+        members = revision_numbers.setdefault(member_type, {})
+        if record["IsNameObsolete"]:
+            members.pop(record["MemberName"], None)
+            if not members:
+                del revision_numbers[member_type]
+        else:
+            members[record["MemberName"]] = record["RevisionCounter"]
+        max_revision_counter = max(max_revision_counter, record["RevisionCounter"])
+
+    scratch_org.max_revision_counter = max_revision_counter
+    return {
+        member_type: dict(members) for member_type, members in revision_numbers.items()
+    }
+
+
+def get_schema_revision(scratch_org, *, originating_user_id=None) -> int:
+    """
+    The latest RevisionCounter among the org's CustomObject and CustomField
+    SourceMember records, which moves whenever the org's schema changes.
+    """
+    conn = get_salesforce_connection(
+        scratch_org=scratch_org,
+        base_url="tooling/",
+        originating_user_id=originating_user_id,
+    )
+    records = conn.query(
+        "SELECT RevisionCounter FROM SourceMember "
+        "WHERE MemberType IN ('CustomObject', 'CustomField') "
+        "ORDER BY RevisionCounter DESC LIMIT 1"
+    ).get("records", [])
+    return records[0]["RevisionCounter"] if records else 0
+
 
-    return {k: dict(v) for k, v in record_dict.items()}
+def get_nonsource_types(api_version: str) -> List[str]:
+    """
+    The metadata types that the Metadata API supports but source tracking
+    doesn't, at `api_version`. They depend on nothing else, so they are cached
+    for all orgs.
+    """
+    api_version = api_version or MetechoUniversalConfig().project__package__api_version
+    key = f"nonsource_types_{api_version}"
+    types = cache.get(key)
+    if types is None:
+        response = requests.get(
+            METADATA_COVERAGE_URL.format(api_version=api_version),
+            timeout=METADATA_COVERAGE_TIMEOUT,
+        )
+        response.raise_for_status()
+        types = []
+        for md_type, details in response.json()["types"].items():
+            channels = details["channels"]
+            if not channels:
+                raise ValueError(f"API version {api_version} is not supported")
+            if channels["sourceTracking"] is False and channels["metadataApi"] is True:
+                types.append(md_type)
+        types.sort()
+        cache.set(key, types, timeout=NONSOURCE_TYPES_CACHE_TIMEOUT)
+    return types
 
 
 def compare_revisions(old_revision, new_revision):
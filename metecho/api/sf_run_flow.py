@@ -2,20 +2,28 @@ import contextlib
 import json
 import logging
 import os
+import re
 import shutil
 import subprocess
 import time
 from datetime import datetime
+from typing import Callable, Optional, Tuple
 
+from cryptography.fernet import InvalidToken
 from cumulusci.core.config import OrgConfig, TaskConfig
 from cumulusci.core.runtime import BaseCumulusCI
 from cumulusci.oauth.client import OAuth2Client, OAuth2ClientConfig
 from cumulusci.oauth.salesforce import jwt_session
 from cumulusci.tasks.salesforce.org_settings import DeployOrgSettings
 from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
 from django.utils.translation import gettext_lazy as _
 from django_rq import get_scheduler
+from requests import Session
+from requests.adapters import HTTPAdapter
 from rq import get_current_job
+from sfdo_template_helpers.crypto import fernet_decrypt, fernet_encrypt
 from simple_salesforce import Salesforce as SimpleSalesforce
 
 from metecho.exceptions import SubcommandException
@@ -32,6 +40,35 @@ SFDX_SIGNUP_INSTANCE = settings.SFDX_SIGNUP_INSTANCE
 
 DURATION_DAYS = 30
 
+# How long a caller waits for another one that is refreshing the same org's
+# access token, before refreshing it on its own:
+ACCESS_TOKEN_LOCK_TIMEOUT = 30  # seconds
+ACCESS_TOKEN_POLL_INTERVAL = 0.25  # seconds
+# How long callers serving a web request wait for another caller's refresh:
+ACCESS_TOKEN_REQUEST_LOCK_WAIT = 2  # seconds
+# Salesforce builds a scratch org in 2-10 minutes, which we check on after this
+# many seconds, then less and less often:
+SCRATCH_ORG_POLL_INITIAL_DELAY = 10
+SCRATCH_ORG_POLL_MAX_DELAY = 60
+SCRATCH_ORG_POLL_BACKOFF = 1.5
+# Dev Hub sessions are reused for this long, which is below the shortest
+# session timeout Salesforce allows:
+DEVHUB_SESSION_TIMEOUT = 60 * 10  # 10 minutes
+DEVHUB_SESSION_CACHE_SIZE = 256
+
+# Dev Hub sessions of this process, by username, see get_devhub_session():
+_devhub_sessions = {}
+# One connection pool for all Dev Hub API clients of this process:
+_devhub_adapter = HTTPAdapter()
+
+# What `cci flow run` prints as it goes through the steps of a flow, see
+# parse_flow_event():
+FLOW_EVENT_PATTERNS = (
+    (re.compile(r"Running task: (\S+)"), "started"),
+    (re.compile(r"Skipping task:? (\S+)"), "skipped"),
+    (re.compile(r"Completed flow .*successfully"), "completed"),
+)
+
 # Deploy org settings metadata -- this should get moved into CumulusCI
 SETTINGS_XML_t = """<?xml version="1.0" encoding="UTF-8"?>
 <{settingsName} xmlns="http://soap.sforce.com/2006/04/metadata">
@@ -110,6 +147,36 @@ def is_org_good(org):
         return False
 
 
+def access_token_cache_key(scratch_org) -> str:
+    return f"sf_access_token_{scratch_org.pk}"
+
+
+def get_cached_access_token(scratch_org) -> dict | None:
+    """
+    Get the org config values that the last token refresh of `scratch_org` set,
+    if they haven't expired yet.
+    """
+    cached = cache.get(access_token_cache_key(scratch_org))
+    if cached is None:
+        return None
+    try:
+        return json.loads(fernet_decrypt(cached))
+    except InvalidToken:  # The encryption key changed
+        return None
+
+
+def forget_access_token(scratch_org):
+    cache.delete(access_token_cache_key(scratch_org))
+
+
+def _refresh_oauth_token(config, org_name, keychain):
+    original = dict(config)
+    org_config = OrgConfig(config, org_name, keychain=keychain)
+    org_config.refresh_oauth_token(keychain, is_sandbox=True)
+    info = {k: v for k, v in org_config.config.items() if original.get(k) != v}
+    return org_config, info
+
+
 def refresh_access_token(
     *,
     scratch_org,
@@ -117,18 +184,123 @@ def refresh_access_token(
     org_name,
     keychain=None,
     originating_user_id=None,
+    lock_wait=None,
 ):
     """
     Construct a new OrgConfig because ScratchOrgConfig tries to use sfdx
     which we don't want now -- this is a total hack which I'll try to
     smooth over with some improvements in CumulusCI
+
+    The values the refresh sets are cached, encrypted, per scratch org, and only
+    one caller at a time refreshes the token of a given org; the others wait for
+    it and use its result. After `lock_wait` seconds (by default as long as the
+    lock is held) they stop waiting and refresh the token themselves.
     """
     with delete_org_on_error(
         scratch_org=scratch_org, originating_user_id=originating_user_id
     ):
-        org_config = OrgConfig(config, org_name, keychain=keychain)
-        org_config.refresh_oauth_token(keychain, is_sandbox=True)
-        return org_config
+        if scratch_org is None or scratch_org.pk is None:
+            org_config, _info = _refresh_oauth_token(config, org_name, keychain)
+            return org_config
+
+        lock_key = f"{access_token_cache_key(scratch_org)}_lock"
+        if lock_wait is None:
+            lock_wait = ACCESS_TOKEN_LOCK_TIMEOUT
+        deadline = time.monotonic() + lock_wait
+        while True:
+            info = get_cached_access_token(scratch_org)
+            if info is not None:
+                org_config = OrgConfig(config, org_name, keychain=keychain)
+                org_config.config.update(info)
+                return org_config
+            locked = cache.add(lock_key, True, timeout=ACCESS_TOKEN_LOCK_TIMEOUT)
+            if locked or time.monotonic() > deadline:
+                break
+            time.sleep(ACCESS_TOKEN_POLL_INTERVAL)
+
+        try:
+            org_config, info = _refresh_oauth_token(config, org_name, keychain)
+            cache.set(
+                access_token_cache_key(scratch_org),
+                fernet_encrypt(json.dumps(info, cls=DjangoJSONEncoder)),
+                timeout=settings.SF_ACCESS_TOKEN_CACHE_TIMEOUT,
+            )
+            return org_config
+        finally:
+            if locked:
+                cache.delete(lock_key)
+
+
+def devhub_session_cache_key(devhub_username) -> str:
+    return f"sf_devhub_session_{devhub_username}"
+
+
+def get_devhub_session(devhub_username) -> dict:
+    """
+    Get the `instance_url` and `access_token` of a session for the specified dev
+    hub username. Sessions are shared through this process and the cache, and
+    only exchanged for new ones when they near their expiry.
+    """
+    now = time.time()
+    session = _devhub_sessions.get(devhub_username)
+    if session is None or session["expires_at"] <= now:
+        cached = cache.get(devhub_session_cache_key(devhub_username))
+        try:
+            session = json.loads(fernet_decrypt(cached)) if cached else None
+        except InvalidToken:  # The encryption key changed
+            session = None
+    if session is None or session["expires_at"] <= now:
+        jwt = jwt_session(SF_CLIENT_ID, SF_CLIENT_KEY, devhub_username)
+        session = {
+            "instance_url": jwt["instance_url"],
+            "access_token": jwt["access_token"],
+            "expires_at": now + DEVHUB_SESSION_TIMEOUT,
+        }
+        cache.set(
+            devhub_session_cache_key(devhub_username),
+            fernet_encrypt(json.dumps(session)),
+            timeout=DEVHUB_SESSION_TIMEOUT,
+        )
+    if (
+        devhub_username not in _devhub_sessions
+        and len(_devhub_sessions) >= DEVHUB_SESSION_CACHE_SIZE
+    ):
+        _devhub_sessions.pop(next(iter(_devhub_sessions)))
+    _devhub_sessions[devhub_username] = session
+    return session
+
+
+def forget_devhub_session(devhub_username):
+    _devhub_sessions.pop(devhub_username, None)
+    cache.delete(devhub_session_cache_key(devhub_username))
+
+
+class DevhubHTTPSession(Session):
+    """
+    The HTTP session of a Dev Hub API client. When Salesforce rejects the Dev Hub
+    session it uses, because it expired or was revoked before
+    DEVHUB_SESSION_TIMEOUT, it gets a new one and retries the request once.
+    """
+
+    def __init__(self, devhub_username):
+        super().__init__()
+        self.devhub_username = devhub_username
+        self.api = None
+        self.mount("https://", _devhub_adapter)
+
+    def request(self, method, url, *args, headers=None, **kwargs):
+        response = super().request(method, url, *args, headers=headers, **kwargs)
+        if response.status_code != 401 or not headers:
+            return response
+
+        forget_devhub_session(self.devhub_username)
+        session = get_devhub_session(self.devhub_username)
+        authorization = f"Bearer {session['access_token']}"
+        if self.api is not None:
+            self.api.session_id = session["access_token"]
+            self.api.headers["Authorization"] = authorization
+        headers = {**headers, "Authorization": authorization}
+        return super().request(method, url, *args, headers=headers, **kwargs)
 
 
 def get_devhub_api(*, devhub_username, scratch_org=None) -> SimpleSalesforce:
@@ -138,13 +310,16 @@ def get_devhub_api(*, devhub_username, scratch_org=None) -> SimpleSalesforce:
     via an interactive login flow, such as the django-allauth login.
     """
     with delete_org_on_error(scratch_org=scratch_org):
-        jwt = jwt_session(SF_CLIENT_ID, SF_CLIENT_KEY, devhub_username)
-        return SimpleSalesforce(
-            instance_url=jwt["instance_url"],
-            session_id=jwt["access_token"],
+        session = get_devhub_session(devhub_username)
+        http = DevhubHTTPSession(devhub_username)
+        http.api = SimpleSalesforce(
+            instance_url=session["instance_url"],
+            session_id=session["access_token"],
             client_id="Metecho",
             version="49.0",
+            session=http,
         )
+        return http.api
 
 
 def get_org_details(*, cci, org_name, project_path):
@@ -226,21 +401,20 @@ def get_org_result(
     return devhub_api.ScratchOrgInfo.get(response["id"])
 
 
-def poll_for_scratch_org_completion(devhub_api, org_result):
-    total_time_waiting = 0
-    # Don't allow waiting more than the default job timeout.
-    while (
-        org_result["Status"] in ["New", "Creating"]
-        and total_time_waiting < settings.MAXIMUM_JOB_LENGTH
-    ):
-        time.sleep(10)
-        total_time_waiting += 10
-        org_result = devhub_api.ScratchOrgInfo.get(org_result["Id"])
-
+def check_org_creation(*, scratch_org, devhub_username):
+    """
+    Get the ScratchOrgInfo of a scratch org that is being created, once it is
+    Active. Returns None while Salesforce is still building the org.
+    """
+    devhub_api = get_devhub_api(
+        devhub_username=devhub_username, scratch_org=scratch_org
+    )
+    org_result = devhub_api.ScratchOrgInfo.get(scratch_org.scratch_org_info_id)
+    if org_result["Status"] in ["New", "Creating"]:
+        return None
     if org_result["Status"] != "Active":
-        error = org_result["ErrorCode"] or _("Org creation timed out")
+        error = org_result["ErrorCode"] or _("Org creation failed")
         raise ScratchOrgError(f"Scratch org creation failed: {error}")
-
     return org_result
 
 
@@ -308,7 +482,19 @@ def deploy_org_settings(
     return org_config
 
 
-def create_org(
+def get_cci(*, repo_owner, repo_name, repo_url, repo_branch, project_path):
+    return BaseCumulusCI(
+        repo_info={
+            "root": project_path,
+            "url": repo_url,
+            "name": repo_name,
+            "owner": repo_owner,
+            "commit": repo_branch,
+        }
+    )
+
+
+def start_org_creation(
     *,
     repo_owner,
     repo_name,
@@ -318,21 +504,22 @@ def create_org(
     project_path,
     scratch_org,
     org_name,
-    originating_user_id,
     sf_username=None,
 ):
-    """Create a new scratch org"""
+    """
+    Ask the Dev Hub for a new scratch org, and return the id of its
+    ScratchOrgInfo. Salesforce builds the org in the background, see
+    `check_org_creation` and `finish_org_creation`.
+    """
     devhub_username = sf_username or user.sf_username
     email = user.email  # TODO: check that this is reliably right.
 
-    cci = BaseCumulusCI(
-        repo_info={
-            "root": project_path,
-            "url": repo_url,
-            "name": repo_name,
-            "owner": repo_owner,
-            "commit": repo_branch,
-        }
+    cci = get_cci(
+        repo_owner=repo_owner,
+        repo_name=repo_name,
+        repo_url=repo_url,
+        repo_branch=repo_branch,
+        project_path=project_path,
     )
     devhub_api = get_devhub_api(
         devhub_username=devhub_username, scratch_org=scratch_org
@@ -350,7 +537,35 @@ def create_org(
         cci=cci,
         devhub_api=devhub_api,
     )
-    org_result = poll_for_scratch_org_completion(devhub_api, org_result)
+    return org_result["Id"]
+
+
+def finish_org_creation(
+    *,
+    repo_owner,
+    repo_name,
+    repo_url,
+    repo_branch,
+    user,
+    project_path,
+    scratch_org,
+    org_name,
+    org_result,
+    originating_user_id,
+):
+    """Set up a scratch org that has become Active"""
+    email = user.email
+
+    cci = get_cci(
+        repo_owner=repo_owner,
+        repo_name=repo_name,
+        repo_url=repo_url,
+        repo_branch=repo_branch,
+        project_path=project_path,
+    )
+    scratch_org_config, _definition = get_org_details(
+        cci=cci, org_name=org_name, project_path=project_path
+    )
     mutate_scratch_org(
         scratch_org_config=scratch_org_config, org_result=org_result, email=email
     )
@@ -366,8 +581,31 @@ def create_org(
     return (scratch_org_config, cci, org_config)
 
 
-def run_flow(*, cci, org_config, flow_name, project_path, user):
-    """Run a flow on a scratch org"""
+def parse_flow_event(line: str) -> Optional[Tuple[str, Optional[str]]]:
+    """
+    Recognize a line of `cci flow run` output that starts or skips a step, or
+    completes the flow. Returns the event and the step's task name, if any.
+    """
+    for pattern, event in FLOW_EVENT_PATTERNS:
+        match = pattern.search(line)
+        if match:
+            return event, next(iter(match.groups()), None)
+    return None
+
+
+def run_flow(
+    *,
+    cci,
+    org_config,
+    flow_name,
+    project_path,
+    user,
+    on_output: Optional[Callable[[str], None]] = None,
+):
+    """
+    Run a flow on a scratch org. Each line the flow prints is passed to
+    `on_output` as soon as it is printed.
+    """
     # Run flow in a subprocess so we can control the environment
     gh_token = user.gh_token
     command = shutil.which("cci")
@@ -389,6 +627,8 @@ def run_flow(*, cci, org_config, flow_name, project_path, user):
             }
         ),
         "GITHUB_TOKEN": gh_token,
+        # so that the output reaches us line by line
+        "PYTHONUNBUFFERED": "1",
         # needed by sfdx
         "HOME": project_path,
         "PATH": os.environ["PATH"],
@@ -410,21 +650,28 @@ def run_flow(*, cci, org_config, flow_name, project_path, user):
         args,
         stdout=subprocess.PIPE,
         stderr=subprocess.STDOUT,
-        stdin=subprocess.PIPE,
+        stdin=subprocess.DEVNULL,
         close_fds=True,
         env=env,
         cwd=project_path,
+        text=True,
+        errors="replace",
     )
-    orig_stdout, _ = p.communicate()
+    # Only the last line is kept, for the error message:
+    last_line = ""
+    with p.stdout:
+        for line in p.stdout:
+            last_line = _last_line(line) or last_line
+            if on_output:
+                on_output(line)
+    p.wait()
     if p.returncode:
         p = subprocess.run(
             [command, "error", "info"], capture_output=True, env={"HOME": project_path}
         )
         traceback = p.stdout.decode("utf-8")
         logger.warning(traceback)
-        raise SubcommandException(
-            _last_line(traceback) or _last_line(orig_stdout.decode("utf-8"))
-        )
+        raise SubcommandException(_last_line(traceback) or last_line)
 
 
 def delete_org(scratch_org):
@@ -446,6 +693,7 @@ def delete_org(scratch_org):
     active_scratch_org_id = records.get("Id")
     if active_scratch_org_id:
         devhub_api.ActiveScratchOrg.delete(active_scratch_org_id)
+    forget_access_token(scratch_org)
 
     if scratch_org.expiry_job_id:
         scheduler = get_scheduler("default")
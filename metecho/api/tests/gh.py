@@ -1,30 +1,55 @@
-from contextlib import ExitStack
+import fcntl
+import io
+import os
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from unittest.mock import MagicMock, patch
 
 import pytest
+from cumulusci.utils import cd
 from django.core.cache import cache
 from github3.exceptions import NotFoundError, UnprocessableEntity
+from github3.session import AppInstallationTokenAuth
+from requests import Request
+from requests.models import Response
 
 from ..gh import (
+    ETagCacheAdapter,
+    GitHubGraphQLError,
     NoGitHubTokenError,
     UnsafeZipfileError,
+    compare_branches,
+    compare_shas,
     copy_branch_protection,
+    download_metadata,
     extract_zip_file,
+    forget_branch_sha,
     get_all_org_repos,
+    get_branch_sha,
     get_cached_user,
+    get_commit_sha,
+    get_etag_cache_stats,
+    get_project_config,
+    get_repo_collaborators,
     get_repo_info,
+    get_repo_snapshot,
     get_source_format,
     get_zip_file,
     gh_as_app,
     gh_as_org,
     gh_as_repo,
+    git_blob_sha,
     is_safe_path,
+    job_cache,
     local_github_checkout,
     log_unsafe_zipfile_error,
     normalize_commit,
+    path_matches,
+    prune_snapshot_cache,
+    snapshot_lock,
     try_to_make_branch,
-    zip_file_is_safe,
 )
 
 PATCH_ROOT = "metecho.api.gh"
@@ -49,20 +74,178 @@ class TestGetAllOrgRepos:
 
 
 def test_gh_as_app(mocker):
-    mocker.patch("metecho.api.gh.GitHub", autospec=True)
-    assert gh_as_app() is not None
+    gh = mocker.patch("metecho.api.gh.GitHub").return_value
+    assert gh_as_app() is gh
+    gh.session.mount.assert_called_once()
 
 
-def test_gh_as_repo(mocker):
-    gh = mocker.patch("metecho.api.gh.GitHub", autospec=True).return_value
-    gh_as_repo("owner", "repo")
-    gh.app_installation_for_repository.assert_called_with("owner", "repo")
+@pytest.mark.django_db
+class TestETagCacheAdapter:
+    def setup_method(self):
+        cache.clear()
+
+    def request(self, method="GET", token="token"):
+        return Request(
+            method,
+            "https://api.github.com/repos/owner/repo",
+            headers={"Authorization": f"token {token}"},
+        ).prepare()
+
+    def response(self, status_code, content=b"", **headers):
+        response = Response()
+        response.status_code = status_code
+        response._content = content
+        response.headers.update(headers)
+        response.connection = MagicMock()
+        response.raw = MagicMock()
+        return response
+
+    def test_replays_not_modified(self, mocker):
+        send = mocker.patch("requests.adapters.HTTPAdapter.send")
+        send.side_effect = [
+            self.response(200, b'{"id": 1}', ETag='"abc"'),
+            self.response(304, ETag='"abc"', **{"X-RateLimit-Remaining": "10"}),
+        ]
+        adapter = ETagCacheAdapter()
+
+        adapter.send(self.request())
+        request = self.request()
+        response = adapter.send(request)
+
+        assert request.headers["If-None-Match"] == '"abc"'
+        assert response.status_code == 200
+        assert response.json() == {"id": 1}
+        assert response.headers["X-RateLimit-Remaining"] == "10"
+        assert get_etag_cache_stats() == {"hits": 1, "misses": 1}
+
+    def test_modified(self, mocker):
+        send = mocker.patch("requests.adapters.HTTPAdapter.send")
+        send.side_effect = [
+            self.response(200, b'{"id": 1}', ETag='"abc"'),
+            self.response(200, b'{"id": 2}', ETag='"def"'),
+            self.response(304),
+        ]
+        adapter = ETagCacheAdapter()
+
+        adapter.send(self.request())
+        assert adapter.send(self.request()).json() == {"id": 2}
+        assert adapter.send(self.request()).json() == {"id": 2}
+        assert get_etag_cache_stats() == {"hits": 1, "misses": 2}
+
+    def test_credentials_are_part_of_the_key(self, mocker):
+        send = mocker.patch("requests.adapters.HTTPAdapter.send")
+        send.side_effect = [
+            self.response(200, b'{"id": 1}', ETag='"abc"'),
+            self.response(200, b'{"id": 1}', ETag='"abc"'),
+        ]
+        adapter = ETagCacheAdapter()
+
+        adapter.send(self.request(token="one"))
+        request = self.request(token="two")
+        adapter.send(request)
+
+        assert "If-None-Match" not in request.headers
+
+    def test_app_jwts_share_a_key(self):
+        one = self.request()
+        one.headers["Authorization"] = "Bearer one"
+        two = self.request()
+        two.headers["Authorization"] = "Bearer two"
+
+        assert ETagCacheAdapter.cache_key(one) == ETagCacheAdapter.cache_key(two)
+        assert ETagCacheAdapter.cache_key(one) != ETagCacheAdapter.cache_key(
+            self.request()
+        )
+
+    def test_ignores_writes_and_streams(self, mocker):
+        send = mocker.patch("requests.adapters.HTTPAdapter.send")
+        send.return_value = self.response(200, b"{}", ETag='"abc"')
+        adapter = ETagCacheAdapter()
+
+        adapter.send(self.request(method="POST"))
+        adapter.send(self.request(), stream=True)
 
+        assert cache.get(adapter.cache_key(self.request())) is None
+        assert get_etag_cache_stats() == {"hits": 0, "misses": 0}
 
-def test_gh_as_org(mocker):
-    gh = mocker.patch("metecho.api.gh.GitHub", autospec=True).return_value
-    gh_as_org("org-name")
-    gh.app_installation_for_organization.assert_called_with("org-name")
+
+@pytest.mark.django_db
+class TestGhAsInstallation:
+    def setup_method(self):
+        cache.clear()
+
+    def login(self, gh, expires_at="2100-01-01T00:00:00Z"):
+        def login_as_app_installation(key, app_id, installation_id):
+            gh.session.auth = AppInstallationTokenAuth("token", expires_at)
+
+        gh.login_as_app_installation.side_effect = login_as_app_installation
+
+    def test_gh_as_repo(self, mocker):
+        GitHub = mocker.patch(f"{PATCH_ROOT}.GitHub")
+        gh = GitHub.return_value
+        gh.app_installation_for_repository.return_value.id = 123
+        self.login(gh)
+
+        gh_as_repo("owner", "repo")
+
+        gh.app_installation_for_repository.assert_called_with("owner", "repo")
+        gh.login_as_app_installation.assert_called_once()
+        assert cache.get("gh_installation_id_repo_owner/repo") == 123
+        assert cache.get("gh_installation_token_123") == {
+            "token": "token",
+            "expires_at": "2100-01-01T00:00:00Z",
+        }
+
+    def test_gh_as_org(self, mocker):
+        GitHub = mocker.patch(f"{PATCH_ROOT}.GitHub")
+        gh = GitHub.return_value
+        gh.app_installation_for_organization.return_value.id = 123
+        self.login(gh)
+
+        gh_as_org("org-name")
+
+        gh.app_installation_for_organization.assert_called_with("org-name")
+        assert cache.get("gh_installation_id_org_org-name") == 123
+
+    def test_cached(self, mocker):
+        GitHub = mocker.patch(f"{PATCH_ROOT}.GitHub")
+        gh = GitHub.return_value
+        gh.app_installation_for_repository.return_value.id = 123
+        self.login(gh)
+
+        gh_as_repo("owner", "repo")
+        gh_as_repo("Owner", "Repo")
+
+        gh.app_installation_for_repository.assert_called_once()
+        gh.login_as_app_installation.assert_called_once()
+        gh.session.app_installation_token_auth.assert_called_once_with(
+            {"token": "token", "expires_at": "2100-01-01T00:00:00Z"}
+        )
+
+    def test_expiring_token(self, mocker):
+        GitHub = mocker.patch(f"{PATCH_ROOT}.GitHub")
+        gh = GitHub.return_value
+        gh.app_installation_for_repository.return_value.id = 123
+        self.login(gh, expires_at="2000-01-01T00:00:00Z")
+
+        gh_as_repo("owner", "repo")
+        gh_as_repo("owner", "repo")
+
+        assert gh.login_as_app_installation.call_count == 2
+        assert cache.get("gh_installation_token_123") is None
+
+    def test_stale_installation_id(self, mocker):
+        GitHub = mocker.patch(f"{PATCH_ROOT}.GitHub")
+        gh = GitHub.return_value
+        gh.login_as_app_installation.side_effect = NotFoundError(
+            MagicMock(status_code=404)
+        )
+        cache.set("gh_installation_id_repo_owner/repo", 123)
+
+        with pytest.raises(NotFoundError):
+            gh_as_repo("owner", "repo")
+
+        assert cache.get("gh_installation_id_repo_owner/repo") is None
 
 
 def test_is_safe_path():
@@ -71,14 +254,6 @@ def test_is_safe_path():
     assert is_safe_path("bar")
 
 
-def test_zip_file_is_safe():
-    info = MagicMock(filename="foo")
-    zip_file = MagicMock()
-    zip_file.infolist.return_value = [info]
-
-    assert zip_file_is_safe(zip_file)
-
-
 def test_log_unsafe_zipfile_error():
     with patch(f"{PATCH_ROOT}.logger") as logger:
         log_unsafe_zipfile_error("repo_url", "commit_ish")
@@ -117,6 +292,223 @@ class TestGetRepoInfo:
 
             gh.repository.assert_called_with("owner", "name")
 
+    def test_job_cache(self, mocker):
+        gh_as_repo = mocker.patch(f"{PATCH_ROOT}.gh_as_repo")
+        with job_cache():
+            repo = get_repo_info(None, repo_owner="owner", repo_name="name")
+            with job_cache():
+                assert get_repo_info(None, repo_owner="Owner", repo_name="name") is repo
+        get_repo_info(None, repo_owner="owner", repo_name="name")
+
+        assert gh_as_repo.call_count == 2
+
+
+class TestGetBranchSha:
+    def test_uncached(self):
+        repo = MagicMock()
+        repo.branch.return_value.latest_sha.return_value = "abc123"
+        assert get_branch_sha(repo, "main") == "abc123"
+        assert get_branch_sha(repo, "main") == "abc123"
+        assert repo.branch.call_count == 2
+
+    def test_job_cache(self):
+        repo = MagicMock(id=123)
+        repo.branch.return_value.latest_sha.return_value = "abc123"
+        with job_cache():
+            assert get_branch_sha(repo, "main") == "abc123"
+            assert get_branch_sha(repo, "main") == "abc123"
+            forget_branch_sha(repo, "main")
+            repo.branch.return_value.latest_sha.return_value = "def456"
+            assert get_branch_sha(repo, "main") == "def456"
+
+            try_to_make_branch(repo, new_branch="feature", base_sha="def456")
+            assert get_branch_sha(repo, "feature") == "def456"
+
+        assert repo.branch.call_count == 2
+
+    def test_job_cache__threads(self):
+        repo = MagicMock(id=123)
+        repo.branch.return_value.latest_sha.return_value = "abc123"
+        with job_cache():
+            get_branch_sha(repo, "main")
+            with ThreadPoolExecutor() as executor:
+                # Threads don't share the job's cache
+                executor.submit(get_branch_sha, repo, "main").result()
+                executor.submit(get_branch_sha, repo, "main").result()
+            get_branch_sha(repo, "main")
+
+        assert repo.branch.call_count == 3
+
+
+class TestGetRepoCollaborators:
+    def page(self, edges, cursor=None):
+        return {
+            "data": {
+                "repository": {
+                    "collaborators": {
+                        "pageInfo": {"hasNextPage": bool(cursor), "endCursor": cursor},
+                        "edges": edges,
+                    }
+                }
+            }
+        }
+
+    def edge(self, id, permission):
+        return {
+            "permission": permission,
+            "node": {
+                "databaseId": id,
+                "login": f"user{id}",
+                "name": None,
+                "avatarUrl": f"https://avatar/{id}",
+            },
+        }
+
+    def test_paginates(self):
+        repo = MagicMock(id=1)
+        repo.owner.login = "owner"
+        repo.name = "repo"
+        repo._json.side_effect = [
+            self.page([self.edge(1, "ADMIN")], cursor="abc"),
+            self.page([self.edge(2, "WRITE")]),
+        ]
+
+        collaborators = list(get_repo_collaborators(repo))
+
+        assert collaborators == [
+            {
+                "id": 1,
+                "login": "user1",
+                "name": "",
+                "avatar_url": "https://avatar/1",
+                "permissions": {
+                    "pull": True,
+                    "triage": True,
+                    "push": True,
+                    "maintain": True,
+                    "admin": True,
+                },
+            },
+            {
+                "id": 2,
+                "login": "user2",
+                "name": "",
+                "avatar_url": "https://avatar/2",
+                "permissions": {
+                    "pull": True,
+                    "triage": True,
+                    "push": True,
+                    "maintain": False,
+                    "admin": False,
+                },
+            },
+        ]
+        variables = repo._post.call_args_list[1].kwargs["data"]["variables"]
+        assert variables == {"owner": "owner", "name": "repo", "cursor": "abc"}
+
+    def test_errors(self):
+        repo = MagicMock()
+        repo._json.return_value = {"errors": [{"message": "Nope"}]}
+
+        with pytest.raises(GitHubGraphQLError):
+            list(get_repo_collaborators(repo))
+
+
+@pytest.mark.django_db
+class TestCompareShas:
+    def test_caches(self):
+        cache.delete("gh_compare_1_base_head")
+        repo = MagicMock(id=1)
+        repo.compare_commits.return_value = MagicMock(ahead_by=2, behind_by=1)
+
+        assert compare_shas(repo, "base", "head") == {"ahead_by": 2, "behind_by": 1}
+        assert compare_shas(repo, "base", "head") == {"ahead_by": 2, "behind_by": 1}
+        assert repo.compare_commits.call_count == 1
+
+    def test_caches__per_repo(self):
+        cache.delete_many(["gh_compare_1_base_head", "gh_compare_2_base_head"])
+        repo = MagicMock(id=1)
+        repo.compare_commits.return_value = MagicMock(ahead_by=2, behind_by=1)
+        fork = MagicMock(id=2)
+        fork.compare_commits.return_value = MagicMock(ahead_by=0, behind_by=3)
+
+        assert compare_shas(repo, "base", "head") == {"ahead_by": 2, "behind_by": 1}
+        assert compare_shas(fork, "base", "head") == {"ahead_by": 0, "behind_by": 3}
+        assert fork.compare_commits.call_count == 1
+
+
+@pytest.mark.django_db
+class TestCompareBranches:
+    def repo(self, *responses):
+        repo = MagicMock(id=1)
+        repo.owner.login = "owner"
+        repo.name = "repo"
+        repo._json.side_effect = [
+            {"data": {"repository": response}} for response in responses
+        ]
+        return repo
+
+    def test_batches(self, mocker):
+        mocker.patch(f"{PATCH_ROOT}.COMPARE_BATCH_SIZE", 1)
+        cache.delete_many(
+            ["gh_compare_1_sha-main_sha-a", "gh_compare_1_sha-main_sha-b"]
+        )
+        repo = self.repo(
+            {
+                "ref0": {"target": {"oid": "sha-main"}},
+                "ref1": {"target": {"oid": "sha-a"}},
+            },
+            {"ref0": {"target": {"oid": "sha-b"}}, "ref1": None},
+            {
+                "base0": {
+                    "target": {"oid": "sha-main"},
+                    "compare": {"aheadBy": 3, "behindBy": 0},
+                },
+                "head0": {"target": {"oid": "sha-a"}},
+            },
+            # b was deleted in between
+            {"base0": {"target": {"oid": "sha-main"}, "compare": None}, "head0": None},
+        )
+
+        comparisons = compare_branches(
+            repo, [("main", "a"), ("main", "b"), ("main", "a"), ("gone", "a")]
+        )
+
+        assert comparisons == {("main", "a"): {"ahead_by": 3, "behind_by": 0}}
+        assert repo._post.call_count == 4
+        variables = repo._post.call_args_list[2].kwargs["data"]["variables"]
+        assert variables == {
+            "owner": "owner",
+            "name": "repo",
+            "base0": "refs/heads/main",
+            "head0": "refs/heads/a",
+        }
+        assert compare_shas(repo, "sha-main", "sha-a") == {
+            "ahead_by": 3,
+            "behind_by": 0,
+        }
+        assert not repo.compare_commits.called
+
+    def test_cached(self):
+        cache.set("gh_compare_1_sha-main_sha-a", {"ahead_by": 1, "behind_by": 2})
+        repo = self.repo(
+            {
+                "ref0": {"target": {"oid": "sha-main"}},
+                "ref1": {"target": {"oid": "sha-a"}},
+            },
+        )
+
+        comparisons = compare_branches(repo, [("main", "a")])
+
+        assert comparisons == {("main", "a"): {"ahead_by": 1, "behind_by": 2}}
+        # Only the branch heads were looked up
+        assert repo._post.call_count == 1
+
+    def test_no_pairs(self):
+        repo = MagicMock()
+        assert compare_branches(repo, []) == {}
+        assert not repo._post.called
+
 
 @pytest.mark.django_db
 def test_get_cached_user(mocker):
@@ -137,91 +529,288 @@ def test_get_cached_user(mocker):
     assert gh.user.call_count == 1  # No new calls
 
 
+def make_zipball(members):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as zip_file:
+        for name, content in members.items():
+            zip_file.writestr(name, content)
+    buffer.seek(0)
+    return zipfile.ZipFile(buffer)
+
+
 def test_get_zip_file():
     repo = MagicMock()
-    with patch(f"{PATCH_ROOT}.zipfile") as zipfile:
-        get_zip_file(repo, "commit_ish")
-        assert repo.archive.called
-        assert zipfile.ZipFile.called
 
+    def archive(format, path, ref):
+        path.write(make_zipball({"owner-repo-sha/README.md": "Hi"}).fp.getvalue())
+        return True
 
-def test_extract_zip_file():
-    zip_file = MagicMock()
-    with ExitStack() as stack:
-        shutil = stack.enter_context(patch(f"{PATCH_ROOT}.shutil"))
-        os = stack.enter_context(patch(f"{PATCH_ROOT}.os"))
-        glob = stack.enter_context(patch(f"{PATCH_ROOT}.glob"))
+    repo.archive.side_effect = archive
+    with get_zip_file(repo, "commit_ish") as zip_file:
+        assert zip_file.namelist() == ["owner-repo-sha/README.md"]
 
-        glob.return_value = ["owner-repo_name-"]
-        extract_zip_file(zip_file, "owner", "repo_name")
-        assert zip_file.extractall.called
-        assert shutil.move.called
-        assert shutil.rmtree.called
-        assert os.remove.called
+
+class TestExtractZipFile:
+    def test_good(self, tmp_path):
+        zip_file = make_zipball(
+            {
+                "owner-repo-sha/": "",
+                "owner-repo-sha/cumulusci.yml": "project: {}",
+                "owner-repo-sha/force-app/main/default/": "",
+                "owner-repo-sha/unpackaged/pre/first/package.xml": "<Package/>",
+            }
+        )
+        with cd(tmp_path):
+            extract_zip_file(zip_file)
+
+        assert (tmp_path / "cumulusci.yml").read_text() == "project: {}"
+        assert (tmp_path / "force-app" / "main" / "default").is_dir()
+        assert (tmp_path / "unpackaged/pre/first/package.xml").exists()
+
+    def test_unsafe(self, tmp_path):
+        zip_file = make_zipball({"owner-repo-sha/../evil.txt": "Boo"})
+        with cd(tmp_path):
+            with pytest.raises(UnsafeZipfileError):
+                extract_zip_file(zip_file)
+
+        assert not (tmp_path.parent / "evil.txt").exists()
 
 
 class TestLocalGitHubCheckout:
-    def test_zipfile_safe(self):
+    def test_zipfile_safe(self, mocker):
         user = MagicMock()
         repo = 123
-        with ExitStack() as stack:
-            stack.enter_context(patch(f"{PATCH_ROOT}.zipfile"))
-            os = stack.enter_context(patch(f"{PATCH_ROOT}.os"))
-            gh_as_user = stack.enter_context(patch(f"{PATCH_ROOT}.gh_as_user"))
-            shutil = stack.enter_context(patch(f"{PATCH_ROOT}.shutil"))
-            glob = stack.enter_context(patch(f"{PATCH_ROOT}.glob"))
-            repository = MagicMock(default_branch="main")
-            repository.file_contents.return_value.decoded.decode.return_value = "Hello"
-            gh = MagicMock()
-            gh.repository_with_id.return_value = repository
-            gh_as_user.return_value = gh
-            glob.return_value = ["owner-repo_name-"]
+        get_zip_file = mocker.patch(f"{PATCH_ROOT}.get_zip_file")
+        get_zip_file.return_value.__enter__.return_value = make_zipball(
+            {"owner-repo_name-sha/README.md": "Hi"}
+        )
+        gh_as_user = mocker.patch(f"{PATCH_ROOT}.gh_as_user")
+        repository = MagicMock(default_branch="main")
+        repository.file_contents.return_value.decoded.decode.return_value = "Hello"
+        gh = MagicMock()
+        gh.repository_with_id.return_value = repository
+        gh_as_user.return_value = gh
 
-            with local_github_checkout(user, repo, "main") as repo_root:
-                assert (Path(repo_root) / "cumulusci.yml").read_text() == "Hello"
-                assert shutil.rmtree.called
-                assert os.remove.called
+        with local_github_checkout(user, repo, "main") as repo_root:
+            assert (Path(repo_root) / "cumulusci.yml").read_text() == "Hello"
+            assert (Path(repo_root) / "README.md").read_text() == "Hi"
 
-    def test_zipfile_unsafe(self):
+    def test_snapshot_cache(self, mocker, settings, tmp_path):
+        settings.REPO_SNAPSHOT_CACHE_DIR = str(tmp_path)
+        repository = MagicMock(default_branch="main")
+        repository.file_contents.return_value.decoded.decode.return_value = "Hello"
+        mocker.patch(f"{PATCH_ROOT}.get_repo_info", return_value=repository)
+        mocker.patch(f"{PATCH_ROOT}.get_commit_sha", return_value="abc123")
+        snapshot = tmp_path / "abc123"
+        snapshot.mkdir()
+        (snapshot / "README.md").write_text("Cached")
+        (tmp_path / "abc123.size").write_text("6")
+        download = mocker.patch(f"{PATCH_ROOT}.download_and_extract")
+
+        with local_github_checkout(MagicMock(), 123, "main") as repo_root:
+            assert (Path(repo_root) / "README.md").read_text() == "Cached"
+            assert (Path(repo_root) / "cumulusci.yml").read_text() == "Hello"
+        assert not download.called
+        # The cached tree is left untouched
+        assert not (snapshot / "cumulusci.yml").exists()
+
+    def test_metadata_mode(self, mocker):
+        download_metadata = mocker.patch(
+            f"{PATCH_ROOT}.download_metadata", return_value=True
+        )
+        checkout_full = mocker.patch(f"{PATCH_ROOT}.checkout_full")
+        repository = MagicMock(default_branch="main")
+        repository.file_contents.return_value.decoded.decode.return_value = "Hello"
+        mocker.patch(f"{PATCH_ROOT}.get_repo_info", return_value=repository)
+
+        with local_github_checkout(MagicMock(), 123, "main", mode="metadata"):
+            assert download_metadata.called
+            assert not checkout_full.called
+
+    def test_metadata_mode__fallback(self, mocker):
+        mocker.patch(f"{PATCH_ROOT}.download_metadata", return_value=False)
+        checkout_full = mocker.patch(f"{PATCH_ROOT}.checkout_full")
+        repository = MagicMock(default_branch="main")
+        repository.file_contents.return_value.decoded.decode.return_value = "Hello"
+        mocker.patch(f"{PATCH_ROOT}.get_repo_info", return_value=repository)
+
+        with local_github_checkout(MagicMock(), 123, "main", mode="metadata"):
+            assert checkout_full.called
+
+    def test_zipfile_unsafe(self, mocker):
         user = MagicMock()
         repo = 123
-        with ExitStack() as stack:
-            stack.enter_context(patch(f"{PATCH_ROOT}.zipfile"))
-            gh_as_user = stack.enter_context(patch(f"{PATCH_ROOT}.gh_as_user"))
-            stack.enter_context(patch(f"{PATCH_ROOT}.shutil"))
-            glob = stack.enter_context(patch(f"{PATCH_ROOT}.glob"))
-            zip_file_is_safe = stack.enter_context(
-                patch(f"{PATCH_ROOT}.zip_file_is_safe")
-            )
-            zip_file_is_safe.return_value = False
-            gh = MagicMock()
-            gh_as_user.return_value = gh
-            glob.return_value = [".."]
+        get_zip_file = mocker.patch(f"{PATCH_ROOT}.get_zip_file")
+        get_zip_file.return_value.__enter__.return_value = make_zipball(
+            {"owner-repo_name-sha/../evil.txt": "Boo"}
+        )
+        mocker.patch(f"{PATCH_ROOT}.gh_as_user")
+        log_unsafe_zipfile_error = mocker.patch(
+            f"{PATCH_ROOT}.log_unsafe_zipfile_error"
+        )
 
-            with pytest.raises(UnsafeZipfileError):
-                with local_github_checkout(user, repo, "commit-ish"):  # pragma: nocover
-                    pass
+        with pytest.raises(UnsafeZipfileError):
+            with local_github_checkout(user, repo, "commit-ish"):  # pragma: nocover
+                pass
+        assert log_unsafe_zipfile_error.called
 
     def test_cumulusci_yml_error(self, mocker):
         user = MagicMock()
         repo_id = 123
-        mocker.patch(f"{PATCH_ROOT}.zipfile")
-        mocker.patch(f"{PATCH_ROOT}.os")
+        mocker.patch(f"{PATCH_ROOT}.download_and_extract")
         gh_as_user = mocker.patch(f"{PATCH_ROOT}.gh_as_user")
-        mocker.patch(f"{PATCH_ROOT}.shutil")
-        glob = mocker.patch(f"{PATCH_ROOT}.glob")
         repository = MagicMock(default_branch="main")
         repository.file_contents.side_effect = NotFoundError(MagicMock())
         gh = MagicMock()
         gh.repository_with_id.return_value = repository
         gh_as_user.return_value = gh
-        glob.return_value = ["owner-repo_name-"]
 
         with pytest.raises(Exception):
             with local_github_checkout(user, repo_id, "#DEFAULT"):
                 pass  # pragma: nocover
 
 
+class TestDownloadMetadata:
+    def entry(self, path, type_="blob"):
+        return MagicMock(path=path, type=type_, sha=f"sha-{path}")
+
+    def test_good(self, tmp_path):
+        repo = MagicMock()
+        repo.tree.return_value.as_dict.return_value = {"truncated": False}
+        repo.tree.return_value.tree = [
+            self.entry("cumulusci.yml"),
+            self.entry("sfdx-project.json"),
+            self.entry("orgs", "tree"),
+            self.entry("orgs/dev.json"),
+            self.entry("orgs/nested/dev.json"),
+            self.entry("force-app/main/default/classes/Foo.cls"),
+            self.entry("unpackaged/pre/first", "tree"),
+            self.entry("unpackaged/pre/first/package.xml"),
+        ]
+        repo.blob.return_value.decode_content.return_value = "{}"
+
+        with cd(tmp_path):
+            assert download_metadata(repo, "main")
+
+        repo.tree.assert_called_once_with("main", recursive=True)
+        assert repo.blob.call_count == 3
+        assert (tmp_path / "orgs" / "dev.json").read_text() == "{}"
+        assert not (tmp_path / "orgs" / "nested").exists()
+        assert not (tmp_path / "force-app").exists()
+        assert (tmp_path / "unpackaged" / "pre" / "first").is_dir()
+        assert not (tmp_path / "unpackaged" / "pre" / "first" / "package.xml").exists()
+
+    def test_truncated(self, tmp_path):
+        repo = MagicMock()
+        repo.tree.return_value.as_dict.return_value = {"truncated": True}
+
+        with cd(tmp_path):
+            assert not download_metadata(repo, "main")
+        assert not repo.blob.called
+
+
+def test_path_matches():
+    assert path_matches("orgs/dev.json", ("orgs/*.json",))
+    assert not path_matches("other/orgs/dev.json", ("orgs/*.json",))
+    assert not path_matches("orgs/nested/dev.json", ("orgs/*.json",))
+
+
+class TestGetCommitSha:
+    def test_good(self):
+        repo = MagicMock()
+        repo._get.return_value = MagicMock(status_code=200, text="abc123\n")
+        assert get_commit_sha(repo, "main") == "abc123"
+
+    def test_not_found(self):
+        repo = MagicMock()
+        repo._get.return_value = MagicMock(status_code=404)
+        with pytest.raises(NotFoundError):
+            get_commit_sha(repo, "main")
+
+
+class TestRepoSnapshotCache:
+    def write_repo(self, repo, commit_ish):
+        Path("cumulusci.yml").write_text("project: {}")
+
+    def test_get_repo_snapshot(self, mocker, settings, tmp_path):
+        settings.REPO_SNAPSHOT_CACHE_MAX_BYTES = 1024
+        settings.REPO_SNAPSHOT_CACHE_MAX_AGE = 60
+        download = mocker.patch(
+            f"{PATCH_ROOT}.download_and_extract", side_effect=self.write_repo
+        )
+
+        snapshot = get_repo_snapshot(MagicMock(), "abc123", root=tmp_path)
+        assert (snapshot / "cumulusci.yml").read_text() == "project: {}"
+        assert (tmp_path / "abc123.size").read_text() == "11"
+
+        # Second call is served from the cache:
+        assert get_repo_snapshot(MagicMock(), "abc123", root=tmp_path) == snapshot
+        assert download.call_count == 1
+
+    def test_prune_snapshot_cache__size(self, settings, tmp_path):
+        settings.REPO_SNAPSHOT_CACHE_MAX_BYTES = 15
+        settings.REPO_SNAPSHOT_CACHE_MAX_AGE = 60
+        for i, sha in enumerate(("old", "new")):
+            (tmp_path / sha).mkdir()
+            size_file = tmp_path / f"{sha}.size"
+            size_file.write_text("10")
+            os.utime(size_file, (time.time() + i, time.time() + i))
+
+        prune_snapshot_cache(tmp_path)
+        assert not (tmp_path / "old").exists()
+        assert not (tmp_path / "old.size").exists()
+        assert (tmp_path / "new").exists()
+
+    def test_prune_snapshot_cache__age(self, settings, tmp_path):
+        settings.REPO_SNAPSHOT_CACHE_MAX_BYTES = 1024
+        settings.REPO_SNAPSHOT_CACHE_MAX_AGE = 60
+        (tmp_path / "stale").mkdir()
+        size_file = tmp_path / "stale.size"
+        size_file.write_text("10")
+        os.utime(size_file, (time.time() - 120, time.time() - 120))
+        (tmp_path / "kept").mkdir()
+        (tmp_path / "kept.size").write_text("10")
+        os.utime(tmp_path / "kept.size", (time.time() - 120, time.time() - 120))
+
+        prune_snapshot_cache(tmp_path, keep="kept")
+        assert not (tmp_path / "stale").exists()
+        assert (tmp_path / "kept").exists()
+
+    def test_prune_snapshot_cache__in_use(self, settings, tmp_path):
+        settings.REPO_SNAPSHOT_CACHE_MAX_BYTES = 1024
+        settings.REPO_SNAPSHOT_CACHE_MAX_AGE = 60
+        for sha in ("busy", "idle"):
+            (tmp_path / sha).mkdir()
+            (tmp_path / f"{sha}.size").write_text("10")
+            os.utime(tmp_path / f"{sha}.size", (time.time() - 120, time.time() - 120))
+
+        with snapshot_lock(tmp_path, "busy"):
+            prune_snapshot_cache(tmp_path)
+        assert (tmp_path / "busy").exists()
+        assert (tmp_path / "busy.size").exists()
+        assert (tmp_path / "busy.lock").exists()
+        assert not (tmp_path / "idle").exists()
+        assert not (tmp_path / "idle.lock").exists()
+        assert not list(tmp_path.glob(".idle-deleted-*"))
+
+    def test_snapshot_lock__pruned_while_waiting(self, mocker, tmp_path):
+        flock = fcntl.flock
+        calls = []
+
+        def prune_first(lock_file, operation):
+            # The first lock is only granted once pruning removed the lock file
+            if not calls:
+                (tmp_path / "abc.lock").unlink()
+            calls.append(operation)
+            flock(lock_file, operation)
+
+        mocker.patch("metecho.api.gh.fcntl.flock", side_effect=prune_first)
+        with snapshot_lock(tmp_path, "abc") as locked:
+            assert locked
+            assert (tmp_path / "abc.lock").exists()
+        assert calls == [fcntl.LOCK_SH, fcntl.LOCK_UN, fcntl.LOCK_SH, fcntl.LOCK_UN]
+
+
 class TestTryCreateBranch:
     def test_try_to_make_branch__duplicate_name(self):
         repository = MagicMock()
@@ -249,6 +838,72 @@ class TestTryCreateBranch:
             try_to_make_branch(repository, new_branch="new-branch", base_sha="123")
 
 
+def test_git_blob_sha():
+    # Matches `git hash-object` for the same content:
+    assert git_blob_sha(b"") == "e69de29bb2d1d6434b8b29ae775ad8c2e48c5391"
+
+
+@pytest.mark.django_db
+class TestGetProjectConfig:
+    def test_no_cumulusci_yml(self, mocker, tmp_path):
+        ProjectConfig = mocker.patch(f"{PATCH_ROOT}.ProjectConfig")
+        mocker.patch(f"{PATCH_ROOT}.MetechoUniversalConfig")
+        with cd(tmp_path):
+            assert get_project_config(repo_root=tmp_path) is ProjectConfig.return_value
+
+    def test_cached(self, mocker, tmp_path):
+        mocker.patch(f"{PATCH_ROOT}._project_configs", {})
+        cache.clear()
+        (tmp_path / "cumulusci.yml").write_text("project:\n  name: Test\n")
+        parsed = MagicMock(
+            config={"project": {"name": "Test"}},
+            config_project={"project": {"name": "Test"}},
+            config_project_local={},
+            config_additional_yaml={},
+        )
+        ProjectConfig = mocker.patch(
+            f"{PATCH_ROOT}.ProjectConfig", side_effect=[parsed, MagicMock()]
+        )
+        universal_config = mocker.patch(f"{PATCH_ROOT}.MetechoUniversalConfig")
+
+        with cd(tmp_path):
+            get_project_config(repo_root=tmp_path)
+            restored = get_project_config(repo_root=tmp_path)
+
+        first, second = ProjectConfig.call_args_list
+        assert "config" not in first.kwargs
+        assert second.kwargs["config"] == {"project": {"name": "Test"}}
+        assert second.args == (universal_config.return_value,)
+        # Same as a freshly parsed config:
+        assert restored.config_project == {"project": {"name": "Test"}}
+        assert restored.config_project_local == {}
+        assert restored.config_additional_yaml == {}
+
+    def test_cached__shared(self, mocker, tmp_path):
+        """Another process already parsed this cumulusci.yml."""
+        mocker.patch(f"{PATCH_ROOT}._project_configs", {})
+        cache.clear()
+        (tmp_path / "cumulusci.yml").write_text("project:\n  name: Test\n")
+        ProjectConfig = mocker.patch(f"{PATCH_ROOT}.ProjectConfig")
+        ProjectConfig.return_value.config = {"project": {"name": "Test"}}
+        ProjectConfig.return_value.config_project = {"project": {"name": "Test"}}
+        ProjectConfig.return_value.config_project_local = {}
+        ProjectConfig.return_value.config_additional_yaml = {}
+        mocker.patch(f"{PATCH_ROOT}.MetechoUniversalConfig")
+
+        with cd(tmp_path):
+            get_project_config(repo_root=tmp_path)
+            mocker.patch(f"{PATCH_ROOT}._project_configs", {})
+            get_project_config(repo_root=tmp_path)
+            (tmp_path / "cumulusci.yml").write_text("project:\n  name: Other\n")
+            get_project_config(repo_root=tmp_path)
+
+        first, second, third = ProjectConfig.call_args_list
+        assert "config" not in first.kwargs
+        assert second.kwargs["config"] == {"project": {"name": "Test"}}
+        assert "config" not in third.kwargs
+
+
 def test_get_source_format():
     with patch(f"{PATCH_ROOT}.get_project_config") as get_project_config:
         get_project_config.return_value = MagicMock(project__source_format="sentinel")
@@ -1,14 +1,19 @@
+from contextlib import ExitStack
 from unittest.mock import patch
 
 import pytest
 from rest_framework.exceptions import NotFound
 
 from ..hook_serializers import (
+    CreateHookSerializer,
+    DeleteHookSerializer,
+    IssuesHookSerializer,
     PrHookSerializer,
     PrReviewHookSerializer,
     PushHookSerializer,
+    coalesce_deliveries,
 )
-from ..models import TaskStatus
+from ..models import TaskStatus, WebhookDelivery
 
 fixture = pytest.lazy_fixture
 
@@ -45,6 +50,114 @@ class TestPushHookSerializer:
             serializer.process_hook()
             assert logger.info.called
 
+    def test_process_hook__branch_index(self, project_factory):
+        project = project_factory(repo_id=123)
+        data = {
+            "forced": False,
+            "ref": "refs/heads/feature",
+            "after": "abc123",
+            "commits": [],
+            "repository": {"id": 123},
+            "sender": {},
+        }
+        serializer = PushHookSerializer(data=data)
+        assert serializer.is_valid(), serializer.errors
+        with ExitStack() as stack:
+            stack.enter_context(patch("metecho.api.models.Project.add_commits"))
+            stack.enter_context(patch("metecho.api.models.gh.get_repo_info"))
+            get_branch_sha = stack.enter_context(
+                patch("metecho.api.models.gh.get_branch_sha")
+            )
+            get_branch_sha.return_value = "abc123"
+            serializer.process_hook()
+        assert project.branches.get(name="feature").latest_sha == "abc123"
+
+        serializer = PushHookSerializer(
+            data={**data, "before": "abc123", "after": "def456"}
+        )
+        assert serializer.is_valid(), serializer.errors
+        with patch("metecho.api.models.Project.add_commits"):
+            serializer.process_hook()
+        assert project.branches.get(name="feature").latest_sha == "def456"
+
+        serializer = PushHookSerializer(data={**data, "deleted": True})
+        assert serializer.is_valid(), serializer.errors
+        with patch("metecho.api.models.Project.add_commits"):
+            serializer.process_hook()
+        assert not project.branches.exists()
+
+    def test_process_hook__not_head(self, project_factory):
+        project = project_factory(repo_id=123, latest_sha="def456")
+        project.branches.create(name="main", latest_sha="def456")
+        data = {
+            "forced": False,
+            "ref": "refs/heads/main",
+            "before": "000000",
+            "after": "abc123",
+            "commits": [{"id": "abc123"}],
+            "repository": {"id": 123},
+            "sender": {},
+        }
+        serializer = PushHookSerializer(data=data)
+        assert serializer.is_valid(), serializer.errors
+        with ExitStack() as stack:
+            stack.enter_context(patch("metecho.api.models.gh.get_repo_info"))
+            get_branch_sha = stack.enter_context(
+                patch("metecho.api.models.gh.get_branch_sha")
+            )
+            get_branch_sha.return_value = "def456"
+            queue_replenish = stack.enter_context(
+                patch("metecho.api.models.Project.queue_replenish_scratch_org_pools")
+            )
+            serializer.process_hook()
+
+        project.refresh_from_db()
+        assert project.latest_sha == "def456"
+        assert project.branches.get(name="main").latest_sha == "def456"
+        assert not queue_replenish.called
+
+
+@pytest.mark.django_db
+class TestRefHookSerializers:
+    def data(self, ref_type="branch"):
+        return {"ref": "feature", "ref_type": ref_type, "repository": {"id": 123}}
+
+    def test_no_project(self):
+        serializer = CreateHookSerializer(data=self.data())
+        assert serializer.is_valid(), serializer.errors
+        with pytest.raises(NotFound):
+            serializer.process_hook()
+
+    def test_tag(self, project_factory):
+        project = project_factory(repo_id=123)
+        serializer = CreateHookSerializer(data=self.data(ref_type="tag"))
+        assert serializer.is_valid(), serializer.errors
+        serializer.process_hook()
+
+        assert not project.branches.exists()
+
+    def test_create(self, project_factory):
+        project = project_factory(repo_id=123)
+        project.branches.create(name="other", latest_sha="abc123")
+        serializer = CreateHookSerializer(data=self.data())
+        assert serializer.is_valid(), serializer.errors
+        serializer.process_hook()
+        serializer.process_hook()
+
+        assert list(project.branches.values_list("name", flat=True)) == [
+            "feature",
+            "other",
+        ]
+
+    def test_delete(self, project_factory):
+        project = project_factory(repo_id=123)
+        project.branches.create(name="feature", latest_sha="abc123")
+        serializer = DeleteHookSerializer(data=self.data())
+        assert serializer.is_valid(), serializer.errors
+        serializer.process_hook()
+
+        assert not project.branches.exists()
+
 
 @pytest.mark.django_db
 class TestPrHookSerializer:
@@ -313,3 +426,117 @@ class TestPrReviewHookSerializer:
         assert task.reviewers == [
             {"login": "login", "avatar_url": "https://example.com"},
         ]
+
+
+@pytest.mark.django_db
+class TestIssuesHookSerializer:
+    def data(self, action, **issue):
+        return {
+            "action": action,
+            "issue": {
+                "id": 123,
+                "number": 1,
+                "title": "Issue",
+                "state": "open",
+                "html_url": "https://github.com/owner/repo/issues/1",
+                "created_at": "2021-01-01T00:00:00Z",
+                "updated_at": "2021-01-02T00:00:00Z",
+                **issue,
+            },
+            "repository": {"id": 123},
+        }
+
+    def test_no_project(self):
+        serializer = IssuesHookSerializer(data=self.data("opened"))
+        assert serializer.is_valid(), serializer.errors
+        with pytest.raises(NotFound):
+            serializer.process_hook()
+
+    def test_opened(self, project_factory):
+        project = project_factory(repo_id=123)
+        serializer = IssuesHookSerializer(data=self.data("opened"))
+        assert serializer.is_valid(), serializer.errors
+        serializer.process_hook()
+
+        issue = project.issues.get()
+        assert issue.github_id == 123
+        assert issue.title == "Issue"
+
+    def test_edited(self, project_factory, git_hub_issue_factory):
+        project = project_factory(repo_id=123)
+        issue = git_hub_issue_factory(project=project, github_id=123)
+        serializer = IssuesHookSerializer(data=self.data("closed", state="closed"))
+        assert serializer.is_valid(), serializer.errors
+        serializer.process_hook()
+
+        issue.refresh_from_db()
+        assert issue.state == "closed"
+        assert project.issues.count() == 1
+
+    def test_deleted(self, project_factory, git_hub_issue_factory):
+        project = project_factory(repo_id=123)
+        git_hub_issue_factory(project=project, github_id=123)
+        serializer = IssuesHookSerializer(data=self.data("deleted"))
+        assert serializer.is_valid(), serializer.errors
+        serializer.process_hook()
+
+        assert not project.issues.exists()
+
+
+def test_coalesce_deliveries():
+    def push(pk, ref, sha, forced=False):
+        payload = {
+            "ref": ref,
+            "forced": forced,
+            "repository": {"id": 123},
+            "commits": [{"id": sha}],
+        }
+        return WebhookDelivery(pk=pk, event="push", payload=payload)
+
+    deliveries = [
+        push(1, "refs/heads/main", "a"),
+        WebhookDelivery(pk=2, event="pull_request", payload={"number": 1}),
+        push(3, "refs/heads/main", "b", forced=True),
+        push(4, "refs/heads/feature", "c"),
+    ]
+
+    result = list(coalesce_deliveries(deliveries))
+
+    assert [(event, [d.pk for d in group]) for event, _, group in result] == [
+        ("push", [1, 3]),
+        ("pull_request", [2]),
+        ("push", [4]),
+    ]
+    merged = result[0][1]
+    assert merged["forced"]
+    assert merged["commits"] == [{"id": "b"}, {"id": "a"}]
+
+
+def test_coalesce_deliveries__deleted_and_senders():
+    def push(pk, sha, sender, deleted=False):
+        payload = {
+            "ref": "refs/heads/main",
+            "forced": False,
+            "deleted": deleted,
+            "repository": {"id": 123},
+            "sender": {"login": sender},
+            "commits": [{"id": sha}] if sha else [],
+        }
+        return WebhookDelivery(pk=pk, event="push", payload=payload)
+
+    deliveries = [
+        push(1, "a", "one"),
+        push(2, "b", "two"),
+        push(3, None, "two", deleted=True),
+        push(4, "c", "one"),
+        push(5, "d", "one"),
+    ]
+
+    result = list(coalesce_deliveries(deliveries))
+
+    assert [[d.pk for d in group] for _, _, group in result] == [[1, 2], [3], [4, 5]]
+    assert result[0][1]["commits"] == [
+        {"id": "b", "sender": {"login": "two"}},
+        {"id": "a", "sender": {"login": "one"}},
+    ]
+    assert result[1][1]["deleted"]
@@ -1,7 +1,8 @@
+import gzip
 import logging
 from collections import namedtuple
 from contextlib import ExitStack
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
 from typing import NamedTuple, Sequence
 from unittest.mock import MagicMock, patch
@@ -14,11 +15,15 @@ from github3.orgs import Organization
 from simple_salesforce.exceptions import SalesforceGeneralError
 
 from ..jobs import (
+    FlowProgress,
     TaskReviewIntegrityError,
+    _claim_pooled_org,
     _create_branches_on_github,
-    _create_org_and_run_flow,
+    _finish_org_creation_and_run_flow,
+    _start_org_creation,
     alert_user_about_expiring_org,
     available_org_config_names,
+    cached_org_schema,
     commit_changes_from_org,
     commit_dataset_from_org,
     commit_omnistudio_from_org,
@@ -28,20 +33,25 @@ from ..jobs import (
     create_pr,
     create_repository,
     delete_scratch_org,
+    forget_org_schema,
     get_nonsource_components,
     get_social_image,
     get_unsaved_changes,
+    get_unsaved_changes_for_orgs,
     parse_datasets,
+    poll_scratch_org_creation,
+    process_webhook_inbox,
     refresh_commits,
     refresh_github_issues,
     refresh_github_organizations_for_user,
     refresh_github_repositories_for_user,
     refresh_github_users,
     refresh_scratch_org,
+    replenish_scratch_org_pool,
     submit_review,
     user_reassign,
 )
-from ..models import GitHubCollaboration, GitHubUser, ScratchOrgType
+from ..models import GitHubCollaboration, GitHubUser, ScratchOrgType, WebhookDelivery
 
 Author = namedtuple("Author", ("avatar_url", "login"))
 Commit = namedtuple(
@@ -237,7 +247,7 @@ class TestCreateBranchesOnGitHub:
                         )
                         for _ in range(1)
                     ),
-                    "compare_commits.return_value": MagicMock(ahead_by=0),
+                    "compare_commits.return_value": MagicMock(ahead_by=0, behind_by=0),
                 }
             )
 
@@ -288,19 +298,59 @@ class TestRefreshGitHubIssues:
     def test_limit(self, mocker, settings, project_factory, short_issue_factory):
         settings.GITHUB_ISSUE_LIMIT = 5
         get_repo_info = mocker.patch(f"{PATCH_ROOT}.get_repo_info", autospec=True)
-        # Repo with 10 issues
+        # Repo with 10 issues, most recently updated first
         get_repo_info.return_value.issues.return_value.__next__.side_effect = (
-            short_issue_factory(pull_request_urls=None) for i in range(10)
+            short_issue_factory(
+                pull_request_urls=None,
+                updated_at=datetime(2021, 1, 10 - i, tzinfo=timezone.utc),
+            )
+            for i in range(10)
         )
         project = project_factory(currently_fetching_issues=True)
 
         refresh_github_issues(project, originating_user_id=None)
 
+        get_repo_info.return_value.issues.assert_called_once_with(
+            sort="updated", direction="desc"
+        )
         project.refresh_from_db()
-        assert project.issues.count() == 5
+        assert set(project.issues.values_list("updated_at__day", flat=True)) == {
+            6,
+            7,
+            8,
+            9,
+            10,
+        }
         assert project.has_truncated_issues
+        # The next sync fetches what changed after the newest issue
+        assert project.issues_synced_at == datetime(2021, 1, 10, tzinfo=timezone.utc)
         assert not project.currently_fetching_issues
 
+    def test_incremental__limit(
+        self, mocker, settings, project_factory, short_issue_factory
+    ):
+        settings.GITHUB_ISSUE_LIMIT = 2
+        synced_at = datetime(2021, 1, 1, tzinfo=timezone.utc)
+        project = project_factory(
+            currently_fetching_issues=True, issues_synced_at=synced_at
+        )
+        get_repo_info = mocker.patch(f"{PATCH_ROOT}.get_repo_info", autospec=True)
+        get_repo_info.return_value.issues.return_value.__next__.side_effect = (
+            short_issue_factory(
+                pull_request_urls=None,
+                updated_at=datetime(2021, 1, i + 2, tzinfo=timezone.utc),
+            )
+            for i in range(5)
+        )
+
+        refresh_github_issues(project, originating_user_id=None)
+
+        project.refresh_from_db()
+        assert project.issues.count() == 2
+        # The next sync resumes after the last change fetched
+        assert project.issues_synced_at == datetime(2021, 1, 3, tzinfo=timezone.utc)
+        assert not project.has_truncated_issues
+
     def test_idempotent(self, mocker, project_factory, short_issue_factory):
         gh_issue = short_issue_factory(pull_request_urls=None)
         get_repo_info = mocker.patch(f"{PATCH_ROOT}.get_repo_info", autospec=True)
@@ -314,6 +364,45 @@ class TestRefreshGitHubIssues:
         refresh_github_issues(project, originating_user_id=None)
         assert issue == project.issues.get()
 
+    def test_incremental(
+        self, mocker, project_factory, git_hub_issue_factory, short_issue_factory
+    ):
+        synced_at = datetime(2021, 1, 1, tzinfo=timezone.utc)
+        project = project_factory(
+            currently_fetching_issues=True,
+            has_truncated_issues=True,
+            issues_synced_at=synced_at,
+        )
+        # has_truncated_issues is about the first sync, which left issues out
+        existing = git_hub_issue_factory(project=project, github_id=1, state="open")
+        started_at = datetime(2021, 1, 4, tzinfo=timezone.utc)
+        mocker.patch(f"{PATCH_ROOT}.now", return_value=started_at)
+        get_repo_info = mocker.patch(f"{PATCH_ROOT}.get_repo_info", autospec=True)
+        get_repo_info.return_value.issues.return_value.__next__.side_effect = [
+            short_issue_factory(
+                id=1,
+                state="closed",
+                pull_request_urls=None,
+                updated_at=datetime(2021, 1, 2, tzinfo=timezone.utc),
+            ),
+            short_issue_factory(
+                updated_at=datetime(2021, 1, 3, tzinfo=timezone.utc),
+            ),
+        ]
+
+        refresh_github_issues(project, originating_user_id=None)
+
+        get_repo_info.return_value.issues.assert_called_once_with(
+            state="all", sort="updated", direction="asc", since=synced_at
+        )
+        project.refresh_from_db()
+        existing.refresh_from_db()
+        assert existing.state == "closed"
+        assert project.issues.count() == 1
+        # Caught up, so everything up to the start of the sync has been seen
+        assert project.issues_synced_at == started_at
+        assert project.has_truncated_issues
+
     def test_error(self, mocker, caplog, project_factory):
         mocker.patch(f"{PATCH_ROOT}.get_repo_info", side_effect=Exception("Oh no!"))
         project = project_factory(currently_fetching_issues=True)
@@ -359,11 +448,13 @@ class TestAlertUserAboutExpiringOrg:
             assert send_mail.called
 
 
-def test_create_org_and_run_flow():
+def test_finish_org_creation_and_run_flow():
     with ExitStack() as stack:
         stack.enter_context(patch(f"{PATCH_ROOT}.get_latest_revision_numbers"))
-        create_org = stack.enter_context(patch(f"{PATCH_ROOT}.create_org"))
-        create_org.return_value = (
+        finish_org_creation = stack.enter_context(
+            patch(f"{PATCH_ROOT}.finish_org_creation")
+        )
+        finish_org_creation.return_value = (
             MagicMock(expires=datetime(2020, 1, 1, 12, 0)),
             MagicMock(),
             MagicMock(),
@@ -378,28 +469,78 @@ def test_create_org_and_run_flow():
             False,
         )
         stack.enter_context(patch(f"{PATCH_ROOT}.get_scheduler"))
-        Path = stack.enter_context(patch(f"{PATCH_ROOT}.Path"))
-        Path.return_value = MagicMock(**{"read_text.return_value": "test logs"})
+        FlowProgress = stack.enter_context(patch(f"{PATCH_ROOT}.FlowProgress"))
         scratch_org = MagicMock(org_type=ScratchOrgType.DEV)
-        _create_org_and_run_flow(
+        _finish_org_creation_and_run_flow(
             scratch_org,
             user=MagicMock(),
             repo_id=123,
             repo_branch=MagicMock(),
             project_path="",
+            org_result={"Id": "2SR000000000001"},
             originating_user_id=None,
         )
 
-        assert create_org.called
-        assert run_flow.called
-        assert isinstance(scratch_org.cci_log, str)
+        assert finish_org_creation.called
+        assert run_flow.call_args.kwargs["on_output"] is FlowProgress.return_value
+        assert FlowProgress.return_value.flush.called
+        assert scratch_org.clear_log.called
 
 
-def test_create_org_and_run_flow__fall_back_to_cases():
+@pytest.mark.django_db
+class TestFlowProgress:
+    def test_flow(self, mocker, scratch_org_factory):
+        mocker.patch(f"{PATCH_ROOT}.FLOW_PROGRESS_INTERVAL", 0)
+        scratch_org = scratch_org_factory()
+        async_to_sync = mocker.patch("metecho.api.model_mixins.async_to_sync")
+        progress = FlowProgress(scratch_org, originating_user_id="user-id")
+
+        progress("Running task: deploy\n")
+        progress("Skipping task: update_admin_profile\n")
+        progress("Running task: load_data\n")
+        progress("Completed flow 'dev_org' on org dev successfully!\n")
+
+        assert b"".join(scratch_org.read_log()) == (
+            b"Running task: deploy\n"
+            b"Skipping task: update_admin_profile\n"
+            b"Running task: load_data\n"
+            b"Completed flow 'dev_org' on org dev successfully!\n"
+        )
+        assert scratch_org.log_chunks.count() == 4
+        assert async_to_sync.return_value.call_count == 4
+        message = async_to_sync.return_value.call_args.args[1]
+        assert message["type"] == "SCRATCH_ORG_FLOW_PROGRESS"
+        assert message["payload"]["id"] == str(scratch_org.id)
+        assert message["payload"]["current_step"] is None
+        assert message["payload"]["finished_steps"] == ["deploy", "load_data"]
+        assert message["payload"]["skipped_steps"] == ["update_admin_profile"]
+        assert async_to_sync.return_value.call_args.kwargs == {"include_model": False}
+
+    def test_throttled(self, mocker, scratch_org_factory):
+        scratch_org = scratch_org_factory()
+        async_to_sync = mocker.patch("metecho.api.model_mixins.async_to_sync")
+        progress = FlowProgress(scratch_org, originating_user_id=None)
+
+        progress("Running task: deploy\n")
+        progress("Deploying...\n")
+        assert scratch_org.log_size == 0
+        assert not async_to_sync.called
+
+        progress.flush()
+        assert (
+            b"".join(scratch_org.read_log()) == b"Running task: deploy\nDeploying...\n"
+        )
+        message = async_to_sync.return_value.call_args.args[1]
+        assert message["payload"]["current_step"] == "deploy"
+
+
+def test_finish_org_creation_and_run_flow__fall_back_to_cases():
     with ExitStack() as stack:
         stack.enter_context(patch(f"{PATCH_ROOT}.get_latest_revision_numbers"))
-        create_org = stack.enter_context(patch(f"{PATCH_ROOT}.create_org"))
-        create_org.return_value = (
+        finish_org_creation = stack.enter_context(
+            patch(f"{PATCH_ROOT}.finish_org_creation")
+        )
+        finish_org_creation.return_value = (
             MagicMock(expires=datetime(2020, 1, 1, 12, 0), setup_flow=None),
             MagicMock(
                 **{
@@ -420,26 +561,28 @@ def test_create_org_and_run_flow__fall_back_to_cases():
             False,
         )
         stack.enter_context(patch(f"{PATCH_ROOT}.get_scheduler"))
-        Path = stack.enter_context(patch(f"{PATCH_ROOT}.Path"))
-        Path.return_value = MagicMock(**{"read_text.return_value": "test logs"})
-        _create_org_and_run_flow(
+        stack.enter_context(patch(f"{PATCH_ROOT}.FlowProgress"))
+        _finish_org_creation_and_run_flow(
             MagicMock(org_type=ScratchOrgType.DEV, org_config_name="dev"),
             user=MagicMock(),
             repo_id=123,
             repo_branch=MagicMock(),
             project_path="",
+            org_result={"Id": "2SR000000000001"},
             originating_user_id=None,
         )
 
-        assert create_org.called
+        assert finish_org_creation.called
         assert run_flow.called
 
 
-def test_create_org_and_run_flow__no_setup_flow():
+def test_finish_org_creation_and_run_flow__no_setup_flow():
     with ExitStack() as stack:
         stack.enter_context(patch(f"{PATCH_ROOT}.get_latest_revision_numbers"))
-        create_org = stack.enter_context(patch(f"{PATCH_ROOT}.create_org"))
-        create_org.return_value = (
+        finish_org_creation = stack.enter_context(
+            patch(f"{PATCH_ROOT}.finish_org_creation")
+        )
+        finish_org_creation.return_value = (
             MagicMock(expires=datetime(2020, 1, 1, 12, 0), setup_flow=None),
             MagicMock(
                 **{
@@ -460,49 +603,148 @@ def test_create_org_and_run_flow__no_setup_flow():
             False,
         )
         stack.enter_context(patch(f"{PATCH_ROOT}.get_scheduler"))
-        Path = stack.enter_context(patch(f"{PATCH_ROOT}.Path"))
-        Path.return_value = MagicMock(**{"read_text.return_value": "test logs"})
-        _create_org_and_run_flow(
+        stack.enter_context(patch(f"{PATCH_ROOT}.FlowProgress"))
+        _finish_org_creation_and_run_flow(
             MagicMock(org_type=ScratchOrgType.DEV, org_config_name="trial"),
             user=MagicMock(),
             repo_id=123,
             repo_branch=MagicMock(),
             project_path="",
+            org_result={"Id": "2SR000000000001"},
             originating_user_id=None,
         )
 
-        assert create_org.called
+        assert finish_org_creation.called
         assert not run_flow.called
 
 
 @pytest.mark.django_db
-@pytest.mark.parametrize("ListNonSourceTrackable_exception", [False, True])
-def test_get_unsaved_changes(
-    scratch_org_factory, patch_dataset_env, ListNonSourceTrackable_exception
-):
+def test_start_org_creation(mocker, scratch_org_factory):
+    scratch_org = scratch_org_factory()
+    mocker.patch(f"{PATCH_ROOT}.get_repo_info")
+    mocker.patch(f"{PATCH_ROOT}.start_org_creation", return_value="2SR000000000001")
+    get_scheduler = mocker.patch(f"{PATCH_ROOT}.get_scheduler")
+
+    _start_org_creation(
+        scratch_org,
+        user=scratch_org.owner,
+        repo_id=123,
+        repo_branch="main",
+        project_path="",
+        originating_user_id=None,
+    )
+
+    scratch_org.refresh_from_db()
+    assert scratch_org.scratch_org_info_id == "2SR000000000001"
+    (delay, func, org), kwargs = get_scheduler.return_value.enqueue_in.call_args
+    assert func is poll_scratch_org_creation
+    assert delay.total_seconds() == kwargs["delay"] == 10
+    assert kwargs["waited"] == 0
+
+
+@pytest.mark.django_db
+class TestPollScratchOrgCreation:
+    def poll(self, scratch_org, waited=0, delay=10):
+        poll_scratch_org_creation(
+            scratch_org,
+            repo_id=123,
+            repo_branch="main",
+            originating_user_id=None,
+            waited=waited,
+            delay=delay,
+        )
+
+    def test_creating(self, mocker, scratch_org_factory):
+        scratch_org = scratch_org_factory(scratch_org_info_id="2SR000000000001")
+        mocker.patch(f"{PATCH_ROOT}.check_org_creation", return_value=None)
+        finalize_provision = mocker.patch(
+            "metecho.api.models.ScratchOrg.finalize_provision"
+        )
+        get_scheduler = mocker.patch(f"{PATCH_ROOT}.get_scheduler")
+
+        self.poll(scratch_org, waited=40, delay=40)
+
+        kwargs = get_scheduler.return_value.enqueue_in.call_args.kwargs
+        assert kwargs["waited"] == 80
+        assert kwargs["delay"] == 60
+        assert not finalize_provision.called
+
+    def test_timeout(self, mocker, settings, scratch_org_factory):
+        settings.MAXIMUM_JOB_LENGTH = 100
+        scratch_org = scratch_org_factory(scratch_org_info_id="2SR000000000001")
+        mocker.patch(f"{PATCH_ROOT}.check_org_creation", return_value=None)
+        finalize_provision = mocker.patch(
+            "metecho.api.models.ScratchOrg.finalize_provision"
+        )
+        get_scheduler = mocker.patch(f"{PATCH_ROOT}.get_scheduler")
+
+        with pytest.raises(Exception, match="timed out"):
+            self.poll(scratch_org, waited=60, delay=60)
+
+        assert finalize_provision.call_args.kwargs["error"]
+        assert not get_scheduler.return_value.enqueue_in.called
+
+    def test_active(self, mocker, scratch_org_factory):
+        scratch_org = scratch_org_factory(scratch_org_info_id="2SR000000000001")
+        mocker.patch(
+            f"{PATCH_ROOT}.check_org_creation", return_value={"Status": "Active"}
+        )
+        mocker.patch(f"{PATCH_ROOT}.local_github_checkout")
+        finish = mocker.patch(f"{PATCH_ROOT}._finish_org_creation_and_run_flow")
+        finalize_provision = mocker.patch(
+            "metecho.api.models.ScratchOrg.finalize_provision"
+        )
+
+        self.poll(scratch_org)
+
+        assert finish.call_args.kwargs["org_result"] == {"Status": "Active"}
+        assert finalize_provision.call_args.kwargs["error"] is None
+
+    def test_active__refreshing(self, mocker, scratch_org_factory):
+        scratch_org = scratch_org_factory(
+            scratch_org_info_id="2SR000000000001", currently_refreshing_org=True
+        )
+        mocker.patch(
+            f"{PATCH_ROOT}.check_org_creation", return_value={"Status": "Active"}
+        )
+        mocker.patch(f"{PATCH_ROOT}.local_github_checkout")
+        mocker.patch(f"{PATCH_ROOT}._finish_org_creation_and_run_flow")
+        finalize_refresh_org = mocker.patch(
+            "metecho.api.models.ScratchOrg.finalize_refresh_org"
+        )
+
+        self.poll(scratch_org)
+
+        assert finalize_refresh_org.called
+
+    def test_deleted(self, mocker, scratch_org_factory):
+        scratch_org = scratch_org_factory(
+            scratch_org_info_id="2SR000000000001", deleted_at=now()
+        )
+        check_org_creation = mocker.patch(f"{PATCH_ROOT}.check_org_creation")
+
+        self.poll(scratch_org)
+
+        assert not check_org_creation.called
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("get_nonsource_types_exception", [False, True])
+def test_get_unsaved_changes(scratch_org_factory, get_nonsource_types_exception):
     scratch_org = scratch_org_factory(
-        latest_revision_numbers={"TypeOne": {"NameOne": 10}}
+        latest_revision_numbers={"TypeOne": {"NameOne": 10}}, api_version="58.0"
     )
     with ExitStack() as stack:
-        project_config, org_config, sf, schema, repo = patch_dataset_env
-        stack.enter_context(patch(f"{PATCH_ROOT}.local_github_checkout"))
-        stack.enter_context(patch("metecho.api.sf_org_changes.get_repo_info"))
-        get_valid_target_directories = stack.enter_context(
-            patch(f"{PATCH_ROOT}.get_valid_target_directories")
+        local_github_checkout = stack.enter_context(
+            patch(f"{PATCH_ROOT}.local_github_checkout")
         )
-        ListNonSourceTrackable = stack.enter_context(
-            patch(f"{PATCH_ROOT}.ListNonSourceTrackable")
+        get_nonsource_types = stack.enter_context(
+            patch(f"{PATCH_ROOT}.get_nonsource_types")
         )
-        get_valid_target_directories.return_value = (
-            {"source": ["src"], "config": [], "post": [], "pre": []},
-            False,
-        )
-        if ListNonSourceTrackable_exception:
-            ListNonSourceTrackable.return_value = MagicMock(side_effect=Exception)
+        if get_nonsource_types_exception:
+            get_nonsource_types.side_effect = Exception
         else:
-            ListNonSourceTrackable.return_value = MagicMock(
-                return_value=["TypeThree", "TypeFour"]
-            )
+            get_nonsource_types.return_value = ["TypeFour", "TypeThree"]
         get_latest_revision_numbers = stack.enter_context(
             patch(f"{PATCH_ROOT}.get_latest_revision_numbers")
         )
@@ -514,11 +756,13 @@ def test_get_unsaved_changes(
         get_unsaved_changes(scratch_org=scratch_org, originating_user_id=None)
         scratch_org.refresh_from_db()
 
+        get_nonsource_types.assert_called_once_with("58.0")
+        assert not local_github_checkout.called
         assert scratch_org.unsaved_changes == {
             "TypeOne": ["NameOne"],
             "TypeTwo": ["NameTwo"],
         }
-        if ListNonSourceTrackable_exception:
+        if get_nonsource_types_exception:
             assert scratch_org.non_source_changes == {}
         else:
             assert scratch_org.non_source_changes == {
@@ -528,6 +772,22 @@ def test_get_unsaved_changes(
         assert scratch_org.latest_revision_numbers == {"TypeOne": {"NameOne": 10}}
 
 
+@pytest.mark.django_db
+def test_get_unsaved_changes_for_orgs(scratch_org_factory, user_factory):
+    owner = user_factory()
+    failing_org = scratch_org_factory(owner=owner)
+    other_org = scratch_org_factory(owner=owner)
+    deleted_org = scratch_org_factory(deleted_at=now())
+    with patch(f"{PATCH_ROOT}.get_unsaved_changes") as get_unsaved_changes:
+        get_unsaved_changes.side_effect = [Exception, None]
+        get_unsaved_changes_for_orgs(
+            [failing_org.id, other_org.id, deleted_org.id], originating_user_id=None
+        )
+
+    refreshed = {call.args[0] for call in get_unsaved_changes.call_args_list}
+    assert refreshed == {failing_org, other_org}
+
+
 @pytest.mark.django_db
 class TestNonSourceComponents:
     def test_get_nonsource_components(self, scratch_org_factory, patch_dataset_env):
@@ -584,8 +844,8 @@ def test_create_branches_on_github_then_create_scratch_org():
             patch(f"{PATCH_ROOT}._create_branches_on_github")
         )
         _create_branches_on_github.return_value = "this_branch"
-        _create_org_and_run_flow = stack.enter_context(
-            patch(f"{PATCH_ROOT}._create_org_and_run_flow")
+        _start_org_creation = stack.enter_context(
+            patch(f"{PATCH_ROOT}._start_org_creation")
         )
         stack.enter_context(patch(f"{PATCH_ROOT}.get_scheduler"))
         get_repo_info = stack.enter_context(patch(f"{PATCH_ROOT}.get_repo_info"))
@@ -602,7 +862,149 @@ def test_create_branches_on_github_then_create_scratch_org():
         )
 
         assert _create_branches_on_github.called
-        assert _create_org_and_run_flow.called
+        assert _start_org_creation.called
+
+
+@pytest.mark.django_db
+class TestScratchOrgPool:
+    @pytest.fixture
+    def pooled_org(self, scratch_org_factory, scratch_org_pool_factory):
+        def _pooled_org(pool, **kwargs):
+            with patch("metecho.api.models.ScratchOrg.queue_provision"):
+                return scratch_org_factory(
+                    task=None,
+                    project=pool.project,
+                    org_type=ScratchOrgType.PLAYGROUND,
+                    org_config_name=pool.org_config_name,
+                    owner=pool.builder,
+                    pool=pool,
+                    **kwargs,
+                )
+
+        return _pooled_org
+
+    def test_replenish(self, scratch_org_pool_factory, pooled_org):
+        # The project's latest_sha lags behind the head of its branch:
+        pool = scratch_org_pool_factory(project__latest_sha="old", size=3)
+        fresh = pooled_org(pool, is_created=True, latest_commit="abc123")
+        stale = pooled_org(
+            pool, is_created=True, latest_commit="old", last_modified_at=now()
+        )
+        with ExitStack() as stack:
+            stack.enter_context(patch("metecho.api.model_mixins.async_to_sync"))
+            stack.enter_context(patch(f"{PATCH_ROOT}.delete_scratch_org_job"))
+            stack.enter_context(patch(f"{PATCH_ROOT}.get_repo_info"))
+            get_branch_sha = stack.enter_context(patch(f"{PATCH_ROOT}.get_branch_sha"))
+            get_branch_sha.return_value = "abc123"
+            queue_provision = stack.enter_context(
+                patch("metecho.api.models.ScratchOrg.queue_provision")
+            )
+            replenish_scratch_org_pool(pool)
+
+        stale.refresh_from_db()
+        assert stale.delete_queued_at is not None
+        assert queue_provision.call_count == 2
+        live = pool.orgs.active().filter(delete_queued_at__isnull=True)
+        assert live.count() == 3
+        assert fresh in live
+
+    def test_claim(self, scratch_org_factory, scratch_org_pool_factory, pooled_org):
+        pool = scratch_org_pool_factory(org_config_name="dev")
+        pooled = pooled_org(
+            pool,
+            is_created=True,
+            latest_commit="abc123",
+            url="https://example.com",
+            expires_at=now(),
+            expiry_job_id="job-1",
+        )
+        pooled.append_log("Built\n")
+        scratch_org = scratch_org_factory(
+            task=None,
+            project=pool.project,
+            org_type=ScratchOrgType.PLAYGROUND,
+            org_config_name="dev",
+        )
+        with ExitStack() as stack:
+            stack.enter_context(patch(f"{PATCH_ROOT}.get_repo_info"))
+            get_branch_sha = stack.enter_context(
+                patch(f"{PATCH_ROOT}.get_branch_sha", return_value="abc123")
+            )
+            get_scheduler = stack.enter_context(patch(f"{PATCH_ROOT}.get_scheduler"))
+            stack.enter_context(
+                patch("metecho.api.models.ScratchOrg.get_refreshed_org_config")
+            )
+            queue_replenish = stack.enter_context(
+                patch("metecho.api.models.ScratchOrgPool.queue_replenish")
+            )
+
+            assert _claim_pooled_org(
+                scratch_org, user=scratch_org.owner, repo_id=123, commit_ish="main"
+            )
+
+        assert get_branch_sha.call_args.args[1] == "main"
+        get_scheduler.return_value.cancel.assert_called_with("job-1")
+        assert queue_replenish.called
+        scratch_org.refresh_from_db()
+        pooled.refresh_from_db()
+        assert scratch_org.url == "https://example.com"
+        assert scratch_org.is_created
+        assert b"".join(scratch_org.read_log()) == b"Built\n"
+        assert pooled.deleted_at is not None
+        assert pooled.pool is None
+
+    def test_claim__outdated(
+        self, scratch_org_factory, scratch_org_pool_factory, pooled_org
+    ):
+        pool = scratch_org_pool_factory(org_config_name="dev")
+        pooled_org(pool, is_created=True, latest_commit="old")
+        scratch_org = scratch_org_factory(
+            task=None,
+            project=pool.project,
+            org_type=ScratchOrgType.PLAYGROUND,
+            org_config_name="dev",
+        )
+        with ExitStack() as stack:
+            stack.enter_context(patch(f"{PATCH_ROOT}.get_repo_info"))
+            stack.enter_context(
+                patch(f"{PATCH_ROOT}.get_branch_sha", return_value="abc123")
+            )
+
+            assert not _claim_pooled_org(
+                scratch_org, user=scratch_org.owner, repo_id=123, commit_ish="main"
+            )
+
+    def test_claim__other_devhub(
+        self, scratch_org_factory, scratch_org_pool_factory, pooled_org
+    ):
+        pool = scratch_org_pool_factory(
+            org_config_name="dev", builder__devhub_username="pool@example.com"
+        )
+        pooled = pooled_org(pool, is_created=True, latest_commit="abc123")
+        scratch_org = scratch_org_factory(
+            task=None,
+            project=pool.project,
+            org_type=ScratchOrgType.PLAYGROUND,
+            org_config_name="dev",
+            owner__devhub_username="user@example.com",
+        )
+        with patch(f"{PATCH_ROOT}.get_repo_info") as get_repo_info:
+            assert not _claim_pooled_org(
+                scratch_org, user=scratch_org.owner, repo_id=123, commit_ish="main"
+            )
+            assert not get_repo_info.called
+
+        pooled.refresh_from_db()
+        assert pooled.pool == pool
+        assert pooled.deleted_at is None
+
+    def test_claim__no_pool(self, scratch_org_factory):
+        scratch_org = scratch_org_factory()
+        with patch(f"{PATCH_ROOT}.get_repo_info") as get_repo_info:
+            assert not _claim_pooled_org(
+                scratch_org, user=scratch_org.owner, repo_id=123, commit_ish="main"
+            )
+            assert not get_repo_info.called
 
 
 @pytest.mark.django_db
@@ -612,13 +1014,13 @@ class TestRefreshScratchOrg:
         with ExitStack() as stack:
             delete_org = stack.enter_context(patch(f"{PATCH_ROOT}.delete_org"))
             stack.enter_context(patch(f"{PATCH_ROOT}.local_github_checkout"))
-            _create_org_and_run_flow = stack.enter_context(
-                patch(f"{PATCH_ROOT}._create_org_and_run_flow")
+            _start_org_creation = stack.enter_context(
+                patch(f"{PATCH_ROOT}._start_org_creation")
             )
             refresh_scratch_org(scratch_org, originating_user_id=None)
 
             assert delete_org.called
-            assert _create_org_and_run_flow.called
+            assert _start_org_creation.called
 
     def test_refresh_scratch_org__error(self, scratch_org_factory):
         scratch_org = scratch_org_factory()
@@ -691,10 +1093,15 @@ class TestConvertScratchOrg:
 @pytest.mark.django_db
 def test_delete_scratch_org(scratch_org_factory):
     scratch_org = scratch_org_factory()
-    with patch(f"{PATCH_ROOT}.delete_org") as sf_delete_scratch_org:
+    with ExitStack() as stack:
+        sf_delete_scratch_org = stack.enter_context(patch(f"{PATCH_ROOT}.delete_org"))
+        forget_org_schema = stack.enter_context(
+            patch(f"{PATCH_ROOT}.forget_org_schema")
+        )
         delete_scratch_org(scratch_org, originating_user_id=None)
 
         assert sf_delete_scratch_org.called
+        forget_org_schema.assert_called_once_with(scratch_org)
 
 
 @pytest.mark.django_db
@@ -954,7 +1361,7 @@ class TestRefreshCommits:
             )
             repo = MagicMock(
                 **{
-                    "compare_commits.return_value": MagicMock(ahead_by=0),
+                    "compare_commits.return_value": MagicMock(ahead_by=0, behind_by=0),
                     "branch.return_value": MagicMock(commit=MagicMock(sha="bleep")),
                     "commits.return_value": [commit1, commit2],
                 }
@@ -965,12 +1372,17 @@ class TestRefreshCommits:
                 patch("metecho.api.gh.get_repo_info")
             )
             gh_get_repo_info.return_value = repo
+            compare_branches = stack.enter_context(
+                patch("metecho.api.gh.compare_branches")
+            )
+            compare_branches.return_value = {("epic", "task"): {"ahead_by": 1}}
 
             refresh_commits(
                 project=project, branch_name="task", originating_user_id=None
             )
             task.refresh_from_db()
             assert len(task.commits) == 1
+            assert task.has_unmerged_commits
 
             refresh_commits(
                 project=project, branch_name="epic", originating_user_id=None
@@ -984,6 +1396,171 @@ class TestRefreshCommits:
             project.refresh_from_db()
             assert project.latest_sha == "abcd1234"
 
+    def test_stops_at_last_origin(
+        self, mocker, project_factory, task_with_project_factory
+    ):
+        project = project_factory(repo_id=789, branch_name="project")
+        task1 = task_with_project_factory(
+            project=project, branch_name="task", origin_sha="sha1"
+        )
+        task2 = task_with_project_factory(
+            project=project, branch_name="task", origin_sha="sha2"
+        )
+        consumed = []
+
+        def commits(*args, **kwargs):
+            for i in range(5):
+                consumed.append(i)
+                yield Commit(sha=f"sha{i}", commit=Commit(author={}))
+
+        repo = mocker.patch(f"{PATCH_ROOT}.get_repo_info").return_value
+        repo.commits.side_effect = commits
+        normalize_commit = mocker.patch(
+            f"{PATCH_ROOT}.normalize_commit", side_effect=lambda commit: commit.sha
+        )
+        mocker.patch("metecho.api.models.Task.compare_branches")
+        mocker.patch("metecho.api.models.Task.update_has_unmerged_commits")
+        mocker.patch("metecho.api.models.Task.update_review_valid")
+
+        refresh_commits(project=project, branch_name="task", originating_user_id=None)
+
+        task1.refresh_from_db()
+        task2.refresh_from_db()
+        assert task1.commits == ["sha0"]
+        assert task2.commits == ["sha0", "sha1"]
+        assert consumed == [0, 1, 2]
+        assert normalize_commit.call_count == 2
+
+    def test_origin_not_found(
+        self, mocker, caplog, project_factory, task_with_project_factory
+    ):
+        project = project_factory(repo_id=789, branch_name="project")
+        task = task_with_project_factory(
+            project=project, branch_name="task", origin_sha="nope"
+        )
+        repo = mocker.patch(f"{PATCH_ROOT}.get_repo_info").return_value
+        repo.commits.return_value = [
+            Commit(sha="sha0", commit=Commit(author={})),
+            Commit(sha="sha1", commit=Commit(author={})),
+        ]
+        mocker.patch(
+            f"{PATCH_ROOT}.normalize_commit", side_effect=lambda commit: commit.sha
+        )
+        mocker.patch("metecho.api.models.Task.compare_branches")
+        mocker.patch("metecho.api.models.Task.update_has_unmerged_commits")
+        mocker.patch("metecho.api.models.Task.update_review_valid")
+
+        refresh_commits(project=project, branch_name="task", originating_user_id=None)
+
+        task.refresh_from_db()
+        assert task.commits == ["sha0", "sha1"]
+        assert "Origin nope" in caplog.text
+
+
+@pytest.mark.django_db
+class TestProcessWebhookInbox:
+    @pytest.fixture(autouse=True)
+    def get_scheduler(self, mocker):
+        return mocker.patch(f"{PATCH_ROOT}.get_scheduler")
+
+    def push(self, ref, *shas, forced=False):
+        return WebhookDelivery.objects.create(
+            event="push",
+            payload={
+                "forced": forced,
+                "ref": f"refs/heads/{ref}",
+                "repository": {"id": 123},
+                "sender": {},
+                "commits": [
+                    {
+                        "id": sha,
+                        "timestamp": "2019-11-20 21:32:53.668260+00:00",
+                        "author": {},
+                        "message": "Message",
+                        "url": "https://github.com/test/user/foo",
+                    }
+                    for sha in shas
+                ],
+            },
+        )
+
+    def test_coalesces_pushes(self, mocker, project_factory):
+        project_factory(repo_id=123)
+        add_commits = mocker.patch("metecho.api.models.Project.add_commits")
+        first = self.push("main", "sha1")
+        self.push("feature", "sha2")
+        self.push("main", "sha3")
+
+        process_webhook_inbox()
+
+        assert add_commits.call_count == 2
+        main, feature = add_commits.call_args_list
+        assert main.kwargs["ref"] == "main"
+        assert [c["id"] for c in main.kwargs["commits"]] == ["sha3", "sha1"]
+        assert feature.kwargs["ref"] == "feature"
+        first.refresh_from_db()
+        assert first.processed_at is not None
+        assert not WebhookDelivery.objects.filter(processed_at__isnull=True).exists()
+
+    def test_records_errors(self, mocker, caplog, project_factory):
+        project_factory(repo_id=123)
+        mocker.patch(
+            "metecho.api.models.Project.add_commits", side_effect=Exception("Oh no!")
+        )
+        delivery = self.push("main", "sha1")
+
+        process_webhook_inbox()
+
+        delivery.refresh_from_db()
+        assert "Oh no!" in delivery.error
+        assert "Oh no!" in caplog.text
+
+    def test_crash_leaves_deliveries_claimed(
+        self, mocker, project_factory, get_scheduler
+    ):
+        project_factory(repo_id=123)
+        mocker.patch("metecho.api.models.Project.add_commits", side_effect=SystemExit)
+        delivery = self.push("main", "sha1")
+
+        with pytest.raises(SystemExit):
+            process_webhook_inbox()
+
+        delivery.refresh_from_db()
+        assert delivery.claimed_at is not None
+        assert delivery.processed_at is None
+        # A follow-up run is left scheduled:
+        assert get_scheduler.return_value.enqueue_in.called
+        assert not get_scheduler.return_value.cancel.called
+
+    def test_reclaims_lapsed_claims(self, mocker, settings, project_factory):
+        settings.MAXIMUM_JOB_LENGTH = 60
+        project_factory(repo_id=123)
+        add_commits = mocker.patch("metecho.api.models.Project.add_commits")
+        lapsed = self.push("main", "sha1")
+        claimed = self.push("feature", "sha2")
+        WebhookDelivery.objects.filter(pk=lapsed.pk).update(
+            claimed_at=now() - timedelta(seconds=120)
+        )
+        WebhookDelivery.objects.filter(pk=claimed.pk).update(claimed_at=now())
+
+        process_webhook_inbox()
+
+        assert add_commits.call_count == 1
+        assert add_commits.call_args.kwargs["ref"] == "main"
+        claimed.refresh_from_db()
+        assert claimed.processed_at is None
+
+    def test_skips_processed(self, mocker, project_factory):
+        project_factory(repo_id=123)
+        add_commits = mocker.patch("metecho.api.models.Project.add_commits")
+        delivery = self.push("main", "sha1")
+        delivery.processed_at = now()
+        delivery.save()
+
+        process_webhook_inbox()
+
+        assert not add_commits.called
+
 
 @pytest.mark.django_db
 def test_create_pr(
@@ -1052,64 +1629,57 @@ def test_create_pr__error(user_factory, task_factory):
 
 @pytest.mark.django_db
 class TestRefreshGitHubUsers:
-    def test_success(self, mocker, project_factory):
+    def test_success(self, mocker, project_factory, git_hub_user_factory):
         project = project_factory(currently_fetching_github_users=True)
+        stale = git_hub_user_factory(id=789)
+        GitHubCollaboration.objects.create(project=project, user=stale)
+        existing = git_hub_user_factory(id=123, login="old", name="Old")
+        GitHubCollaboration.objects.create(
+            project=project, user=existing, permissions={"push": True}
+        )
         notify_changed = mocker.patch.object(
             project, "notify_changed", wraps=project.notify_changed
         )
-        collab1 = MagicMock(
-            id=123, login="u1", avatar_url="http://1", permissions={"push": False}
-        )
-        collab2 = MagicMock(
-            id=456, login="u2", avatar_url="http://2", permissions={"push": True}
-        )
+        mocker.patch(f"{PATCH_ROOT}.get_repo_info")
         mocker.patch(
-            f"{PATCH_ROOT}.get_repo_info",
-            **{"return_value.collaborators.return_value": [collab1, collab2]},
+            f"{PATCH_ROOT}.get_repo_collaborators",
+            return_value=[
+                {
+                    "id": 123,
+                    "login": "u1",
+                    "name": "NAME",
+                    "avatar_url": "http://1",
+                    "permissions": {"push": False},
+                },
+                {
+                    "id": 456,
+                    "login": "u2",
+                    "name": "",
+                    "avatar_url": "http://2",
+                    "permissions": {"push": True},
+                },
+            ],
         )
-        mocker.patch(f"{PATCH_ROOT}.get_cached_user", **{"return_value.name": "NAME"})
 
         refresh_github_users(project, originating_user_id=None)
 
         project.refresh_from_db()
         assert list(project.github_users.values()) == [
             {"id": 123, "name": "NAME", "login": "u1", "avatar_url": "http://1"},
-            {"id": 456, "name": "NAME", "login": "u2", "avatar_url": "http://2"},
+            {"id": 456, "name": "", "login": "u2", "avatar_url": "http://2"},
         ]
-        assert list(project.githubcollaboration_set.values("user", "permissions")) == [
+        assert list(
+            project.githubcollaboration_set.order_by("user").values(
+                "user", "permissions"
+            )
+        ) == [
             {"user": 123, "permissions": {"push": False}},
             {"user": 456, "permissions": {"push": True}},
         ]
+        assert GitHubUser.objects.filter(id=789).exists()
         assert not project.currently_fetching_github_users
         assert notify_changed.called
 
-    def test_expand_user_error(self, caplog, mocker, project_factory):
-        """
-        Expect the "simple" representation of the user if expanding them fails
-        """
-        project = project_factory(currently_fetching_github_users=True)
-        notify_changed = mocker.patch.object(
-            project, "notify_changed", wraps=project.notify_changed
-        )
-        user = MagicMock(id=123, login="u1", avatar_url="https://1", permissions={})
-        mocker.patch(
-            f"{PATCH_ROOT}.get_repo_info",
-            **{"return_value.collaborators.return_value": [user]},
-        )
-        mocker.patch(
-            f"{PATCH_ROOT}.get_cached_user", side_effect=Exception("CACHE ERROR")
-        )
-
-        refresh_github_users(project, originating_user_id=None)
-
-        project.refresh_from_db()
-        assert list(project.github_users.values()) == [
-            {"id": 123, "login": "u1", "name": "", "avatar_url": "https://1"},
-        ]
-        assert not project.currently_fetching_github_users
-        assert notify_changed.called
-        assert "CACHE ERROR" in caplog.text
-
     def test_error(self, mocker, caplog, project_factory):
         project = project_factory(currently_fetching_github_users=True)
         notify_error = mocker.patch.object(
@@ -1280,7 +1850,7 @@ class TestCreateGhBranchForNewEpic:
                     "pull_requests.return_value": (
                         _ for _ in range(0)  # empty generator
                     ),
-                    "compare_commits.return_value": MagicMock(ahead_by=0),
+                    "compare_commits.return_value": MagicMock(ahead_by=0, behind_by=0),
                 }
             )
 
@@ -1815,13 +2385,126 @@ def patch_dataset_env(mocker, tmp_path):
     )
     mocker.patch(f"{PATCH_ROOT}.BaseCumulusCI")
     mocker.patch(
-        f"{PATCH_ROOT}.get_org_schema",
+        f"{PATCH_ROOT}.cached_org_schema",
         **{"return_value.__enter__.return_value": schema},
         autospec=True,
     )
     yield (project_config, org_config, sf, schema, repo)
 
 
+class TestCachedOrgSchema:
+    @pytest.fixture
+    def cache(self, mocker):
+        cached = {}
+        cache = mocker.patch(f"{PATCH_ROOT}.cache")
+        cache.get.side_effect = cached.get
+        cache.set.side_effect = lambda key, value, timeout: cached.update({key: value})
+        return cached
+
+    def test_miss(self, mocker, cache):
+        org = MagicMock(id="abc", config={"org_id": "00D1"})
+        mocker.patch(f"{PATCH_ROOT}.get_schema_revision", return_value=3)
+        database = gzip.compress(b"")
+        schema = MagicMock(included_objects=["Account"])
+        schema.path.open.return_value.__enter__.return_value.read.return_value = (
+            database
+        )
+        get_org_schema = mocker.patch(
+            f"{PATCH_ROOT}.get_org_schema",
+            **{"return_value.__enter__.return_value": schema},
+        )
+        populate_counts = mocker.patch(
+            f"{PATCH_ROOT}.populate_counts", return_value={"Account": 10}
+        )
+
+        with cached_org_schema(
+            org, MagicMock(), MagicMock(), include_counts=True
+        ) as yielded:
+            assert yielded is schema
+        with cached_org_schema(org, MagicMock(), MagicMock()) as yielded:
+            assert yielded is not schema
+
+        assert get_org_schema.call_count == 1
+        assert cache["org_schema_abc_00D1"] == {
+            "revision": 3,
+            "database": database,
+            "included_objects": ["Account"],
+        }
+        assert populate_counts.call_count == 1
+        assert cache["org_schema_counts_abc_00D1"] == {"Account": 10}
+
+    def test_hit(self, mocker, cache):
+        org = MagicMock(id="abc", config={"org_id": "00D1"})
+        mocker.patch(f"{PATCH_ROOT}.get_schema_revision", return_value=3)
+        get_org_schema = mocker.patch(f"{PATCH_ROOT}.get_org_schema")
+        populate_counts = mocker.patch(f"{PATCH_ROOT}.populate_counts")
+        cache["org_schema_abc_00D1"] = {
+            "revision": 3,
+            "database": gzip.compress(b""),
+            "included_objects": ["Account"],
+        }
+        cache["org_schema_counts_abc_00D1"] = {}
+
+        with cached_org_schema(
+            org, MagicMock(), MagicMock(), include_counts=True
+        ) as schema:
+            assert schema.included_objects == ["Account"]
+            assert schema.includes_counts
+
+        assert not get_org_schema.called
+        assert not populate_counts.called
+
+    def test_schema_changed(self, mocker, cache):
+        org = MagicMock(id="abc", config={"org_id": "00D1"})
+        mocker.patch(f"{PATCH_ROOT}.get_schema_revision", return_value=4)
+        schema = MagicMock(included_objects=["Account", "Custom__c"])
+        schema.path.open.return_value.__enter__.return_value.read.return_value = b"db"
+        get_org_schema = mocker.patch(
+            f"{PATCH_ROOT}.get_org_schema",
+            **{"return_value.__enter__.return_value": schema},
+        )
+        cache["org_schema_abc_00D1"] = {
+            "revision": 3,
+            "database": b"old",
+            "included_objects": ["Account"],
+        }
+
+        with cached_org_schema(org, MagicMock(), MagicMock()):
+            pass
+
+        assert get_org_schema.called
+        assert cache["org_schema_abc_00D1"]["revision"] == 4
+
+    def test_org_replaced(self, mocker, cache):
+        # A refresh gives the record a new Salesforce org, whose counters restart
+        org = MagicMock(id="abc", config={"org_id": "00D2"})
+        mocker.patch(f"{PATCH_ROOT}.get_schema_revision", return_value=3)
+        schema = MagicMock(included_objects=["Account"])
+        schema.path.open.return_value.__enter__.return_value.read.return_value = b"db"
+        get_org_schema = mocker.patch(
+            f"{PATCH_ROOT}.get_org_schema",
+            **{"return_value.__enter__.return_value": schema},
+        )
+        cache["org_schema_abc_00D1"] = {
+            "revision": 3,
+            "database": b"old",
+            "included_objects": ["Account"],
+        }
+
+        with cached_org_schema(org, MagicMock(), MagicMock()):
+            pass
+
+        assert get_org_schema.called
+        assert cache["org_schema_abc_00D2"]["database"] == b"db"
+
+    def test_forget_org_schema(self, mocker):
+        cache = mocker.patch(f"{PATCH_ROOT}.cache")
+        forget_org_schema(MagicMock(id="abc", config={"org_id": "00D1"}))
+        cache.delete_many.assert_called_once_with(
+            ("org_schema_abc_00D1", "org_schema_counts_abc_00D1")
+        )
+
+
 EXPECTED_SCHEMA_OUTPUT = {
     "Account": {
         "label": "ACCOUNT",
@@ -11,12 +11,16 @@ from ..models import (
     Epic,
     EpicStatus,
     GitHubUser,
+    ScratchOrg,
     ScratchOrgType,
     SiteProfile,
     Task,
     TaskStatus,
+    User,
+    WebhookDelivery,
     user_logged_in_handler,
 )
+from ..sf_run_flow import ACCESS_TOKEN_REQUEST_LOCK_WAIT
 
 
 class TestSiteProfile:
@@ -65,6 +69,23 @@ class TestProject:
             project.queue_refresh_commits(ref="some branch", originating_user_id=None)
             assert refresh_commits_job.delay.called
 
+    def test_refresh_branches(self, mocker, project_factory):
+        project = project_factory()
+        project.branches.create(name="gone", latest_sha="abc")
+        project.branches.create(name="kept", latest_sha="abc")
+        get_repo_info = mocker.patch("metecho.api.gh.get_repo_info")
+        branch = MagicMock(commit=MagicMock(sha="def"))
+        branch.name = "kept"
+        get_repo_info.return_value.branches.return_value = [branch]
+
+        project.refresh_branches()
+
+        assert list(project.branches.values_list("name", "latest_sha")) == [
+            ("kept", "def")
+        ]
+        project.refresh_from_db()
+        assert project.branches_synced_at is not None
+
     def test_save__no_branch_name(self, mocker, project_factory):
         with patch("metecho.api.gh.get_repo_info") as get_repo_info:
             repo_branch = MagicMock()
@@ -226,6 +247,21 @@ class TestTask:
         task = task_with_project_factory()
         assert task.project.slug in task.get_absolute_url()
 
+    def test_add_commits__skips_known(self, mocker, task_factory):
+        mocker.patch("metecho.api.models.Task.update_has_unmerged_commits")
+        mocker.patch("metecho.api.models.Task.update_review_valid")
+        mocker.patch("metecho.api.models.Task.notify_changed")
+        mocker.patch(
+            "metecho.api.gh.normalize_commit",
+            side_effect=lambda commit, sender: {"id": commit["id"]},
+        )
+        task = task_factory(commits=[{"id": "sha1"}])
+
+        task.add_commits([{"id": "sha2"}, {"id": "sha1"}], {})
+
+        task.refresh_from_db()
+        assert task.commits == [{"id": "sha2"}, {"id": "sha1"}]
+
     def test_notify_changed(self, task_factory):
         with ExitStack() as stack:
             stack.enter_context(patch("metecho.api.jobs.create_pr_job"))
@@ -237,6 +273,38 @@ class TestTask:
 
             assert async_to_sync.called
 
+    def test_update_has_unmerged_commits(self, mocker, task_factory):
+        gh = mocker.patch("metecho.api.models.gh")
+        gh.compare_shas.return_value = {"ahead_by": 1, "behind_by": 0}
+        task = task_factory(branch_name="task")
+
+        task.update_has_unmerged_commits()
+        assert task.has_unmerged_commits
+
+        task.update_has_unmerged_commits({(task.get_base(), "task"): {"ahead_by": 0}})
+        assert not task.has_unmerged_commits
+        assert gh.compare_shas.call_count == 1
+
+        # A pair left out of the batch, as a branch is missing, is compared alone
+        task.update_has_unmerged_commits({})
+        assert task.has_unmerged_commits
+        assert gh.compare_shas.call_count == 2
+
+    def test_compare_branches(self, mocker, task_factory):
+        gh = mocker.patch("metecho.api.models.gh")
+        task1 = task_factory(branch_name="task1")
+        task2 = task_factory(branch_name="task2", epic=task1.epic)
+        unbranched = task_factory(branch_name="", epic=task1.epic)
+
+        assert Task.compare_branches([unbranched]) is None
+        Task.compare_branches([task1, task2, unbranched])
+
+        repo, pairs = gh.compare_branches.call_args.args
+        assert pairs == [
+            (task1.get_base(), "task1"),
+            (task2.get_base(), "task2"),
+        ]
+
     def test_finalize_status_completed(self, task_factory):
         with ExitStack() as stack:
             async_to_sync = stack.enter_context(
@@ -713,6 +781,11 @@ class TestUser:
             get_devhub_api.return_value = client
             assert user.is_devhub_enabled
 
+            # Later requests reuse the answer:
+            user = User.objects.get(pk=user.pk)
+            assert user.is_devhub_enabled
+            assert client.restful.call_count == 1
+
     def test_is_devhub_enabled__false(self, user_factory, social_account_factory):
         user = user_factory()
         social_account_factory(
@@ -884,6 +957,106 @@ class TestScratchOrg:
 
             assert not get_unsaved_changes_job.delay.called
 
+    def test_queue_get_unsaved_changes_for(self, scratch_org_factory):
+        with ExitStack() as stack:
+            get_unsaved_changes_for_orgs_job = stack.enter_context(
+                patch("metecho.api.jobs.get_unsaved_changes_for_orgs_job")
+            )
+            scratch_org = scratch_org_factory()
+            recently_checked = scratch_org_factory(
+                last_checked_unsaved_changes_at=now() - timedelta(minutes=1),
+            )
+            in_flight = scratch_org_factory(currently_refreshing_changes=True)
+            notify_list_changed = stack.enter_context(
+                patch("metecho.api.models.ScratchOrg.notify_list_changed")
+            )
+
+            ids = ScratchOrg.queue_get_unsaved_changes_for(
+                [scratch_org, recently_checked, in_flight], originating_user_id=None
+            )
+
+            assert ids == [scratch_org.id]
+            get_unsaved_changes_for_orgs_job.delay.assert_called_once_with(
+                [scratch_org.id], originating_user_id=None
+            )
+            notify_list_changed.assert_called_once_with(
+                type_="SCRATCH_ORGS_FETCH_CHANGES",
+                originating_user_id=None,
+                message={"ids": [str(scratch_org.id)]},
+            )
+            scratch_org.refresh_from_db()
+            assert scratch_org.currently_refreshing_changes
+
+    def test_queue_get_unsaved_changes_for__batches(
+        self, settings, scratch_org_factory
+    ):
+        settings.UNSAVED_CHANGES_BATCH_SIZE = 2
+        with ExitStack() as stack:
+            get_unsaved_changes_for_orgs_job = stack.enter_context(
+                patch("metecho.api.jobs.get_unsaved_changes_for_orgs_job")
+            )
+            async_to_sync = stack.enter_context(
+                patch("metecho.api.model_mixins.async_to_sync")
+            )
+            orgs = [scratch_org_factory() for _ in range(3)]
+
+            ids = ScratchOrg.queue_get_unsaved_changes_for(
+                orgs, originating_user_id=None
+            )
+
+            assert sorted(ids) == sorted(org.id for org in orgs)
+            batches = [
+                call.args[0]
+                for call in get_unsaved_changes_for_orgs_job.delay.call_args_list
+            ]
+            assert [len(batch) for batch in batches] == [2, 1]
+            assert async_to_sync.call_count == 1
+
+    def test_queue_get_unsaved_changes_for__force(self, scratch_org_factory):
+        with ExitStack() as stack:
+            get_unsaved_changes_for_orgs_job = stack.enter_context(
+                patch("metecho.api.jobs.get_unsaved_changes_for_orgs_job")
+            )
+            scratch_org = scratch_org_factory(
+                last_checked_unsaved_changes_at=now() - timedelta(minutes=1),
+            )
+
+            assert ScratchOrg.queue_get_unsaved_changes_for(
+                [scratch_org], force_get=True, originating_user_id=None
+            ) == [scratch_org.id]
+            assert get_unsaved_changes_for_orgs_job.delay.called
+
+    def test_queue_get_unsaved_changes_for__stale(self, settings, scratch_org_factory):
+        settings.MAXIMUM_JOB_LENGTH = 60
+        with ExitStack() as stack:
+            stack.enter_context(
+                patch("metecho.api.jobs.get_unsaved_changes_for_orgs_job")
+            )
+            stack.enter_context(patch("metecho.api.model_mixins.async_to_sync"))
+            # The job refreshing this one died and left the flag set:
+            stale = scratch_org_factory(currently_refreshing_changes=True)
+            ScratchOrg.objects.filter(id=stale.id).update(
+                edited_at=now() - timedelta(minutes=2)
+            )
+            in_flight = scratch_org_factory(currently_refreshing_changes=True)
+
+            ids = ScratchOrg.queue_get_unsaved_changes_for(
+                [stale, in_flight], originating_user_id=None
+            )
+
+            assert ids == [stale.id]
+            stale.refresh_from_db()
+            assert stale.currently_refreshing_changes
+            assert now() - stale.edited_at < timedelta(minutes=1)
+
+    def test_queue_get_unsaved_changes_for__none(self):
+        with patch("metecho.api.jobs.get_unsaved_changes_for_orgs_job") as job_:
+            assert (
+                ScratchOrg.queue_get_unsaved_changes_for([], originating_user_id=None)
+                == []
+            )
+            assert not job_.delay.called
+
     def test_finalize_provision(self, scratch_org_factory):
         with ExitStack() as stack:
             async_to_sync = stack.enter_context(
@@ -906,6 +1079,30 @@ class TestScratchOrg:
 
             assert delete_queued.delay.called
 
+    def test_finalize_provision__pooled(
+        self, scratch_org_factory, scratch_org_pool_factory
+    ):
+        pool = scratch_org_pool_factory()
+        with ExitStack() as stack:
+            async_to_sync = stack.enter_context(
+                patch("metecho.api.model_mixins.async_to_sync")
+            )
+            stack.enter_context(patch("metecho.api.models.ScratchOrg.queue_provision"))
+            replenish_job = stack.enter_context(
+                patch("metecho.api.jobs.replenish_scratch_org_pool_job")
+            )
+            scratch_org = scratch_org_factory(
+                task=None,
+                project=pool.project,
+                org_type=ScratchOrgType.PLAYGROUND,
+                owner=pool.builder,
+                pool=pool,
+            )
+            scratch_org.finalize_provision(originating_user_id=None)
+
+            assert not async_to_sync.called
+            replenish_job.delay.assert_called_with(pool)
+
     def test_get_login_url(self, scratch_org_factory):
         with ExitStack() as stack:
             refresh_access_token = stack.enter_context(
@@ -917,7 +1114,10 @@ class TestScratchOrg:
 
             scratch_org = scratch_org_factory()
             assert scratch_org.get_login_url() == "https://example.com"
-            assert refresh_access_token.called
+            assert (
+                refresh_access_token.call_args.kwargs["lock_wait"]
+                == ACCESS_TOKEN_REQUEST_LOCK_WAIT
+            )
 
     def test_remove_scratch_org(self, scratch_org_factory):
         with ExitStack() as stack:
@@ -957,6 +1157,33 @@ class TestScratchOrg:
         scratch_org.refresh_from_db()
         assert scratch_org.config == {"anything else": "good"}
 
+    def test_light(self, scratch_org_factory):
+        scratch_org = scratch_org_factory()
+
+        instance = ScratchOrg.objects.light().get(pk=scratch_org.pk)
+        assert instance.get_deferred_fields() == set(ScratchOrg.heavy_fields)
+        instance = ScratchOrg.objects.active().light("config").get(pk=scratch_org.pk)
+        assert "config" not in instance.get_deferred_fields()
+        assert "unsaved_changes" in instance.get_deferred_fields()
+
+    def test_log(self, scratch_org_factory):
+        scratch_org = scratch_org_factory()
+        assert scratch_org.log_size == 0
+        scratch_org.append_log("one\ntw")
+        scratch_org.append_log("")
+        scratch_org.append_log("o\nthree\n")
+
+        assert scratch_org.log_chunks.count() == 2
+        assert scratch_org.log_size == 14
+        assert b"".join(scratch_org.read_log()) == b"one\ntwo\nthree\n"
+        assert b"".join(scratch_org.read_log(4, 9)) == b"two\nt"
+        assert scratch_org.tail_log_offset(0) == 14
+        assert scratch_org.tail_log_offset(2) == 4
+        assert scratch_org.tail_log_offset(5) == 0
+
+        scratch_org.clear_log()
+        assert scratch_org.log_size == 0
+
     def test_is_omnistudio_installed(self, scratch_org_factory):
         scratch_org = scratch_org_factory()
         scratch_org.installed_packages = ["omnistudio", "foobar"]
@@ -993,6 +1220,52 @@ class TestGitHubIssue:
         assert str(gh_issue) == "Hello world"
 
 
+@pytest.mark.django_db
+class TestWebhookDelivery:
+    def test_str(self):
+        assert str(WebhookDelivery(pk=1, event="push")) == "push #1"
+
+    def test_receive(self, mocker):
+        queue_processing = mocker.patch.object(WebhookDelivery, "queue_processing")
+        first = WebhookDelivery.receive(delivery_id="abc", event="push", payload={})
+        duplicate = WebhookDelivery.receive(delivery_id="abc", event="push", payload={})
+        anonymous = WebhookDelivery.receive(delivery_id=None, event="push", payload={})
+
+        assert first is not None
+        assert duplicate is None
+        assert anonymous is not None
+        assert WebhookDelivery.objects.count() == 2
+        assert queue_processing.call_count == 2
+
+    def test_queue_processing(self, mocker):
+        job = mocker.patch("metecho.api.jobs.process_webhook_inbox_job")
+        mocker.patch("metecho.api.models.cache.add", side_effect=[True, False])
+
+        WebhookDelivery.queue_processing()
+        WebhookDelivery.queue_processing()
+
+        job.delay.assert_called_once()
+
+    def test_prune(self, settings):
+        settings.WEBHOOK_DELIVERY_RETENTION_DAYS = 7
+        old = WebhookDelivery.objects.create(
+            event="push", payload={}, processed_at=now()
+        )
+        WebhookDelivery.objects.filter(pk=old.pk).update(
+            received_at=now() - timedelta(days=8)
+        )
+        pending = WebhookDelivery.objects.create(event="push", payload={})
+        WebhookDelivery.objects.filter(pk=pending.pk).update(
+            received_at=now() - timedelta(days=8)
+        )
+        recent = WebhookDelivery.objects.create(
+            event="push", payload={}, processed_at=now()
+        )
+
+        assert WebhookDelivery.prune() == 1
+        assert set(WebhookDelivery.objects.all()) == {pending, recent}
+
+
 @pytest.mark.django_db
 def test_login_handler(user_factory):
     user = user_factory()
@@ -3,7 +3,7 @@ from unittest.mock import MagicMock, patch
 import pytest
 from channels.db import database_sync_to_async
 
-from ..push import report_error, report_scratch_org_error
+from ..push import push_message_about_list, report_error, report_scratch_org_error
 
 
 class AsyncMock(MagicMock):
@@ -58,3 +58,28 @@ async def test_report_scratch_org_error__dict():
             originating_user_id=None,
         )
         assert push_message_about_instance.called
+
+
+async def test_push_message_about_list():
+    with patch(f"{PATCH_ROOT}.get_channel_layer") as get_channel_layer, patch(
+        f"{PATCH_ROOT}.get_set_message_semaphore", new=AsyncMock(return_value=True)
+    ):
+        channel_layer = get_channel_layer.return_value
+        channel_layer.group_send = AsyncMock()
+        await push_message_about_list(
+            "scratchorg", {"type": "SCRATCH_ORGS_FETCH_CHANGES", "payload": {}}
+        )
+
+        channel_layer.group_send.assert_called_once_with(
+            "scratchorg.list",
+            {
+                "type": "notify",
+                "content": {
+                    "type": "SCRATCH_ORGS_FETCH_CHANGES",
+                    "payload": {},
+                    "model_name": "scratchorg",
+                    "id": "list",
+                    "include_user": False,
+                },
+            },
+        )
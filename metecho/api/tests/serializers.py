@@ -4,7 +4,7 @@ from unittest.mock import MagicMock, patch
 
 import pytest
 
-from ..models import GitHubUser, ScratchOrgType, Task
+from ..models import GitHubUser, ScratchOrg, ScratchOrgType, Task
 from ..serializers import (
     EpicSerializer,
     FullUserSerializer,
@@ -1113,3 +1113,19 @@ class TestScratchOrgSerializer:
         r = rf.get("/")
         serializer = ScratchOrgSerializer(instances, many=True, context={"request": r})
         assert all(instance["ignored_changes"] == {} for instance in serializer.data)
+
+    def test_heavy_fields(self, rf, user_factory, scratch_org_factory):
+        user = user_factory()
+        scratch_org = scratch_org_factory(owner=user, unsaved_changes={"A": ["b"]})
+        instance = ScratchOrg.objects.light(*ScratchOrgSerializer.heavy_fields).get(
+            pk=scratch_org.pk
+        )
+        deferred = instance.get_deferred_fields()
+
+        r = rf.get("/")
+        r.user = user
+        data = ScratchOrgSerializer(instance, context={"request": r}).data
+
+        assert data["unsaved_changes"] == {"A": ["b"]}
+        # Reading a deferred column would have loaded it
+        assert instance.get_deferred_fields() == deferred
@@ -7,6 +7,8 @@ from ..sf_org_changes import (
     commit_changes_to_github,
     compare_revisions,
     get_latest_revision_numbers,
+    get_nonsource_types,
+    get_schema_revision,
     get_valid_target_directories,
     run_retrieve_task,
 )
@@ -134,27 +136,31 @@ def test_get_latest_revision_numbers():
                     "MemberType": "some-type-1",
                     "MemberName": "some-name-1",
                     "RevisionCounter": 3,
+                    "IsNameObsolete": False,
                 },
                 {
                     "MemberType": "some-type-1",
                     "MemberName": "some-name-2",
                     "RevisionCounter": 3,
+                    "IsNameObsolete": False,
                 },
                 {
                     "MemberType": "some-type-2",
                     "MemberName": "some-name-1",
                     "RevisionCounter": 3,
+                    "IsNameObsolete": False,
                 },
                 {
                     "MemberType": "some-type-2",
                     "MemberName": "some-name-2",
                     "RevisionCounter": 3,
+                    "IsNameObsolete": False,
                 },
             ]
         }
         Salesforce.return_value = conn
 
-        scratch_org = MagicMock()
+        scratch_org = MagicMock(current_revision_numbers={}, max_revision_counter=0)
 
         get_latest_revision_numbers(
             scratch_org=scratch_org,
@@ -164,6 +170,128 @@ def test_get_latest_revision_numbers():
         assert conn.query_all.called
 
 
+def test_get_latest_revision_numbers__incremental():
+    with ExitStack() as stack:
+        Salesforce = stack.enter_context(
+            patch(f"{PATCH_ROOT}.simple_salesforce.Salesforce")
+        )
+        stack.enter_context(patch(f"{PATCH_ROOT}.refresh_access_token"))
+
+        conn = MagicMock()
+        conn.query_all.return_value = {
+            "records": [
+                {
+                    "MemberType": "some-type-1",
+                    "MemberName": "some-name-1",
+                    "RevisionCounter": 5,
+                    "IsNameObsolete": False,
+                },
+                {
+                    "MemberType": "some-type-2",
+                    "MemberName": "some-name-1",
+                    "RevisionCounter": 6,
+                    "IsNameObsolete": True,
+                },
+            ]
+        }
+        Salesforce.return_value = conn
+
+        scratch_org = MagicMock(
+            current_revision_numbers={
+                "some-type-1": {"some-name-1": 1, "some-name-2": 2},
+                "some-type-2": {"some-name-1": 3},
+            },
+            max_revision_counter=3,
+        )
+
+        assert get_latest_revision_numbers(
+            scratch_org=scratch_org,
+            originating_user_id=None,
+        ) == {"some-type-1": {"some-name-1": 5, "some-name-2": 2}}
+        assert "RevisionCounter > 3" in conn.query_all.call_args.args[0]
+        assert scratch_org.max_revision_counter == 6
+
+
+def test_get_latest_revision_numbers__copy():
+    with ExitStack() as stack:
+        Salesforce = stack.enter_context(
+            patch(f"{PATCH_ROOT}.simple_salesforce.Salesforce")
+        )
+        stack.enter_context(patch(f"{PATCH_ROOT}.refresh_access_token"))
+        Salesforce.return_value.query_all.return_value = {"records": []}
+        current = {"some-type-1": {"some-name-1": 1}}
+        scratch_org = MagicMock(
+            current_revision_numbers=current, max_revision_counter=1
+        )
+
+        latest = get_latest_revision_numbers(
+            scratch_org=scratch_org,
+            originating_user_id=None,
+        )
+        latest["some-type-1"]["some-name-1"] = 2
+
+        assert latest is not current
+        assert current == {"some-type-1": {"some-name-1": 1}}
+
+
+@pytest.mark.parametrize("records, revision", (([], 0), ([{"RevisionCounter": 7}], 7)))
+def test_get_schema_revision(records, revision):
+    with patch(f"{PATCH_ROOT}.get_salesforce_connection") as get_salesforce_connection:
+        get_salesforce_connection.return_value.query.return_value = {"records": records}
+
+        assert get_schema_revision(MagicMock()) == revision
+
+
+class TestGetNonsourceTypes:
+    def test_cached(self):
+        with ExitStack() as stack:
+            stack.enter_context(
+                patch(f"{PATCH_ROOT}.cache.get", return_value=["TypeOne"])
+            )
+            requests = stack.enter_context(patch(f"{PATCH_ROOT}.requests"))
+
+            assert get_nonsource_types("58.0") == ["TypeOne"]
+            assert not requests.get.called
+
+    def test_not_cached(self):
+        with ExitStack() as stack:
+            stack.enter_context(patch(f"{PATCH_ROOT}.cache.get", return_value=None))
+            cache_set = stack.enter_context(patch(f"{PATCH_ROOT}.cache.set"))
+            requests = stack.enter_context(patch(f"{PATCH_ROOT}.requests"))
+            requests.get.return_value.json.return_value = {
+                "types": {
+                    "TypeTwo": {
+                        "channels": {"sourceTracking": False, "metadataApi": True}
+                    },
+                    "Tracked": {
+                        "channels": {"sourceTracking": True, "metadataApi": True}
+                    },
+                    "TypeOne": {
+                        "channels": {"sourceTracking": False, "metadataApi": True}
+                    },
+                }
+            }
+
+            assert get_nonsource_types("58.0") == ["TypeOne", "TypeTwo"]
+            assert "version=58.0" in requests.get.call_args.args[0]
+            assert requests.get.call_args.kwargs["timeout"] == 30
+            assert cache_set.call_args.args[:2] == (
+                "nonsource_types_58.0",
+                ["TypeOne", "TypeTwo"],
+            )
+
+    def test_unsupported_version(self):
+        with ExitStack() as stack:
+            stack.enter_context(patch(f"{PATCH_ROOT}.cache.get", return_value=None))
+            requests = stack.enter_context(patch(f"{PATCH_ROOT}.requests"))
+            requests.get.return_value.json.return_value = {
+                "types": {"TypeOne": {"channels": {}}}
+            }
+
+            with pytest.raises(ValueError):
+                get_nonsource_types("1.0")
+
+
 def test_compare_revisions__true():
     old = {}
     new = {"type": {"name": 1}}
@@ -4,29 +4,39 @@ to change substantially, and as it stands, it's full of implicit
 external calls, so this would be mock-heavy anyway.
 """
 
+import json
 from contextlib import ExitStack
 from unittest.mock import MagicMock, patch
 
 import pytest
+from django.core.cache import cache
 from requests.exceptions import HTTPError
+from sfdo_template_helpers.crypto import fernet_encrypt
 
 from metecho.exceptions import SubcommandException
 
 from ..sf_run_flow import (
     ScratchOrgError,
+    _devhub_sessions,
+    access_token_cache_key,
     capitalize,
-    create_org,
+    check_org_creation,
     delete_org,
     deploy_org_settings,
+    finish_org_creation,
+    forget_access_token,
+    forget_devhub_session,
     get_access_token,
     get_devhub_api,
+    get_devhub_session,
     get_org_details,
     get_org_result,
     is_org_good,
     mutate_scratch_org,
-    poll_for_scratch_org_completion,
+    parse_flow_event,
     refresh_access_token,
     run_flow,
+    start_org_creation,
 )
 
 PATCH_ROOT = "metecho.api.sf_run_flow"
@@ -98,10 +108,108 @@ class TestRefreshAccessToken:
             assert scratch_org.remove_scratch_org.called
 
 
+@pytest.mark.django_db
+class TestRefreshAccessTokenCache:
+    @pytest.fixture
+    def OrgConfig(self, mocker):
+        def org_config(config, org_name, keychain=None):
+            instance = MagicMock(config=config)
+            instance.refresh_oauth_token.side_effect = lambda *args, **kwargs: (
+                config.update(access_token="token")
+            )
+            return instance
+
+        return mocker.patch(f"{PATCH_ROOT}.OrgConfig", side_effect=org_config)
+
+    def test_cached(self, OrgConfig, scratch_org_factory):
+        scratch_org = scratch_org_factory()
+        forget_access_token(scratch_org)
+
+        first = refresh_access_token(
+            config={"instance_url": "https://example.com"},
+            org_name="dev",
+            scratch_org=scratch_org,
+        )
+        second = refresh_access_token(
+            config={"instance_url": "https://example.com"},
+            org_name="dev",
+            scratch_org=scratch_org,
+        )
+
+        assert first.refresh_oauth_token.called
+        assert not second.refresh_oauth_token.called
+        assert second.config == {
+            "instance_url": "https://example.com",
+            "access_token": "token",
+        }
+        assert "token" not in cache.get(access_token_cache_key(scratch_org))
+
+    def test_waits_for_refresh(self, mocker, OrgConfig, scratch_org_factory):
+        scratch_org = scratch_org_factory()
+        key = access_token_cache_key(scratch_org)
+        forget_access_token(scratch_org)
+        cache.set(f"{key}_lock", True)
+
+        def sleep(seconds):
+            # Another caller finishes its refresh
+            cache.set(key, fernet_encrypt(json.dumps({"access_token": "shared"})))
+
+        mocker.patch(f"{PATCH_ROOT}.time.sleep", side_effect=sleep)
+
+        org_config = refresh_access_token(
+            config={}, org_name="dev", scratch_org=scratch_org
+        )
+
+        assert org_config.config == {"access_token": "shared"}
+        assert not org_config.refresh_oauth_token.called
+        cache.delete(f"{key}_lock")
+
+    def test_lock_timeout(self, mocker, OrgConfig, scratch_org_factory):
+        scratch_org = scratch_org_factory()
+        key = access_token_cache_key(scratch_org)
+        forget_access_token(scratch_org)
+        cache.set(f"{key}_lock", True)
+        mocker.patch(f"{PATCH_ROOT}.ACCESS_TOKEN_LOCK_TIMEOUT", -1)
+
+        org_config = refresh_access_token(
+            config={}, org_name="dev", scratch_org=scratch_org
+        )
+
+        assert org_config.config == {"access_token": "token"}
+        # The lock still belongs to the other caller:
+        assert cache.get(f"{key}_lock")
+        cache.delete(f"{key}_lock")
+
+    def test_lock_wait(self, mocker, OrgConfig, scratch_org_factory):
+        scratch_org = scratch_org_factory()
+        key = access_token_cache_key(scratch_org)
+        forget_access_token(scratch_org)
+        cache.set(f"{key}_lock", True)
+        sleep = mocker.patch(f"{PATCH_ROOT}.time.sleep")
+
+        org_config = refresh_access_token(
+            config={}, org_name="dev", scratch_org=scratch_org, lock_wait=0
+        )
+
+        assert org_config.config == {"access_token": "token"}
+        assert not sleep.called
+        cache.delete(f"{key}_lock")
+
+
 class TestGetDevhubApi:
+    @pytest.fixture(autouse=True)
+    def no_sessions(self):
+        forget_devhub_session("devhub_username")
+        yield
+        forget_devhub_session("devhub_username")
+
     def test_good(self):
         with ExitStack() as stack:
-            stack.enter_context(patch(f"{PATCH_ROOT}.jwt_session"))
+            jwt_session = stack.enter_context(patch(f"{PATCH_ROOT}.jwt_session"))
+            jwt_session.return_value = {
+                "instance_url": "https://example.com",
+                "access_token": "token",
+            }
             SimpleSalesforce = stack.enter_context(
                 patch(f"{PATCH_ROOT}.SimpleSalesforce")
             )
@@ -109,6 +217,59 @@ class TestGetDevhubApi:
             get_devhub_api(devhub_username="devhub_username")
 
             assert SimpleSalesforce.called
+            assert SimpleSalesforce.call_args.kwargs["session_id"] == "token"
+
+    def test_reuses_session(self, mocker):
+        jwt_session = mocker.patch(f"{PATCH_ROOT}.jwt_session")
+        jwt_session.return_value = {
+            "instance_url": "https://example.com",
+            "access_token": "token",
+        }
+        mocker.patch(f"{PATCH_ROOT}.SimpleSalesforce")
+
+        get_devhub_api(devhub_username="devhub_username")
+        get_devhub_api(devhub_username="devhub_username")
+        assert jwt_session.call_count == 1
+
+        # Another process finds the session in the cache:
+        _devhub_sessions.clear()
+        session = get_devhub_session("devhub_username")
+        assert session["access_token"] == "token"
+        assert jwt_session.call_count == 1
+
+    def test_expired_session(self, mocker):
+        jwt_session = mocker.patch(f"{PATCH_ROOT}.jwt_session")
+        jwt_session.return_value = {
+            "instance_url": "https://example.com",
+            "access_token": "token",
+        }
+        mocker.patch(f"{PATCH_ROOT}.DEVHUB_SESSION_TIMEOUT", -1)
+
+        get_devhub_session("devhub_username")
+        get_devhub_session("devhub_username")
+
+        assert jwt_session.call_count == 2
+
+    def test_renews_rejected_session(self, mocker):
+        jwt_session = mocker.patch(f"{PATCH_ROOT}.jwt_session")
+        jwt_session.side_effect = [
+            {"instance_url": "https://example.com", "access_token": "revoked"},
+            {"instance_url": "https://example.com", "access_token": "renewed"},
+        ]
+        request = mocker.patch(f"{PATCH_ROOT}.Session.request")
+        request.side_effect = [
+            MagicMock(status_code=401),
+            MagicMock(status_code=200, headers={}, **{"json.return_value": {}}),
+        ]
+
+        api = get_devhub_api(devhub_username="devhub_username")
+        api.restful("sobjects/ScratchOrgInfo")
+
+        assert request.call_count == 2
+        headers = request.call_args.kwargs["headers"]
+        assert headers["Authorization"] == "Bearer renewed"
+        assert api.session_id == "renewed"
+        assert get_devhub_session("devhub_username")["access_token"] == "renewed"
 
     def test_bad(self):
         with ExitStack() as stack:
@@ -249,13 +410,24 @@ class TestRunFlow:
                 patch(f"{PATCH_ROOT}.get_org_details")
             )
             get_org_details.return_value = (MagicMock(), MagicMock())
-            stack.enter_context(patch(f"{PATCH_ROOT}.get_org_result"))
+            get_org_result = stack.enter_context(patch(f"{PATCH_ROOT}.get_org_result"))
+            get_org_result.return_value = {"Id": "2SR000000000001"}
             stack.enter_context(patch(f"{PATCH_ROOT}.mutate_scratch_org"))
-            stack.enter_context(patch(f"{PATCH_ROOT}.poll_for_scratch_org_completion"))
             stack.enter_context(patch(f"{PATCH_ROOT}.get_access_token"))
             stack.enter_context(patch(f"{PATCH_ROOT}.deploy_org_settings"))
 
-            create_org(
+            scratch_org_info_id = start_org_creation(
+                repo_owner=MagicMock(),
+                repo_name=MagicMock(),
+                repo_url=MagicMock(),
+                repo_branch=MagicMock(),
+                user=MagicMock(),
+                project_path=MagicMock(),
+                scratch_org=MagicMock(),
+                org_name="dev",
+            )
+            assert scratch_org_info_id == "2SR000000000001"
+            finish_org_creation(
                 repo_owner=MagicMock(),
                 repo_name=MagicMock(),
                 repo_url=MagicMock(),
@@ -264,6 +436,7 @@ class TestRunFlow:
                 project_path=MagicMock(),
                 scratch_org=MagicMock(),
                 org_name="dev",
+                org_result={"Id": "2SR000000000001", "Status": "Active"},
                 originating_user_id=None,
             )
             with pytest.raises(SubcommandException):
@@ -275,6 +448,49 @@ class TestRunFlow:
                     user=user,
                 )
 
+    def test_run_flow__streams_output(self, user_factory):
+        user = user_factory()
+        with ExitStack() as stack:
+            stack.enter_context(patch(f"{PATCH_ROOT}.os"))
+            subprocess = stack.enter_context(patch(f"{PATCH_ROOT}.subprocess"))
+            subprocess.Popen.return_value.stdout = MagicMock(
+                **{"__iter__.return_value": iter(["Running task: deploy\n", "ok\n"])}
+            )
+            subprocess.Popen.return_value.returncode = 0
+            on_output = MagicMock()
+
+            run_flow(
+                cci=MagicMock(),
+                org_config=MagicMock(),
+                flow_name="dev_org",
+                project_path="",
+                user=user,
+                on_output=on_output,
+            )
+
+            assert [call.args[0] for call in on_output.call_args_list] == [
+                "Running task: deploy\n",
+                "ok\n",
+            ]
+            assert subprocess.Popen.call_args.kwargs["env"]["PYTHONUNBUFFERED"] == "1"
+
+
+@pytest.mark.parametrize(
+    "line, event",
+    (
+        ("2023-01-01 10:00:00: Running task: deploy", ("started", "deploy")),
+        ("Skipping task: deploy_post", ("skipped", "deploy_post")),
+        (
+            "Skipping task update_admin (skipped unless org_config.scratch)",
+            ("skipped", "update_admin"),
+        ),
+        ("Completed flow 'dev_org' on org dev successfully!", ("completed", None)),
+        ("Deploying metadata", None),
+    ),
+)
+def test_parse_flow_event(line, event):
+    assert parse_flow_event(line) == event
+
 
 @pytest.mark.django_db
 def test_delete_org(scratch_org_factory):
@@ -294,33 +510,36 @@ def test_delete_org(scratch_org_factory):
         assert devhub_api.ActiveScratchOrg.delete.called
 
 
-@patch("metecho.api.sf_run_flow.time.sleep")
-def test_poll_for_scratch_org_completion__success(sleep):
-    scratch_org_info_id = "2SR4p000000DTAaGAO"
-    devhub_api = MagicMock()
-    initial_result = {
-        "Id": scratch_org_info_id,
-        "Status": "Creating",
-        "ErrorCode": None,
-    }
-    end_result = {"Id": scratch_org_info_id, "Status": "Active", "ErrorCode": None}
-    devhub_api.ScratchOrgInfo.get.side_effect = [initial_result, end_result]
-
-    org_result = poll_for_scratch_org_completion(devhub_api, initial_result)
-    assert org_result == end_result
-
+class TestCheckOrgCreation:
+    @pytest.mark.parametrize(
+        "status, expected",
+        (("New", None), ("Creating", None), ("Active", "result")),
+    )
+    def test_status(self, mocker, status, expected):
+        result = {"Id": "2SR4p000000DTAaGAO", "Status": status, "ErrorCode": None}
+        get_devhub_api = mocker.patch(f"{PATCH_ROOT}.get_devhub_api")
+        get_devhub_api.return_value.ScratchOrgInfo.get.return_value = result
+
+        org_result = check_org_creation(
+            scratch_org=MagicMock(scratch_org_info_id="2SR4p000000DTAaGAO"),
+            devhub_username="devhub_username",
+        )
 
-@patch("metecho.api.sf_run_flow.time.sleep")
-def test_poll_for_scratch_org_completion__failure(sleep):
-    scratch_org_info_id = "2SR4p000000DTAaGAO"
-    devhub_api = MagicMock()
-    initial_result = {
-        "Id": scratch_org_info_id,
-        "Status": "Creating",
-        "ErrorCode": None,
-    }
-    end_result = {"Id": scratch_org_info_id, "Status": "Failed", "ErrorCode": "Foo"}
-    devhub_api.ScratchOrgInfo.get.side_effect = [initial_result, end_result]
+        assert org_result == (result if expected else None)
+        get_devhub_api.return_value.ScratchOrgInfo.get.assert_called_with(
+            "2SR4p000000DTAaGAO"
+        )
 
-    with pytest.raises(ScratchOrgError, match="Scratch org creation failed"):
-        poll_for_scratch_org_completion(devhub_api, initial_result)
+    def test_failure(self, mocker):
+        get_devhub_api = mocker.patch(f"{PATCH_ROOT}.get_devhub_api")
+        get_devhub_api.return_value.ScratchOrgInfo.get.return_value = {
+            "Id": "2SR4p000000DTAaGAO",
+            "Status": "Failed",
+            "ErrorCode": "Foo",
+        }
+
+        with pytest.raises(ScratchOrgError, match="Scratch org creation failed: Foo"):
+            check_org_creation(
+                scratch_org=MagicMock(scratch_org_info_id="2SR4p000000DTAaGAO"),
+                devhub_username="devhub_username",
+            )
@@ -1,22 +1,26 @@
 import json
 from collections import namedtuple
 from contextlib import ExitStack
+from datetime import timedelta
 from pathlib import Path
 from unittest.mock import MagicMock, patch
 
 import pytest
 from django.contrib.sites.models import Site
+from django.core.cache import cache
 from django.core.management import call_command
 from django.urls import reverse
+from django.utils import timezone
 from github3.exceptions import NotFoundError, ResponseError
 from github3.users import User as GitHubApiUser
 from rest_framework import status
 
-from metecho.api.models import Project, ScratchOrgType, SiteProfile
+from metecho.api.jobs import process_webhook_inbox
+from metecho.api.models import Project, ScratchOrgType, SiteProfile, WebhookDelivery
 from metecho.api.reassignment import ReassignmentResponse
 from metecho.api.serializers import EpicSerializer, TaskSerializer
 
-Branch = namedtuple("Branch", ["name"])
+Branch = namedtuple("Branch", ["name", "commit"])
 
 fixture = pytest.lazy_fixture
 
@@ -401,23 +405,47 @@ class TestProjectViewset:
         assert populate_github_issues_job.delay.called
         assert project.currently_fetching_issues
 
-    def test_feature_branches(self, client, git_hub_collaboration_factory, project):
+    def test_feature_branches(
+        self, client, git_hub_collaboration_factory, project, epic_factory
+    ):
         git_hub_collaboration_factory(user__id=client.user.github_id, project=project)
+        epic_factory(project=project, branch_name="epic")
+        # Epics of other projects don't hide branches:
+        epic_factory(branch_name="other-epic")
         with patch("metecho.api.views.gh.get_repo_info") as get_repo_info:
+            names = (
+                project.branch_name,
+                "include_me",
+                "omit__me",
+                "epic",
+                "other-epic",
+            )
             repo = MagicMock(
                 **{
                     "branches.return_value": [
-                        Branch(name="include_me"),
-                        Branch(name="omit__me"),
+                        Branch(name=name, commit=MagicMock(sha="abc123"))
+                        for name in names
                     ]
                 }
             )
             get_repo_info.return_value = repo
+            url = reverse("project-feature-branches", kwargs={"pk": str(project.id)})
 
-            response = client.get(
-                reverse("project-feature-branches", kwargs={"pk": str(project.id)})
-            )
-            assert response.json() == ["include_me"], response.json()
+            response = client.get(url)
+            assert response.json() == ["include_me", "other-epic"], response.json()
+
+            # Seeded once, then kept current by webhooks:
+            project.branches.create(name="new")
+            response = client.get(url)
+            assert response.json() == ["include_me", "new", "other-epic"]
+            assert repo.branches.call_count == 1
+
+            # ...until the index is old enough to be rebuilt:
+            project.branches_synced_at = timezone.now() - timedelta(days=2)
+            project.save(update_fields=["branches_synced_at"])
+            response = client.get(url)
+            assert response.json() == ["include_me", "other-epic"]
+            assert repo.branches.call_count == 2
 
     def test_get_queryset(self, client, project_factory, git_hub_collaboration_factory):
         project = project_factory(repo_name="repo")
@@ -596,6 +624,14 @@ class TestProjectViewset:
 
 @pytest.mark.django_db
 class TestHookView:
+    @pytest.fixture(autouse=True)
+    def process_webhook_inbox_job(self, mocker):
+        """Process the inbox as soon as a delivery is queued"""
+        cache.delete(WebhookDelivery.QUEUED_CACHE_KEY)
+        job = mocker.patch("metecho.api.jobs.process_webhook_inbox_job", autospec=True)
+        job.delay.side_effect = process_webhook_inbox
+        return job
+
     @pytest.mark.parametrize(
         "_task_factory, task_data",
         (
@@ -631,10 +667,11 @@ class TestHookView:
                         )
                         for _ in range(1)
                     ),
-                    "compare_commits.return_value": MagicMock(ahead_by=0),
+                    "compare_commits.return_value": MagicMock(ahead_by=0, behind_by=0),
                 }
             )
             gh.normalize_commit.return_value = "1234abcd"
+            gh.compare_branches.return_value = {}
 
             task = _task_factory(**task_data, branch_name="test-task")
 
@@ -823,6 +860,35 @@ class TestHookView:
             assert response.status_code == 202, response.content
             assert refresh_commits_job.delay.called
 
+    def test_202__duplicate_delivery(self, settings, client, project_factory):
+        settings.GITHUB_HOOK_SECRET = b""
+        project_factory(repo_id=123)
+        with patch(
+            "metecho.api.jobs.refresh_commits_job", autospec=True
+        ) as refresh_commits_job:
+            for _ in range(2):
+                response = client.post(
+                    reverse("hook"),
+                    json.dumps(
+                        {
+                            "ref": "refs/heads/main",
+                            "forced": True,
+                            "repository": {"id": 123},
+                            "commits": [],
+                            "sender": {},
+                        }
+                    ),
+                    content_type="application/json",
+                    # The sha1 hexdigest of the request body x the secret
+                    # key above:
+                    HTTP_X_HUB_SIGNATURE="sha1=7724a4777b8215f158efbe74f05ce6eaa5ec41a8",
+                    HTTP_X_GITHUB_EVENT="push",
+                    HTTP_X_GITHUB_DELIVERY="72d3162e-cc78-11e3-81ab-4c9367dc0958",
+                )
+                assert response.status_code == 202, response.content
+            assert refresh_commits_job.delay.call_count == 1
+            assert WebhookDelivery.objects.count() == 1
+
     def test_400__push_error(self, settings, client, project_factory):
         settings.GITHUB_HOOK_SECRET = b""
         project_factory(repo_id=123)
@@ -844,7 +910,7 @@ class TestHookView:
         )
         assert response.status_code == 400, response.json()
 
-    def test_404__push_no_matching_repo(self, settings, client, project_factory):
+    def test_202__push_no_matching_repo(self, settings, client, project_factory):
         settings.GITHUB_HOOK_SECRET = b""
         project_factory(repo_id=456)
         response = client.post(
@@ -864,7 +930,10 @@ class TestHookView:
             HTTP_X_HUB_SIGNATURE="sha1=5a3798b4d8aacbbc49e13f3fac3bb3187f46cf8b",
             HTTP_X_GITHUB_EVENT="push",
         )
-        assert response.status_code == 404
+        assert response.status_code == 202
+        delivery = WebhookDelivery.objects.get()
+        assert delivery.processed_at is not None
+        assert delivery.error == "No matching project."
 
     def test_403__push_bad_signature(self, settings, client, project_factory):
         settings.GITHUB_HOOK_SECRET = b""
@@ -1045,7 +1114,7 @@ class TestScratchOrgViewSet:
 
     def test_list_fetch_changes(self, client, scratch_org_factory):
         with ExitStack() as stack:
-            scratch_org_factory(
+            scratch_org = scratch_org_factory(
                 org_type=ScratchOrgType.DEV,
                 url="https://example.com",
                 is_created=True,
@@ -1054,15 +1123,27 @@ class TestScratchOrgViewSet:
                 currently_refreshing_changes=False,
                 owner=client.user,
             )
+            scratch_org_factory(
+                org_type=ScratchOrgType.DEV,
+                url="https://example.com",
+                is_created=True,
+                currently_refreshing_changes=True,
+                owner=client.user,
+            )
 
-            get_unsaved_changes_job = stack.enter_context(
-                patch("metecho.api.jobs.get_unsaved_changes_job", autospec=True)
+            get_unsaved_changes_for_orgs_job = stack.enter_context(
+                patch(
+                    "metecho.api.jobs.get_unsaved_changes_for_orgs_job", autospec=True
+                )
             )
             url = reverse("scratch-org-list")
             response = client.get(url)
 
             assert response.status_code == 200
-            assert get_unsaved_changes_job.delay.called
+            get_unsaved_changes_for_orgs_job.delay.assert_called_once_with(
+                [scratch_org.id], originating_user_id=str(client.user.id)
+            )
+            assert all(org["currently_refreshing_changes"] for org in response.json())
 
     def test_retrieve_fetch_changes(self, client, scratch_org_factory):
         with ExitStack() as stack:
@@ -1338,15 +1419,76 @@ class TestScratchOrgViewSet:
         assert not commit_omnistudio_from_org_job.delay.called
 
     def test_download_log(self, client, scratch_org_factory):
-        scratch_org = scratch_org_factory(owner=client.user, cci_log="Foo")
+        scratch_org = scratch_org_factory(owner=client.user)
+        scratch_org.append_log("Foo")
+        scratch_org.append_log("Bar\n")
         url = reverse("scratch-org-log", kwargs={"pk": str(scratch_org.id)})
         response = client.get(url)
 
         assert response.status_code == 200
-        assert response.content == b"Foo"
+        assert response.getvalue() == b"FooBar\n"
+        assert response["X-Log-Size"] == "7"
+
+    @pytest.mark.parametrize(
+        "range_, content, content_range",
+        (
+            ("bytes=2-4", b"oBa", "bytes 2-4/7"),
+            ("bytes=3-", b"Bar\n", "bytes 3-6/7"),
+            ("bytes=-2", b"r\n", "bytes 5-6/7"),
+            ("bytes=0-100", b"FooBar\n", "bytes 0-6/7"),
+        ),
+    )
+    def test_download_log__range(
+        self, client, scratch_org_factory, range_, content, content_range
+    ):
+        scratch_org = scratch_org_factory(owner=client.user)
+        scratch_org.append_log("Foo")
+        scratch_org.append_log("Bar\n")
+        url = reverse("scratch-org-log", kwargs={"pk": str(scratch_org.id)})
+        response = client.get(url, HTTP_RANGE=range_)
+
+        assert response.status_code == 206
+        assert response.getvalue() == content
+        assert response["Content-Range"] == content_range
+
+    def test_download_log__range_not_satisfiable(self, client, scratch_org_factory):
+        scratch_org = scratch_org_factory(owner=client.user)
+        scratch_org.append_log("Foo")
+        url = reverse("scratch-org-log", kwargs={"pk": str(scratch_org.id)})
+        response = client.get(url, HTTP_RANGE="bytes=3-")
+
+        assert response.status_code == 416
+        assert response["Content-Range"] == "bytes */3"
+
+    def test_download_log__offset(self, client, scratch_org_factory):
+        scratch_org = scratch_org_factory(owner=client.user)
+        scratch_org.append_log("Foo\nBar\n")
+        url = reverse("scratch-org-log", kwargs={"pk": str(scratch_org.id)})
+        response = client.get(url, {"offset": 4})
+
+        assert response.status_code == 200
+        assert response.getvalue() == b"Bar\n"
+
+    def test_download_log__tail(self, client, scratch_org_factory):
+        scratch_org = scratch_org_factory(owner=client.user)
+        scratch_org.append_log("Foo\nBa")
+        scratch_org.append_log("r\nBaz\n")
+        url = reverse("scratch-org-log", kwargs={"pk": str(scratch_org.id)})
+        response = client.get(url, {"tail": 2})
+
+        assert response.status_code == 200
+        assert response.getvalue() == b"Bar\nBaz\n"
+        assert response["X-Log-Size"] == "12"
+
+    def test_download_log__invalid(self, client, scratch_org_factory):
+        scratch_org = scratch_org_factory(owner=client.user)
+        url = reverse("scratch-org-log", kwargs={"pk": str(scratch_org.id)})
+        response = client.get(url, {"tail": -1})
+
+        assert response.status_code == 400
 
     def test_download_log__not_authorized(self, client, scratch_org_factory):
-        scratch_org = scratch_org_factory(cci_log="Foo")
+        scratch_org = scratch_org_factory()
         url = reverse("scratch-org-log", kwargs={"pk": str(scratch_org.id)})
         response = client.get(url)
 
@@ -1,7 +1,10 @@
+import re
+from typing import Optional, Tuple
+
 from django.contrib.auth import get_user_model
 from django.contrib.sites.shortcuts import get_current_site
 from django.db.models import Case, IntegerField, Q, When
-from django.http import HttpResponse, HttpResponseRedirect
+from django.http import HttpResponse, HttpResponseRedirect, StreamingHttpResponse
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from django_filters.rest_framework import DjangoFilterBackend
@@ -28,11 +31,7 @@ from .filters import (
     ScratchOrgFilter,
     TaskFilter,
 )
-from .hook_serializers import (
-    PrHookSerializer,
-    PrReviewHookSerializer,
-    PushHookSerializer,
-)
+from .hook_serializers import HOOK_SERIALIZERS
 from .models import (
     Epic,
     EpicStatus,
@@ -45,6 +44,7 @@ from .models import (
     ScratchOrgType,
     Task,
     TaskStatus,
+    WebhookDelivery,
 )
 from .paginators import CustomPaginator
 from .serializers import (
@@ -67,6 +67,7 @@ from .serializers import (
     ProjectDependencySerializer,
     ProjectSerializer,
     ReviewSerializer,
+    ScratchOrgLogSerializer,
     ScratchOrgSerializer,
     ShortGitHubUserSerializer,
     TaskAssigneeSerializer,
@@ -75,6 +76,32 @@ from .serializers import (
 
 User = get_user_model()
 
+BYTE_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def parse_byte_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a `Range` header for a single range of bytes into a (start, end) pair,
+    with `end` exclusive. Returns None for headers we don't honour, so that the
+    whole content gets served, and raises ValueError when the range is outside
+    of the content.
+    """
+    match = BYTE_RANGE_RE.match(header.strip())
+    if not match or match.groups() == ("", ""):
+        return None
+    first, last = match.groups()
+    if not first:
+        # A suffix range: the last `last` bytes
+        start, end = max(size - int(last), 0), size
+    else:
+        start = int(first)
+        if last and int(last) < start:
+            return None
+        end = min(int(last) + 1, size) if last else size
+    if start >= size:
+        raise ValueError(header)
+    return start, end
+
 
 class RepoPushPermission(BasePermission):
     """
@@ -122,18 +149,19 @@ class HookView(APIView):
     @extend_schema(exclude=True)
     def post(self, request):
         """Intendend to respond to several GitHubs webhooks. Not consumed by the frontend."""
-        serializers = {
-            "push": PushHookSerializer,
-            "pull_request": PrHookSerializer,
-            "pull_request_review": PrReviewHookSerializer,
-        }
-        serializer_class = serializers.get(request.META.get("HTTP_X_GITHUB_EVENT"))
+        event = request.META.get("HTTP_X_GITHUB_EVENT")
+        serializer_class = HOOK_SERIALIZERS.get(event)
         if serializer_class is None:
             return Response(status=status.HTTP_400_BAD_REQUEST)
         serializer = serializer_class(data=request.data)
         serializer.is_valid(raise_exception=True)
 
-        serializer.process_hook()
+        # Processing can take a while, so it happens outside of the request
+        WebhookDelivery.receive(
+            delivery_id=request.META.get("HTTP_X_GITHUB_DELIVERY"),
+            event=event,
+            payload=request.data,
+        )
         return Response(status=status.HTTP_202_ACCEPTED)
 
 
@@ -389,24 +417,21 @@ class ProjectViewSet(mixins.RetrieveModelMixin, mixins.ListModelMixin, GenericVi
     def feature_branches(self, request, pk=None):
         """Get a list of feature branch names for a Project."""
         instance = self.get_object()
-        repo = gh.get_repo_info(
-            None, repo_owner=instance.repo_owner, repo_name=instance.repo_name
-        )
-        existing_branches = set(
+        if instance.branches_are_stale:
+            instance.refresh_branches()
+        existing_branches = (
             Epic.objects.active()
+            .filter(project=instance)
             .exclude(branch_name="")
-            .values_list("branch_name", flat=True)
+            .values("branch_name")
         )
-        data = [
-            branch.name
-            for branch in repo.branches()
-            if (
-                "__" not in branch.name
-                and branch.name != repo.default_branch
-                and branch.name not in existing_branches
-            )
-        ]
-        return Response(data)
+        data = (
+            instance.branches.exclude(name__contains="__")
+            .exclude(name=instance.branch_name)
+            .exclude(name__in=existing_branches)
+            .values_list("name", flat=True)
+        )
+        return Response(list(data))
 
 
 class EpicViewSet(CreatePrMixin, ModelViewSet):
@@ -555,9 +580,13 @@ class ScratchOrgViewSet(
             not getattr(self, "swagger_fake_view", False)
             and "/log" in self.request.resolver_match.route
         ):
-            return ScratchOrg.objects.all()
+            return ScratchOrg.objects.all().light()
 
-        return ScratchOrg.objects.active()
+        queryset = ScratchOrg.objects.active()
+        if self.action in ("list", "retrieve"):
+            # Only load the big columns the response includes
+            queryset = queryset.light(*self.get_serializer_class().heavy_fields)
+        return queryset
 
     def perform_create(self, *args, **kwargs):
         if self.request.user.is_devhub_enabled:
@@ -587,14 +616,12 @@ class ScratchOrgViewSet(
         # rest_framework.mixins.RetrieveModelMixin, because I needed to
         # insert the get_unsaved_changes line in the middle.
         queryset = self.filter_queryset(
-            self.get_queryset().exclude(
-                ~Q(owner=request.user), org_type=ScratchOrgType.PLAYGROUND
-            )
+            self.get_queryset()
+            .exclude(~Q(owner=request.user), org_type=ScratchOrgType.PLAYGROUND)
+            .filter(pool__isnull=True)
         )
 
         force_get = request.query_params.get("get_unsaved_changes", False)
-        # XXX: I am apprehensive about the possibility of flooding the
-        # worker queues easily this way:
         filters = {
             "org_type__in": [ScratchOrgType.DEV, ScratchOrgType.PLAYGROUND],
             "delete_queued_at__isnull": True,
@@ -603,10 +630,13 @@ class ScratchOrgViewSet(
         }
         if not force_get:
             filters["owner"] = request.user
-        for instance in queryset.filter(**filters).exclude(url=""):
-            instance.queue_get_unsaved_changes(
-                force_get=force_get, originating_user_id=str(request.user.id)
-            )
+        # The orgs are flagged with a single UPDATE and a single list-level
+        # notification, rather than a save and a notification per org.
+        ScratchOrg.queue_get_unsaved_changes_for(
+            queryset.filter(**filters).exclude(url="").only("id"),
+            force_get=force_get,
+            originating_user_id=str(request.user.id),
+        )
 
         # XXX: If we ever paginate this endpoint, we will need to add
         # pagination logic back in here.
@@ -778,11 +808,19 @@ class ScratchOrgViewSet(
 
     @extend_schema(
         request=None,
-        responses={200: OpenApiResponse(OpenApiTypes.STR, description="Log content")},
+        parameters=[ScratchOrgLogSerializer],
+        responses={
+            200: OpenApiResponse(OpenApiTypes.STR, description="Log content"),
+            206: OpenApiResponse(OpenApiTypes.STR, description="Log content range"),
+        },
     )
     @action(detail=True, methods=["GET"])
     def log(self, request, pk=None):
-        """Return the CCI build log or traceback from a scratch org build."""
+        """
+        Return the CCI build log or traceback from a scratch org build. A single
+        `Range: bytes=...` header, an `offset` in bytes or a `tail` in lines
+        selects part of the log; `X-Log-Size` is the offset to follow it from.
+        """
         # Note that we override the viewset-level queryset as this action will usually
         # run on deleted scratch org instances.
         scratch_org = self.get_object()
@@ -791,10 +829,35 @@ class ScratchOrgViewSet(
                 {"error": _("Requesting user did not create Org.")},
                 status=status.HTTP_403_FORBIDDEN,
             )
+        serializer = ScratchOrgLogSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
 
-        return HttpResponse(
-            scratch_org.cci_log,
+        size = scratch_org.log_size
+        start, end = 0, size
+        try:
+            byte_range = parse_byte_range(request.headers.get("Range", ""), size)
+        except ValueError:
+            return HttpResponse(
+                status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+                headers={"Content-Range": f"bytes */{size}"},
+            )
+        if byte_range:
+            start, end = byte_range
+        elif "tail" in serializer.validated_data:
+            start = scratch_org.tail_log_offset(serializer.validated_data["tail"])
+        elif "offset" in serializer.validated_data:
+            start = min(serializer.validated_data["offset"], size)
+
+        response = StreamingHttpResponse(
+            scratch_org.read_log(start, end),
             content_type="text/plain",
             charset="utf-8",
-            status=status.HTTP_200_OK,
+            status=(
+                status.HTTP_206_PARTIAL_CONTENT if byte_range else status.HTTP_200_OK
+            ),
         )
+        response["Accept-Ranges"] = "bytes"
+        response["X-Log-Size"] = size
+        if byte_range:
+            response["Content-Range"] = f"bytes {start}-{end - 1}/{size}"
+        return response
@@ -16,6 +16,7 @@ from .api.models import (
     Project,
     ProjectDependency,
     ScratchOrg,
+    ScratchOrgPool,
     Task,
 )
 
@@ -179,6 +180,16 @@ class ScratchOrgFactory(factory.django.DjangoModelFactory):
     valid_target_directories = {"source": []}
 
 
+@register
+class ScratchOrgPoolFactory(factory.django.DjangoModelFactory):
+    class Meta:
+        model = ScratchOrgPool
+
+    project = factory.SubFactory(ProjectFactory)
+    org_config_name = "dev"
+    builder = factory.SubFactory(UserFactory)
+
+
 @register
 class ShortIssueFactory(factory.StubFactory):
     """
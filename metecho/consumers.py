@@ -57,10 +57,15 @@ class PushNotificationConsumer(AsyncJsonWebsocketConsumer):
         model_name = content.pop("model_name")
         id_ = content.pop("id")
         include_user = content.pop("include_user", False)
+        include_model = content.pop("include_model", True)
         # We usually don't want to include the user model, as that
         # would cause every generic-message to include the serialized user who's
         # getting the message. It'd just be noise on the wire.
-        if model_name.lower() != "user" or include_user:
+        if (
+            include_model
+            and id_ != LIST
+            and (model_name.lower() != "user" or include_user)
+        ):
             try:
                 instance = await self.get_instance(model=model_name, id=id_)
             except ObjectDoesNotExist:
@@ -72,18 +77,25 @@ class PushNotificationConsumer(AsyncJsonWebsocketConsumer):
         return content
 
     @database_sync_to_async
-    def get_instance(self, *, model, id, **kwargs):
+    def get_instance(self, *, model, id, light=False, **kwargs):
         # XXX: We currently hard-code API as it's our only
         # model-containing app:
         Model = apps.get_model("api", model)
-        return Model.objects.get(pk=id)
+        queryset = Model.objects.all()
+        if light and hasattr(queryset, "light"):
+            # Leave out the big columns, e.g. for permission checks
+            queryset = queryset.light()
+        return queryset.get(pk=id)
 
     async def receive_json(self, content, **kwargs):
         # Just used to sub/unsub to notification channels.
         is_valid, content = self.is_valid(content)
-        is_known_model = self.is_known_model(content.get("model", None))
-        has_good_permissions = await self.has_good_permissions(content)
-        all_good = is_valid and is_known_model and has_good_permissions
+        # Only look up objects for well-formed subscriptions to known models:
+        all_good = (
+            is_valid
+            and self.is_known_model(content.get("model", None))
+            and await self.has_good_permissions(content)
+        )
         if not all_good:
             await self.send_json({"error": _("Invalid subscription.")})
             return
@@ -141,7 +153,9 @@ class PushNotificationConsumer(AsyncJsonWebsocketConsumer):
         if content["id"] == LIST:
             return True
         try:
-            obj = await self.get_instance(**content)
+            obj = await self.get_instance(
+                model=content["model"], id=content["id"], light=True
+            )
             return obj.subscribable_by(self.scope["user"])
         except possible_exceptions:
             return False
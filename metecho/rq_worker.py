@@ -1,9 +1,14 @@
 from django.db import DatabaseError, InterfaceError, connections
 from rq.worker import HerokuWorker, Worker
 
+from .api.gh import job_cache
+
 
 class ConnectionClosingWorkerMixin(object):
-    """Mixin for rq workers to ensure db connections are closed."""
+    """
+    Mixin for rq workers to ensure db connections are closed, and to memoize
+    GitHub lookups for the duration of each job.
+    """
 
     def close_database(self):
         for connection in connections.all():
@@ -19,7 +24,8 @@ class ConnectionClosingWorkerMixin(object):
     def perform_job(self, *args, **kwargs):
         self.close_database()
         try:
-            return super().perform_job(*args, **kwargs)
+            with job_cache():
+                return super().perform_job(*args, **kwargs)
         finally:
             self.close_database()
 
@@ -1,3 +1,5 @@
+from unittest.mock import MagicMock
+
 import pytest
 from channels.db import database_sync_to_async
 from channels.testing import WebsocketCommunicator
@@ -266,6 +268,16 @@ async def test_push_notification_consumer__invalid_subscription(user_factory):
     response = await communicator.receive_json_from()
     assert "error" in response
 
+    # Unexpected or missing keys don't break the consumer:
+    await communicator.send_json_to(
+        {"model": "user", "id": str(user.id), "action": "SUBSCRIBE", "light": False}
+    )
+    response = await communicator.receive_json_from()
+    assert "error" in response
+    await communicator.send_json_to({"model": "user"})
+    response = await communicator.receive_json_from()
+    assert "error" in response
+
     await communicator.disconnect()
 
 
@@ -280,3 +292,43 @@ async def test_push_notification_consumer__missing_instance():
     consumer = PushNotificationConsumer()
     new_content = await consumer.hydrate_message(content)
     assert new_content == {"payload": {}}
+
+
+async def test_push_notification_consumer__list_message():
+    content = {
+        "model_name": "scratchorg",
+        "id": "list",
+        "payload": {"ids": ["abc"]},
+    }
+    consumer = PushNotificationConsumer()
+    consumer.get_instance = MagicMock()
+    new_content = await consumer.hydrate_message(content)
+    assert new_content == {"payload": {"ids": ["abc"]}}
+    assert not consumer.get_instance.called
+
+
+async def test_push_notification_consumer__without_model():
+    content = {
+        "model_name": "scratchorg",
+        "id": "abc",
+        "include_model": False,
+        "payload": {"id": "abc", "current_step": "deploy"},
+    }
+    consumer = PushNotificationConsumer()
+    consumer.get_instance = MagicMock()
+    new_content = await consumer.hydrate_message(content)
+    assert new_content == {"payload": {"id": "abc", "current_step": "deploy"}}
+    assert not consumer.get_instance.called
+
+
+@pytest.mark.django_db
+async def test_push_notification_consumer__light_instance(scratch_org_factory):
+    scratch_org = await database_sync_to_async(scratch_org_factory)()
+    consumer = PushNotificationConsumer()
+
+    instance = await consumer.get_instance(
+        model="scratchorg", id=str(scratch_org.id), light=True
+    )
+    assert instance.get_deferred_fields() == set(scratch_org.heavy_fields)
+    instance = await consumer.get_instance(model="scratchorg", id=str(scratch_org.id))
+    assert not instance.get_deferred_fields()
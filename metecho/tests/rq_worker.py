@@ -4,6 +4,8 @@ import pytest
 from django.db import DatabaseError, InterfaceError
 from django_rq import get_worker
 
+from metecho.api import gh
+
 
 class TestConnectionClosingWorker:
     def test_close_database__good(self, mocker):
@@ -60,6 +62,17 @@ class TestConnectionClosingWorker:
 
         assert close_database.called
 
+    def test_perform_job__job_cache(self, mocker):
+        mocker.patch("metecho.rq_worker.ConnectionClosingWorker.close_database")
+
+        def perform_job(*args, **kwargs):
+            assert gh._job_cache.get() == {}
+
+        mocker.patch("rq.worker.Worker.perform_job", side_effect=perform_job)
+
+        worker = get_worker()
+        worker.perform_job(None, None)
+
     def test_work(self, mocker):
         close_database = mocker.patch(
             "metecho.rq_worker.ConnectionClosingWorker.close_database"
@@ -39,6 +39,20 @@ const Footer = ({
   );
 
   if (isCreating || isRefreshingOrg) {
+    if (org?.current_step) {
+      return asStatus(
+        <>
+          {t('Running Step: {{step}}', { step: org.current_step })}
+          <div className="slds-p-top_small">
+            {t('Finished Steps: {{finished}}, Skipped Steps: {{skipped}}', {
+              finished: org.finished_steps?.length ?? 0,
+              skipped: org.skipped_steps?.length ?? 0,
+            })}
+          </div>
+          <div className="slds-p-top_small">{loadingMsg}</div>
+        </>,
+      );
+    }
     return asStatus(loadingMsg);
   }
   if (isDeleting) {
@@ -3,7 +3,7 @@ import { t } from 'i18next';
 import { AppState, ThunkResult } from '@/js/store';
 import { selectEpicById } from '@/js/store/epics/selectors';
 import { isCurrentUser } from '@/js/store/helpers';
-import { MinimalOrg, Org } from '@/js/store/orgs/reducer';
+import { FlowProgress, MinimalOrg, Org } from '@/js/store/orgs/reducer';
 import { selectProjectById } from '@/js/store/projects/selectors';
 import { selectTaskById } from '@/js/store/tasks/selectors';
 import { addToast } from '@/js/store/toasts/actions';
@@ -31,6 +31,14 @@ interface OrgUpdated {
   type: 'SCRATCH_ORG_UPDATE';
   payload: Org;
 }
+interface OrgFlowProgress {
+  type: 'SCRATCH_ORG_FLOW_PROGRESS';
+  payload: FlowProgress & { id: string };
+}
+interface OrgsFetchingChanges {
+  type: 'SCRATCH_ORGS_FETCH_CHANGES';
+  payload: string[];
+}
 interface OrgDeleted {
   type: 'SCRATCH_ORG_DELETE';
   payload: Org | MinimalOrg;
@@ -77,6 +85,8 @@ export type OrgsAction =
   | OrgProvisionFailed
   | RefetchOrg
   | OrgUpdated
+  | OrgFlowProgress
+  | OrgsFetchingChanges
   | OrgDeleted
   | OrgDeleteFailed
   | CommitEvent
@@ -253,6 +263,18 @@ export const updateOrg = (payload: Org): OrgUpdated => ({
   payload,
 });
 
+export const orgFlowProgress = (
+  payload: FlowProgress & { id: string },
+): OrgFlowProgress => ({
+  type: 'SCRATCH_ORG_FLOW_PROGRESS',
+  payload,
+});
+
+export const orgsFetchingChanges = (ids: string[]): OrgsFetchingChanges => ({
+  type: 'SCRATCH_ORGS_FETCH_CHANGES',
+  payload: ids,
+});
+
 export const fetchFailed =
   ({
     model,
@@ -53,6 +53,12 @@ export interface DatasetPairsObject extends Omit<DatasetObject, 'fields'> {
 
 export type DatasetPairs = [string, DatasetPairsObject][];
 
+export interface FlowProgress {
+  current_step: string | null;
+  finished_steps: string[];
+  skipped_steps: string[];
+}
+
 export interface MinimalOrg {
   id: string;
   task: string | null;
@@ -98,6 +104,10 @@ export interface Org extends MinimalOrg {
   dataset_schema?: DatasetSchema;
   datasets?: Datasets;
   dataset_errors?: string[];
+  // Only sent along with `SCRATCH_ORG_FLOW_PROGRESS` events
+  current_step?: string | null;
+  finished_steps?: string[];
+  skipped_steps?: string[];
 }
 
 export interface OrgsByParent {
@@ -235,6 +245,39 @@ const reducer = (
         orgs: { ...orgs.orgs, [org.id]: { ...existingOrg, ...org } },
       };
     }
+    case 'SCRATCH_ORG_FLOW_PROGRESS': {
+      const { id, current_step, finished_steps, skipped_steps } =
+        action.payload;
+      const existingOrg = orgs.orgs[id];
+      if (existingOrg) {
+        return {
+          ...orgs,
+          orgs: {
+            ...orgs.orgs,
+            [id]: {
+              ...existingOrg,
+              current_step,
+              finished_steps,
+              skipped_steps,
+            },
+          },
+        };
+      }
+      return orgs;
+    }
+    case 'SCRATCH_ORGS_FETCH_CHANGES': {
+      const changed: { [key: string]: Org } = {};
+      for (const id of action.payload) {
+        const existingOrg = orgs.orgs[id];
+        if (existingOrg) {
+          changed[id] = { ...existingOrg, currently_refreshing_changes: true };
+        }
+      }
+      return {
+        ...orgs,
+        orgs: { ...orgs.orgs, ...changed },
+      };
+    }
     case 'SCRATCH_ORG_PROVISION_FAILED':
     case 'SCRATCH_ORG_DELETE': {
       const org = action.payload;
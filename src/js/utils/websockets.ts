@@ -18,10 +18,12 @@ import {
   deleteOrg,
   fetchFailed,
   orgConvertFailed,
+  orgFlowProgress,
   orgProvisioning,
   orgReassigned,
   orgReassignFailed,
   orgRefreshed,
+  orgsFetchingChanges,
   provisionFailed,
   provisionOrg,
   recreateOrg,
@@ -31,6 +33,7 @@ import {
 import {
   Datasets,
   DatasetSchema,
+  FlowProgress,
   MinimalOrg,
   Org,
 } from '@/js/store/orgs/reducer';
@@ -220,6 +223,20 @@ interface OrgUpdatedEvent {
     originating_user_id: string | null;
   };
 }
+interface OrgFlowProgressEvent {
+  type: 'SCRATCH_ORG_FLOW_PROGRESS';
+  payload: FlowProgress & {
+    id: string;
+    originating_user_id: string | null;
+  };
+}
+interface OrgsFetchingChangesEvent {
+  type: 'SCRATCH_ORGS_FETCH_CHANGES';
+  payload: {
+    ids: string[];
+    originating_user_id: string | null;
+  };
+}
 interface OrgFetchFailedEvent {
   type: 'SCRATCH_ORG_FETCH_CHANGES_FAILED';
   payload: {
@@ -372,7 +389,9 @@ type EventType =
   | ReposRefreshedEvent
   | ReposRefreshErrorEvent
   | OrgsRefreshedEvent
-  | OrgsRefreshErrorEvent;
+  | OrgsRefreshErrorEvent
+  | OrgFlowProgressEvent
+  | OrgsFetchingChangesEvent;
 
 const isSubscriptionEvent = (event: EventType): event is SubscriptionEvent =>
   (event as ModelEvent).type === undefined;
@@ -452,6 +471,10 @@ export const getAction = (event: EventType) => {
       return hasModel(event) && provisionFailed(event.payload);
     case 'SCRATCH_ORG_UPDATE':
       return hasModel(event) && updateOrg(event.payload.model);
+    case 'SCRATCH_ORG_FLOW_PROGRESS':
+      return orgFlowProgress(event.payload);
+    case 'SCRATCH_ORGS_FETCH_CHANGES':
+      return orgsFetchingChanges(event.payload.ids);
     case 'SCRATCH_ORG_FETCH_CHANGES_FAILED':
       return hasModel(event) && fetchFailed(event.payload);
     case 'SCRATCH_ORG_DELETE':
@@ -118,6 +118,22 @@ describe('<PlaygroundOrgCard/>', () => {
       expect(getByText('This is an org.')).toBeVisible();
     });
 
+    describe('creating', () => {
+      test('renders flow progress', () => {
+        const org = {
+          ...defaultOrg,
+          is_created: false,
+          current_step: 'load_data',
+          finished_steps: ['deploy'],
+          skipped_steps: [],
+        };
+        const { getByText } = setup({ org });
+
+        expect(getByText('Running Step: load_data')).toBeVisible();
+        expect(getByText('Finished Steps: 1, Skipped Steps: 0')).toBeVisible();
+      });
+    });
+
     describe('out of date', () => {
       test('renders "Behind Latest"', () => {
         const org = {
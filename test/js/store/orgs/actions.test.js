@@ -356,6 +356,31 @@ describe('updateOrg', () => {
   });
 });
 
+describe('orgFlowProgress', () => {
+  test('returns SCRATCH_ORG_FLOW_PROGRESS action', () => {
+    const payload = {
+      id: 'org-id',
+      current_step: 'deploy',
+      finished_steps: [],
+      skipped_steps: [],
+    };
+    const expected = { type: 'SCRATCH_ORG_FLOW_PROGRESS', payload };
+
+    expect(actions.orgFlowProgress(payload)).toEqual(expected);
+  });
+});
+
+describe('orgsFetchingChanges', () => {
+  test('returns SCRATCH_ORGS_FETCH_CHANGES action', () => {
+    const expected = {
+      type: 'SCRATCH_ORGS_FETCH_CHANGES',
+      payload: ['org-id'],
+    };
+
+    expect(actions.orgsFetchingChanges(['org-id'])).toEqual(expected);
+  });
+});
+
 describe('fetchFailed', () => {
   test('adds error message', () => {
     const store = storeWithThunk(defaultState);
@@ -517,6 +517,82 @@ describe('reducer', () => {
     });
   });
 
+  describe('SCRATCH_ORG_FLOW_PROGRESS', () => {
+    test('stores the flow progress on the org', () => {
+      const org = {
+        id: 'org-id',
+        task: 'task-1',
+        org_type: 'Dev',
+      };
+      const initial = {
+        ...defaultState,
+        orgs: {
+          [org.id]: org,
+        },
+      };
+      const progress = {
+        current_step: 'load_data',
+        finished_steps: ['deploy'],
+        skipped_steps: ['update_admin_profile'],
+      };
+      const expected = {
+        ...defaultState,
+        orgs: {
+          [org.id]: { ...org, ...progress },
+        },
+      };
+      const actual = reducer(initial, {
+        type: 'SCRATCH_ORG_FLOW_PROGRESS',
+        payload: { id: org.id, ...progress },
+      });
+
+      expect(actual).toEqual(expected);
+    });
+
+    test('ignores unknown orgs', () => {
+      const actual = reducer(defaultState, {
+        type: 'SCRATCH_ORG_FLOW_PROGRESS',
+        payload: {
+          id: 'org-id',
+          current_step: null,
+          finished_steps: [],
+          skipped_steps: [],
+        },
+      });
+
+      expect(actual).toBe(defaultState);
+    });
+  });
+
+  describe('SCRATCH_ORGS_FETCH_CHANGES', () => {
+    test('sets currently_refreshing_changes: true on known orgs', () => {
+      const org = {
+        id: 'org-id',
+        task: 'task-1',
+        org_type: 'Dev',
+        currently_refreshing_changes: false,
+      };
+      const initial = {
+        ...defaultState,
+        orgs: {
+          [org.id]: org,
+        },
+      };
+      const expected = {
+        ...defaultState,
+        orgs: {
+          [org.id]: { ...org, currently_refreshing_changes: true },
+        },
+      };
+      const actual = reducer(initial, {
+        type: 'SCRATCH_ORGS_FETCH_CHANGES',
+        payload: [org.id, 'unknown-org-id'],
+      });
+
+      expect(actual).toEqual(expected);
+    });
+  });
+
   describe('REFETCH_ORG_STARTED', () => {
     test('sets currently_refreshing_changes: true', () => {
       const org = {
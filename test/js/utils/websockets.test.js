@@ -15,10 +15,12 @@ import {
   deleteOrg,
   fetchFailed,
   orgConvertFailed,
+  orgFlowProgress,
   orgProvisioning,
   orgReassigned,
   orgReassignFailed,
   orgRefreshed,
+  orgsFetchingChanges,
   provisionFailed,
   provisionOrg,
   recreateOrg,
@@ -177,6 +179,34 @@ describe('getAction', () => {
     });
   });
 
+  describe('SCRATCH_ORG_FLOW_PROGRESS', () => {
+    test('calls orgFlowProgress', () => {
+      const payload = {
+        id: 'org-id',
+        current_step: 'deploy',
+        finished_steps: [],
+        skipped_steps: [],
+        originating_user_id: null,
+      };
+      const event = { type: 'SCRATCH_ORG_FLOW_PROGRESS', payload };
+      sockets.getAction(event);
+
+      expect(orgFlowProgress).toHaveBeenCalledWith(payload);
+    });
+  });
+
+  describe('SCRATCH_ORGS_FETCH_CHANGES', () => {
+    test('calls orgsFetchingChanges', () => {
+      const event = {
+        type: 'SCRATCH_ORGS_FETCH_CHANGES',
+        payload: { ids: ['org-1', 'org-2'], originating_user_id: null },
+      };
+      sockets.getAction(event);
+
+      expect(orgsFetchingChanges).toHaveBeenCalledWith(['org-1', 'org-2']);
+    });
+  });
+
   describe('USER_ORGS_REFRESH', () => {
     test('calls refreshUser', () => {
       const event = { type: 'USER_ORGS_REFRESH' };